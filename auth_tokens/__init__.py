@@ -0,0 +1,45 @@
+"""
+Общая проверка JWT токенов микросервиса "Аутентификация".
+
+Токены подписываются общим секретом (SECRET_KEY) и содержат ID пользователя,
+поэтому любой микросервис проверяет их локально - без обращения к сервису
+аутентификации и к базе данных. Отозванные токены (выход из системы)
+отклоняются по списку в памяти, который каждый сервис периодически
+подгружает из базы данных (см. revocation).
+"""
+
+from .verification import (
+    SECRET_KEY,
+    ALGORITHM,
+    decode_token,
+    TokenVerifier,
+    token_verifier,
+)
+from .revocation import (
+    RevocationList,
+    revocation_list,
+    revoke_token,
+    sync_revocations_periodically,
+)
+from .dependencies import (
+    get_token_claims,
+    get_optional_token_claims,
+    get_current_user_id,
+    get_optional_user_id,
+)
+
+__all__ = [
+    "SECRET_KEY",
+    "ALGORITHM",
+    "decode_token",
+    "TokenVerifier",
+    "token_verifier",
+    "RevocationList",
+    "revocation_list",
+    "revoke_token",
+    "sync_revocations_periodically",
+    "get_token_claims",
+    "get_optional_token_claims",
+    "get_current_user_id",
+    "get_optional_user_id",
+]
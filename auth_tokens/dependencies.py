@@ -0,0 +1,69 @@
+"""
+FastAPI dependencies для проверки токена запроса.
+"""
+
+import os
+from typing import Optional
+
+from fastapi import Depends, HTTPException, status
+from fastapi.security import OAuth2PasswordBearer
+
+from .verification import token_verifier
+
+AUTH_TOKEN_URL = os.getenv("AUTH_TOKEN_URL", "http://localhost:8001/token")
+
+# auto_error=False: отсутствие токена обрабатывается в зависимостях
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl=AUTH_TOKEN_URL, auto_error=False)
+
+
+def _unauthorized(detail: str) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail=detail,
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+
+def get_optional_token_claims(token: Optional[str] = Depends(oauth2_scheme)) -> Optional[dict]:
+    """
+    Dependency: данные токена или None для запроса без токена.
+
+    Raises:
+        HTTPException: Если токен передан, но недействителен (401)
+    """
+    if token is None:
+        return None
+    claims = token_verifier.verify(token)
+    if claims is None:
+        raise _unauthorized("Недействительный токен")
+    return claims
+
+
+def get_token_claims(claims: Optional[dict] = Depends(get_optional_token_claims)) -> dict:
+    """
+    Dependency: данные токена, токен обязателен.
+
+    Raises:
+        HTTPException: Если токена нет или он недействителен (401)
+    """
+    if claims is None:
+        raise _unauthorized("Требуется авторизация")
+    return claims
+
+
+def get_optional_user_id(claims: Optional[dict] = Depends(get_optional_token_claims)) -> Optional[int]:
+    """Dependency: ID пользователя из токена или None для запроса без токена"""
+    if claims is None:
+        return None
+    user_id = claims.get("user_id")
+    if user_id is None:
+        # Токен выпущен до добавления ID пользователя - нужен повторный вход
+        raise _unauthorized("Недействительный токен")
+    return int(user_id)
+
+
+def get_current_user_id(user_id: Optional[int] = Depends(get_optional_user_id)) -> int:
+    """Dependency: ID пользователя из токена, токен обязателен"""
+    if user_id is None:
+        raise _unauthorized("Требуется авторизация")
+    return user_id
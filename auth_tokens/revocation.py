@@ -0,0 +1,183 @@
+"""
+Отзыв JWT токенов (выход из системы).
+
+Каждый токен содержит идентификатор jti. Отозванные jti записываются в
+таблицу revoked_tokens, а каждый процесс держит их в памяти: проверка
+отзыва - поиск в множестве, без обращения к базе данных. Новые записи
+подгружаются периодически, поэтому токен, отозванный в другом процессе,
+перестает приниматься не позже чем через AUTH_REVOCATION_SYNC_INTERVAL.
+
+jti хранятся в корзинах по сроку действия токена: когда срок всех токенов
+корзины истек, корзина удаляется целиком - просроченный токен и так не
+пройдет проверку подписи, и список не растет бесконечно.
+"""
+
+import asyncio
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Set
+
+from database.connection import create_session
+from database.models import RevokedToken
+
+# Интервал загрузки новых отзывов из базы данных (секунды)
+REVOCATION_SYNC_INTERVAL = float(os.getenv("AUTH_REVOCATION_SYNC_INTERVAL", "10"))
+# Ширина корзины сроков действия (секунды)
+REVOCATION_BUCKET_SECONDS = int(os.getenv("AUTH_REVOCATION_BUCKET_SECONDS", "60"))
+# Перекрытие окон загрузки: запись, зафиксированная позже соседних,
+# все равно попадет в следующую загрузку
+REVOCATION_SYNC_OVERLAP = timedelta(minutes=1)
+
+
+class RevocationList:
+    """Отозванные jti в памяти процесса, сгруппированные по сроку действия"""
+
+    def __init__(self, bucket_seconds: int = REVOCATION_BUCKET_SECONDS, clock=time.time):
+        self.bucket_seconds = bucket_seconds
+        self._clock = clock
+        self._revoked: Set[str] = set()
+        # Номер корзины -> jti; все токены корзины истекают не позже
+        # момента номер * bucket_seconds
+        self._buckets: Dict[int, Set[str]] = {}
+        self._synced_at: Optional[datetime] = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._revoked)
+
+    def is_revoked(self, jti: Optional[str]) -> bool:
+        """Проверяет, отозван ли токен (O(1), без блокировок)"""
+        return jti is not None and jti in self._revoked
+
+    def add(self, jti: str, expires_at: float) -> None:
+        """
+        Добавляет отозванный токен.
+
+        Args:
+            jti: Идентификатор токена
+            expires_at: Срок действия токена (unix time)
+        """
+        now = self._clock()
+        if expires_at <= now:
+            return
+        bucket = -int(-expires_at // self.bucket_seconds)
+        with self._lock:
+            if jti not in self._revoked:
+                self._revoked.add(jti)
+                self._buckets.setdefault(bucket, set()).add(jti)
+            self._prune(now)
+
+    def prune(self) -> None:
+        """Удаляет корзины, срок всех токенов которых истек"""
+        with self._lock:
+            self._prune(self._clock())
+
+    def _prune(self, now: float) -> None:
+        expired = [bucket for bucket in self._buckets if bucket * self.bucket_seconds <= now]
+        for bucket in expired:
+            self._revoked.difference_update(self._buckets.pop(bucket))
+
+    def sync(self, db) -> int:
+        """
+        Загружает из базы данных отзывы, появившиеся с прошлой загрузки.
+
+        Args:
+            db: Сессия базы данных
+
+        Returns:
+            Количество загруженных записей
+        """
+        started_at = datetime.utcnow()
+        query = db.query(RevokedToken.jti, RevokedToken.expires_at).filter(
+            RevokedToken.expires_at > started_at
+        )
+        if self._synced_at is not None:
+            query = query.filter(RevokedToken.revoked_at >= self._synced_at - REVOCATION_SYNC_OVERLAP)
+
+        rows = query.all()
+        for jti, expires_at in rows:
+            self.add(jti, _to_timestamp(expires_at))
+        self._synced_at = started_at
+        self.prune()
+        return len(rows)
+
+
+def _to_timestamp(value: datetime) -> float:
+    # В таблице хранится UTC без часового пояса
+    return (value - datetime(1970, 1, 1)).total_seconds()
+
+
+def revoke_token(db, claims: dict, revocations: Optional[RevocationList] = None) -> bool:
+    """
+    Отзывает токен: запись в базу данных и в список процесса.
+
+    Args:
+        db: Сессия базы данных (фиксируется вызывающим кодом)
+        claims: Данные проверенного токена
+        revocations: Список отзывов процесса
+
+    Returns:
+        False, если токен не поддерживает отзыв (выпущен без jti)
+    """
+    jti = claims.get("jti")
+    expires_at = claims.get("exp")
+    if jti is None or expires_at is None:
+        return False
+
+    db.merge(RevokedToken(
+        jti=jti,
+        user_id=claims.get("user_id"),
+        expires_at=datetime(1970, 1, 1) + timedelta(seconds=float(expires_at)),
+        revoked_at=datetime.utcnow(),
+    ))
+    if revocations is None:
+        revocations = revocation_list
+    revocations.add(jti, float(expires_at))
+    return True
+
+
+def purge_expired_revocations(db) -> int:
+    """Удаляет из базы данных записи об уже истекших токенах"""
+    return db.query(RevokedToken).filter(
+        RevokedToken.expires_at <= datetime.utcnow()
+    ).delete(synchronize_session=False)
+
+
+def _sync_with_session(revocations: RevocationList, purge: bool) -> None:
+    session = create_session()
+    try:
+        revocations.sync(session)
+        if purge:
+            purge_expired_revocations(session)
+            session.commit()
+    finally:
+        session.close()
+
+
+async def sync_revocations_periodically(
+    revocations: Optional[RevocationList] = None,
+    interval: float = REVOCATION_SYNC_INTERVAL,
+    purge: bool = False
+) -> None:
+    """
+    Периодически загружает новые отзывы (задача в lifespan сервиса).
+
+    Args:
+        revocations: Список отзывов процесса
+        interval: Интервал загрузки (секунды)
+        purge: Удалять истекшие записи из базы данных (достаточно одного сервиса)
+    """
+    if revocations is None:
+        revocations = revocation_list
+    while True:
+        try:
+            await asyncio.to_thread(_sync_with_session, revocations, purge)
+        except Exception as e:
+            print(f"❌ Не удалось загрузить отозванные токены: {str(e)}")
+        await asyncio.sleep(interval)
+
+
+# Отозванные токены процесса
+revocation_list = RevocationList()
@@ -0,0 +1,129 @@
+"""
+Проверка JWT токенов с кешем декодированных токенов.
+"""
+
+import hashlib
+import heapq
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from jose import JWTError, jwt
+
+from .revocation import RevocationList, revocation_list
+
+# Настройки подписи (общие для всех микросервисов)
+SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-here-change-in-production")
+ALGORITHM = "HS256"
+
+# Количество декодированных токенов в кеше процесса
+TOKEN_CACHE_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "10000"))
+
+
+def decode_token(token: str) -> Optional[dict]:
+    """
+    Проверяет подпись и срок действия JWT токена.
+
+    Args:
+        token: JWT токен
+
+    Returns:
+        Данные токена (claims) или None, если токен недействителен
+    """
+    try:
+        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+
+
+class TokenVerifier:
+    """
+    Проверка токенов с LRU-кешем декодированных данных.
+
+    Ключ кеша - SHA-256 токена (сами токены в памяти не хранятся).
+    Запись живет не дольше срока действия токена: просроченные записи
+    вытесняются по куче сроков, а при переполнении - самые давно
+    использованные. Отозванные токены (см. revocation) отклоняются
+    и при попадании в кеш.
+    """
+
+    def __init__(
+        self,
+        max_size: int = TOKEN_CACHE_SIZE,
+        clock=time.time,
+        revocations: Optional[RevocationList] = None
+    ):
+        self.max_size = max_size
+        self._clock = clock
+        self._revocations = revocations if revocations is not None else revocation_list
+        self._entries: "OrderedDict[bytes, Tuple[dict, float]]" = OrderedDict()
+        self._expiry_heap: List[Tuple[float, bytes]] = []
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _evict_expired(self, now: float) -> None:
+        while self._expiry_heap and self._expiry_heap[0][0] <= now:
+            _, key = heapq.heappop(self._expiry_heap)
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] <= now:
+                del self._entries[key]
+
+    def _compact_heap(self) -> None:
+        # В куче остаются ключи, вытесненные по LRU; пересобираем ее,
+        # когда она заметно больше кеша
+        self._expiry_heap = [(expires_at, key) for key, (_, expires_at) in self._entries.items()]
+        heapq.heapify(self._expiry_heap)
+
+    def verify(self, token: str) -> Optional[dict]:
+        """
+        Проверяет токен, используя кеш.
+
+        Args:
+            token: JWT токен
+
+        Returns:
+            Данные токена или None, если токен недействителен, просрочен или отозван
+        """
+        key = hashlib.sha256(token.encode("utf-8")).digest()
+        now = self._clock()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                claims, expires_at = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    return None if self._revocations.is_revoked(claims.get("jti")) else claims
+                del self._entries[key]
+
+        claims = decode_token(token)
+        if claims is None or self._revocations.is_revoked(claims.get("jti")):
+            return None
+        expires_at = claims.get("exp")
+        if expires_at is None:
+            # Бессрочные токены не кешируются
+            return claims
+
+        with self._lock:
+            self._evict_expired(now)
+            self._entries[key] = (claims, float(expires_at))
+            heapq.heappush(self._expiry_heap, (float(expires_at), key))
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            if len(self._expiry_heap) > 2 * self.max_size:
+                self._compact_heap()
+        return claims
+
+    def invalidate(self, token: str) -> None:
+        """Удаляет токен из кеша"""
+        key = hashlib.sha256(token.encode("utf-8")).digest()
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+# Проверка токенов процесса
+token_verifier = TokenVerifier()
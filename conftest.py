@@ -0,0 +1,21 @@
+"""
+Общие настройки pytest для запуска тестов из корня проекта.
+
+Модули микросервисов импортируются по плоским именам (main, services,
+schemas), поэтому скрипты одного сервиса могут оставить в кэше импортов
+модуль services.py, который перекрывает пакет services с тестами других
+сервисов.
+"""
+
+import sys
+
+import pytest
+
+
+def pytest_collectstart(collector):
+    """Убирает из кэша импортов модуль services.py, перекрывающий пакет services"""
+    if not isinstance(collector, pytest.Module):
+        return
+    module = sys.modules.get("services")
+    if module is not None and not hasattr(module, "__path__"):
+        sys.modules.pop("services")
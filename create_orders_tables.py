@@ -10,7 +10,11 @@ import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from database.connection import get_engine
-from database.models import Base, Order, OrderItem
+from database.models import (
+    Base, Order, OrderItem, IdempotencyKey, OrderOutboxEvent,
+    SalesDaily, AudiobookSales, OrderStatusCount, BestsellerCheckpoint,
+    ArchivedOrder, ArchivedOrderItem, UserLibrary
+)
 
 def create_orders_tables():
     """Создает таблицы для заказов в базе данных"""
@@ -22,16 +26,74 @@ def create_orders_tables():
         # Создаем таблицы Order и OrderItem
         Order.__table__.create(engine, checkfirst=True)
         OrderItem.__table__.create(engine, checkfirst=True)
+        IdempotencyKey.__table__.create(engine, checkfirst=True)
+        OrderOutboxEvent.__table__.create(engine, checkfirst=True)
+        SalesDaily.__table__.create(engine, checkfirst=True)
+        AudiobookSales.__table__.create(engine, checkfirst=True)
+        OrderStatusCount.__table__.create(engine, checkfirst=True)
+        BestsellerCheckpoint.__table__.create(engine, checkfirst=True)
+        ArchivedOrder.__table__.create(engine, checkfirst=True)
+        ArchivedOrderItem.__table__.create(engine, checkfirst=True)
+        UserLibrary.__table__.create(engine, checkfirst=True)
         
         print("✅ Таблицы заказов успешно созданы!")
         print("📋 Созданные таблицы:")
         print("   - orders (заказы)")
         print("   - order_items (позиции заказов)")
+        print("   - idempotency_keys (ключи идемпотентности)")
+        print("   - order_outbox (события заказов для фоновой обработки)")
+        print("   - sales_daily, sales_by_audiobook, order_status_counts (сводки продаж)")
+        print("   - bestseller_checkpoints (состояние трекера бестселлеров)")
+        print("   - orders_archive, order_items_archive (архив завершенных заказов)")
+        print("   - user_libraries (библиотеки приобретенных книг)")
         
     except Exception as e:
         print(f"❌ Ошибка при создании таблиц: {str(e)}")
         sys.exit(1)
 
+def add_missing_columns():
+    """Добавляет в существующие таблицы заказов новые колонки моделей (nullable или со значением по умолчанию)"""
+    try:
+        from sqlalchemy import inspect, text
+        
+        engine = get_engine()
+        inspector = inspect(engine)
+        
+        for table in (Order.__table__, ArchivedOrder.__table__, OrderOutboxEvent.__table__, UserLibrary.__table__):
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                if column.nullable:
+                    definition = "NULL"
+                elif column.server_default is not None:
+                    definition = f"NOT NULL DEFAULT {column.server_default.arg}"
+                else:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                with engine.begin() as connection:
+                    connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type} {definition}"))
+                print(f"➕ Добавлена колонка {table.name}.{column.name}")
+        
+    except Exception as e:
+        print(f"❌ Ошибка при добавлении колонок: {str(e)}")
+        sys.exit(1)
+
+def create_orders_indexes():
+    """Создает индексы таблиц заказов, отсутствующие в уже существующих таблицах"""
+    try:
+        engine = get_engine()
+        
+        for table in (Order.__table__, OrderItem.__table__, ArchivedOrder.__table__):
+            for index in table.indexes:
+                index.create(engine, checkfirst=True)
+        
+        print("✅ Индексы таблиц заказов актуальны")
+        
+    except Exception as e:
+        print(f"❌ Ошибка при создании индексов: {str(e)}")
+        sys.exit(1)
+
 def check_tables_exist():
     """Проверяет существование таблиц заказов"""
     try:
@@ -41,7 +103,11 @@ def check_tables_exist():
         inspector = inspect(engine)
         tables = inspector.get_table_names()
         
-        required_tables = ['orders', 'order_items']
+        required_tables = [
+            'orders', 'order_items', 'idempotency_keys', 'order_outbox',
+            'sales_daily', 'sales_by_audiobook', 'order_status_counts', 'bestseller_checkpoints',
+            'orders_archive', 'order_items_archive', 'user_libraries'
+        ]
         missing_tables = [table for table in required_tables if table not in tables]
         
         if missing_tables:
@@ -62,6 +128,8 @@ if __name__ == "__main__":
     # Проверяем существование таблиц
     if check_tables_exist():
         print("📝 Таблицы уже существуют, повторное создание не требуется")
+        add_missing_columns()
+        create_orders_indexes()
     else:
         # Создаем таблицы
         create_orders_tables()
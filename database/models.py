@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, Numeric, DateTime, ForeignKey, Table
+from sqlalchemy import Column, Integer, String, Text, Numeric, Date, DateTime, ForeignKey, Table, Index, LargeBinary
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -7,6 +7,9 @@ import uuid
 
 Base = declarative_base()
 
+# Допустимые статусы заказа
+ORDER_STATUSES = ['pending', 'confirmed', 'processing', 'shipped', 'delivered', 'cancelled']
+
 # Таблица связи многие-ко-многим между Audiobook и Category
 audiobook_category = Table(
     'audiobook_category',
@@ -40,6 +43,48 @@ class User(Base):
         return self.email
 
 
+class UserSession(Base):
+    """
+    Сессия пользователя - refresh токен для выпуска новых токенов доступа.
+    
+    Сам refresh токен не хранится: только его HMAC, поэтому утечка таблицы
+    не позволяет продлевать чужие сессии. Токен меняется при каждом
+    обновлении, ID сессии остается прежним.
+    """
+    __tablename__ = 'user_sessions'
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False, index=True)
+    token_hash = Column(String(64), nullable=False, unique=True)
+    # HMAC предыдущего refresh токена: его повторное предъявление означает утечку
+    previous_token_hash = Column(String(64), nullable=True, index=True)
+    created_at = Column(DateTime, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+    revoked_at = Column(DateTime, nullable=True)
+    
+    def __repr__(self):
+        return f"<UserSession(id={self.id}, user_id={self.user_id}, expires_at={self.expires_at})>"
+
+
+class RevokedToken(Base):
+    """
+    Отозванный JWT токен (выход из системы).
+    
+    Хранится только идентификатор токена (jti) до истечения его срока:
+    микросервисы периодически загружают новые записи в память и проверяют
+    отзыв без обращения к базе данных.
+    """
+    __tablename__ = 'revoked_tokens'
+    
+    jti = Column(String(64), primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=True)
+    expires_at = Column(DateTime, nullable=False, index=True)
+    revoked_at = Column(DateTime, nullable=False, index=True)
+    
+    def __repr__(self):
+        return f"<RevokedToken(jti='{self.jti}', expires_at={self.expires_at})>"
+
+
 class Author(Base):
     """
     Сущность Author (Автор) - представляет автора аудиокниг.
@@ -198,6 +243,9 @@ class Order(Base):
     total_amount = Column(Numeric(10, 2), nullable=False)
     status = Column(String(50), nullable=False, default='pending')
     
+    # Покупатель (None - анонимный заказ)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=True)
+    
     # Метаданные
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
@@ -205,6 +253,13 @@ class Order(Base):
     # Связи
     items = relationship("OrderItem", back_populates="order", cascade="all, delete-orphan")
     
+    # Индексы для постраничного просмотра заказов с фильтром по статусу
+    # и истории заказов пользователя
+    __table_args__ = (
+        Index('ix_orders_status_order_number', 'status', 'order_number'),
+        Index('ix_orders_user_id_created_at', 'user_id', 'created_at'),
+    )
+    
     def __repr__(self):
         return f"<Order(id={self.id}, order_number='{self.order_number}', total_amount={self.total_amount})>"
     
@@ -238,6 +293,20 @@ class Order(Base):
         """
         self.total_amount = sum(item.total_price for item in self.items)
     
+    @staticmethod
+    def validate_status(new_status: str) -> None:
+        """
+        Проверяет, что заказ можно перевести в статус.
+        
+        Args:
+            new_status: Новый статус заказа
+            
+        Raises:
+            ValueError: Если статус недопустим
+        """
+        if new_status not in ORDER_STATUSES:
+            raise ValueError(f"Неверный статус заказа. Допустимые значения: {ORDER_STATUSES}")
+    
     def update_status(self, new_status: str) -> None:
         """
         Обновляет статус заказа.
@@ -245,9 +314,7 @@ class Order(Base):
         Args:
             new_status: Новый статус заказа
         """
-        valid_statuses = ['pending', 'confirmed', 'processing', 'shipped', 'delivered', 'cancelled']
-        if new_status not in valid_statuses:
-            raise ValueError(f"Неверный статус заказа. Допустимые значения: {valid_statuses}")
+        self.validate_status(new_status)
         self.status = new_status
     
     def get_items_count(self) -> int:
@@ -281,7 +348,7 @@ class OrderItem(Base):
     id = Column(Integer, primary_key=True, autoincrement=True)
     
     # Внешний ключ к Order
-    order_id = Column(Integer, ForeignKey('orders.id'), nullable=False)
+    order_id = Column(Integer, ForeignKey('orders.id'), nullable=False, index=True)
     
     # Информация о товаре (фиксируется на момент покупки)
     audiobook_id = Column(Integer, nullable=False)
@@ -312,6 +379,201 @@ class OrderItem(Base):
         return f"{self.title} x {self.quantity} = {self.total_price}"
 
 
+class ArchivedOrder(Base):
+    """
+    Архивный заказ - доставленный или отмененный заказ, перенесенный из
+    таблицы orders заданием архивации.
+    
+    Сохраняет ID, номер и данные исходного заказа и доступен только для чтения.
+    """
+    __tablename__ = 'orders_archive'
+    
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    order_number = Column(String(50), nullable=False, unique=True, index=True)
+    total_amount = Column(Numeric(10, 2), nullable=False)
+    status = Column(String(50), nullable=False)
+    user_id = Column(Integer, nullable=True)
+    created_at = Column(DateTime(timezone=True))
+    updated_at = Column(DateTime(timezone=True))
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    items = relationship("ArchivedOrderItem", back_populates="order")
+    
+    __table_args__ = (
+        Index('ix_orders_archive_user_id_created_at', 'user_id', 'created_at'),
+    )
+    
+    def __repr__(self):
+        return f"<ArchivedOrder(id={self.id}, order_number='{self.order_number}', status='{self.status}')>"
+
+
+class ArchivedOrderItem(Base):
+    """
+    Позиция архивного заказа.
+    """
+    __tablename__ = 'order_items_archive'
+    
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    order_id = Column(Integer, ForeignKey('orders_archive.id'), nullable=False, index=True)
+    audiobook_id = Column(Integer, nullable=False)
+    title = Column(String(255), nullable=False)
+    price_per_unit = Column(Numeric(10, 2), nullable=False)
+    quantity = Column(Integer, nullable=False)
+    created_at = Column(DateTime(timezone=True))
+    
+    order = relationship("ArchivedOrder", back_populates="items")
+    
+    @property
+    def total_price(self) -> float:
+        """
+        Возвращает общую стоимость позиции.
+        
+        Returns:
+            Общая стоимость позиции
+        """
+        return float(self.price_per_unit * self.quantity)
+
+
+class OrderOutboxEvent(Base):
+    """
+    Сущность OrderOutboxEvent (Событие заказа в outbox) - событие, записанное
+    в той же транзакции, что и изменение заказа.
+    
+    Фоновые обработчики микросервиса "Заказы" разбирают outbox и выполняют
+    работу, не требующую ответа клиенту (уведомления, аналитика, смена статусов).
+    """
+    __tablename__ = 'order_outbox'
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    order_id = Column(Integer, ForeignKey('orders.id'), nullable=False, index=True)
+    event_type = Column(String(50), nullable=False)
+    payload = Column(Text, nullable=False)
+    status = Column(String(20), nullable=False, default='pending')
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(Text, nullable=True)
+    # JSON-список обработчиков, уже выполненных успешно (при повторе не вызываются)
+    completed_handlers = Column(Text, nullable=True)
+    available_at = Column(DateTime(timezone=True), nullable=False)
+    
+    # Метаданные
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    processed_at = Column(DateTime(timezone=True), nullable=True)
+    
+    # Индекс для выборки очередной пачки событий
+    __table_args__ = (
+        Index('ix_order_outbox_status_available_at', 'status', 'available_at'),
+    )
+    
+    def __repr__(self):
+        return f"<OrderOutboxEvent(id={self.id}, order_id={self.order_id}, event_type='{self.event_type}', status='{self.status}')>"
+
+
+class SalesDaily(Base):
+    """
+    Сводка продаж за день - инкрементально обновляемый агрегат.
+    
+    Обновляется обработчиками событий заказов, поэтому отчеты по выручке
+    читают по одной строке на день вместо сканирования заказов.
+    Отмененные заказы в выручку не входят.
+    """
+    __tablename__ = 'sales_daily'
+    
+    day = Column(Date, primary_key=True)
+    orders_count = Column(Integer, nullable=False, default=0)
+    units = Column(Integer, nullable=False, default=0)
+    revenue = Column(Numeric(14, 2), nullable=False, default=0)
+    
+    def __repr__(self):
+        return f"<SalesDaily(day={self.day}, orders_count={self.orders_count}, revenue={self.revenue})>"
+
+
+class AudiobookSales(Base):
+    """
+    Сводка продаж аудиокниги - инкрементально обновляемый агрегат.
+    """
+    __tablename__ = 'sales_by_audiobook'
+    
+    audiobook_id = Column(Integer, primary_key=True, autoincrement=False)
+    title = Column(String(255), nullable=False)
+    units = Column(Integer, nullable=False, default=0, index=True)
+    revenue = Column(Numeric(14, 2), nullable=False, default=0)
+    
+    def __repr__(self):
+        return f"<AudiobookSales(audiobook_id={self.audiobook_id}, units={self.units}, revenue={self.revenue})>"
+
+
+class OrderStatusCount(Base):
+    """
+    Количество заказов в каждом статусе - инкрементально обновляемый агрегат.
+    """
+    __tablename__ = 'order_status_counts'
+    
+    status = Column(String(50), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f"<OrderStatusCount(status='{self.status}', count={self.count})>"
+
+
+class BestsellerCheckpoint(Base):
+    """
+    Контрольная точка трекера бестселлеров - сжатое состояние скетчей
+    скользящих окон, сохраняемое периодически для восстановления после рестарта.
+    """
+    __tablename__ = 'bestseller_checkpoints'
+    
+    name = Column(String(50), primary_key=True)
+    data = Column(LargeBinary(length=16 * 1024 * 1024), nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    
+    def __repr__(self):
+        return f"<BestsellerCheckpoint(name='{self.name}', updated_at={self.updated_at})>"
+
+
+class UserLibrary(Base):
+    """
+    Библиотека пользователя - read model приобретенных аудиокниг.
+    
+    Отсортированный массив ID аудиокниг (uint32) пополняется фоновыми
+    обработчиками заказов, поэтому проверка владения книгой не требует
+    просмотра истории заказов.
+    """
+    __tablename__ = 'user_libraries'
+    
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True, autoincrement=False)
+    audiobook_ids = Column(LargeBinary(length=16 * 1024 * 1024), nullable=False)
+    books_count = Column(Integer, nullable=False, default=0)
+    # Увеличивается при каждом изменении; по ней процессы сверяют свои кеши
+    version = Column(Integer, nullable=False, default=0, server_default="0")
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    
+    def __repr__(self):
+        return f"<UserLibrary(user_id={self.user_id}, books_count={self.books_count})>"
+
+
+class IdempotencyKey(Base):
+    """
+    Сущность IdempotencyKey (Ключ идемпотентности) - сохраненный результат
+    создания заказа для заголовка Idempotency-Key.
+    
+    Записывается в той же транзакции, что и заказ, поэтому повтор запроса
+    с тем же ключом возвращает сохраненный ответ вместо создания дубликата.
+    """
+    __tablename__ = 'idempotency_keys'
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    key = Column(String(255), nullable=False, unique=True, index=True)
+    request_hash = Column(String(64), nullable=False)
+    order_id = Column(Integer, ForeignKey('orders.id'), nullable=True)
+    response_body = Column(Text, nullable=False)
+    
+    # Метаданные
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    def __repr__(self):
+        return f"<IdempotencyKey(id={self.id}, key='{self.key}', order_id={self.order_id})>"
+
+
 class Prompt(Base):
     """
     Сущность Prompt (Промпт) - представляет промпт для AI-сервисов.
@@ -1,7 +1,7 @@
 from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import and_, or_
-from typing import List, Optional, Dict, Any
-from .models import Base, Author, Category, Audiobook
+from sqlalchemy import and_, or_, func
+from typing import List, Optional, Dict, Any, Tuple
+from .models import Base, Author, Category, Audiobook, audiobook_category
 
 
 class AuthorRepository:
@@ -264,6 +264,46 @@ class AudiobookRepository:
             
         return query.all()
     
+    def get_by_ids(self, audiobook_ids: List[int]) -> List[Audiobook]:
+        """
+        Получает аудиокниги по списку ID одним запросом.
+        
+        Связи не загружаются - метод предназначен для массового чтения
+        цен и названий (например, при расчете стоимости заказа).
+        
+        Args:
+            audiobook_ids: Список ID аудиокниг
+            
+        Returns:
+            Список найденных аудиокниг (отсутствующие ID пропускаются)
+        """
+        if not audiobook_ids:
+            return []
+        return self.session.query(Audiobook).filter(
+            Audiobook.id.in_(set(audiobook_ids))
+        ).all()
+    
+    def get_catalog_version(self) -> Tuple:
+        """
+        Признак версии каталога без загрузки аудиокниг.
+        
+        Количество записей, максимальные ID и время изменения аудиокниг,
+        авторов и категорий и количество связей с категориями - чтение
+        агрегатов по индексам. Меняется при добавлении, удалении и изменении
+        записей; не меняется при изменениях в пределах точности updated_at
+        и при замене категорий книги без изменения их количества.
+        
+        Returns:
+            Кортеж агрегатов
+        """
+        version = []
+        for model in (Audiobook, Author, Category):
+            version.extend(
+                self.session.query(func.count(model.id), func.max(model.id), func.max(model.updated_at)).one()
+            )
+        version.append(self.session.query(func.count()).select_from(audiobook_category).scalar())
+        return tuple(version)
+    
     def get_all_count(self) -> int:
         """
         Получить общее количество аудиокниг.
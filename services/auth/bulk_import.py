@@ -0,0 +1,201 @@
+"""
+Массовый импорт пользователей (миграция из внешнего хранилища).
+
+Файл CSV (с заголовком) или JSON Lines с полями email и password
+(пароль в открытом виде) либо hashed_password (готовый хеш в формате,
+который распознает pwd_context, например bcrypt "$2b$...").
+
+Пользователи обрабатываются пачками: существующие email отсекаются одним
+запросом на пачку без учета регистра (у пользователей, созданных до
+нормализации email, он мог сохраниться в исходном регистре), пароли
+хешируются параллельно в пуле процессов, строки вставляются одним
+executemany и фиксируются.
+Если email зарегистрировали параллельно с импортом, пачка вставляется
+построчно, а отклоненные строки учитываются в статистике.
+
+Запуск: python bulk_import.py users.csv [--chunk-size N] [--workers N]
+"""
+
+import csv
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Добавляем путь к корневой директории проекта для импорта моделей
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from sqlalchemy import func, insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from database.models import User
+from security import get_password_hash, normalize_email, pwd_context
+from hashing import HASH_WORKERS
+
+# Размер пачки импорта
+IMPORT_CHUNK_SIZE = int(os.getenv("AUTH_IMPORT_CHUNK_SIZE", "1000"))
+# Паролей в одной задаче пула (меньше накладных расходов на передачу)
+HASH_TASK_SIZE = 16
+
+
+def read_users(path: str) -> Iterator[dict]:
+    """Читает записи пользователей из CSV или JSON Lines"""
+    with open(path, encoding="utf-8", newline="") as source:
+        if path.endswith((".jsonl", ".ndjson")):
+            for line in source:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from csv.DictReader(source)
+
+
+def _chunks(records: Iterable[dict], size: int) -> Iterator[List[dict]]:
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class UserImporter:
+    """Импорт пользователей пачками"""
+
+    def __init__(self, db: Session, executor: ProcessPoolExecutor, chunk_size: int = IMPORT_CHUNK_SIZE):
+        self.db = db
+        self.executor = executor
+        self.chunk_size = chunk_size
+        self._seen = set()
+        self.stats = {"imported": 0, "existing": 0, "duplicates": 0, "invalid": 0, "failed": 0}
+
+    def _prepare(self, record: dict) -> Optional[dict]:
+        """Проверяет запись; None - запись отклонена"""
+        email = normalize_email(record.get("email") or "")
+        password = record.get("password") or None
+        hashed_password = record.get("hashed_password") or None
+
+        if "@" not in email or len(email) > 255 or not (password or hashed_password):
+            self.stats["invalid"] += 1
+            return None
+        if hashed_password and pwd_context.identify(hashed_password) is None:
+            self.stats["invalid"] += 1
+            return None
+        if email in self._seen:
+            self.stats["duplicates"] += 1
+            return None
+
+        self._seen.add(email)
+        return {"email": email, "password": password, "hashed_password": hashed_password}
+
+    def _existing_emails(self, emails: List[str]) -> set:
+        """Уже зарегистрированные email из списка, в нормализованном виде"""
+        email = func.lower(User.email)
+        rows = self.db.query(email).filter(email.in_(emails)).all()
+        return {existing for (existing,) in rows}
+
+    def _new_entries(self, entries: List[dict]) -> List[dict]:
+        """Записи с еще не зарегистрированными email, с вычисленными хешами"""
+        existing = self._existing_emails([entry["email"] for entry in entries])
+        new_entries = [entry for entry in entries if entry["email"] not in existing]
+
+        # Хешируем только пароли новых пользователей - параллельно в пуле процессов
+        # (при повторе уже вычисленные хеши сохраняются в записях)
+        plain = [entry for entry in new_entries if entry["hashed_password"] is None]
+        hashes = self.executor.map(
+            get_password_hash,
+            [entry["password"] for entry in plain],
+            chunksize=HASH_TASK_SIZE
+        )
+        for entry, hashed_password in zip(plain, hashes):
+            entry["hashed_password"] = hashed_password
+        return new_entries
+
+    @staticmethod
+    def _row(entry: dict) -> dict:
+        return {"email": entry["email"], "hashed_password": entry["hashed_password"]}
+
+    def _insert_chunk(self, entries: List[dict]) -> List[dict]:
+        new_entries = self._new_entries(entries)
+        if new_entries:
+            self.db.execute(insert(User), [self._row(entry) for entry in new_entries])
+        return new_entries
+
+    def _insert_rows(self, entries: List[dict]) -> Tuple[List[dict], int]:
+        """
+        Вставляет записи построчно, каждую в своей точке сохранения.
+
+        Returns:
+            (вставленные записи, количество отклоненных строк)
+        """
+        inserted, failed = [], 0
+        for entry in self._new_entries(entries):
+            try:
+                with self.db.begin_nested():
+                    self.db.execute(insert(User), [self._row(entry)])
+                inserted.append(entry)
+            except IntegrityError as e:
+                failed += 1
+                print(f"⚠️ Пользователь {entry['email']} не импортирован: {e.orig}")
+        return inserted, failed
+
+    def import_chunk(self, records: List[dict]) -> int:
+        """
+        Импортирует пачку записей и фиксирует ее.
+
+        Returns:
+            Количество созданных пользователей
+        """
+        entries = [entry for entry in map(self._prepare, records) if entry is not None]
+        if not entries:
+            return 0
+
+        failed = 0
+        try:
+            inserted = self._insert_chunk(entries)
+            self.db.commit()
+        except IntegrityError:
+            # Email зарегистрирован параллельно - пачка вставляется построчно:
+            # новые конфликты отклоняют только свою строку
+            self.db.rollback()
+            inserted, failed = self._insert_rows(entries)
+            self.db.commit()
+
+        self.stats["imported"] += len(inserted)
+        self.stats["failed"] += failed
+        self.stats["existing"] += len(entries) - len(inserted) - failed
+        return len(inserted)
+
+    def run(self, records: Iterable[dict]) -> Dict[str, int]:
+        """Импортирует все записи, возвращает статистику"""
+        for chunk in _chunks(records, self.chunk_size):
+            self.import_chunk(chunk)
+            print(f"   ... создано {self.stats['imported']}, уже существовало {self.stats['existing']}")
+        return self.stats
+
+
+if __name__ == "__main__":
+    import argparse
+    from database.connection import create_session
+
+    parser = argparse.ArgumentParser(description="Массовый импорт пользователей")
+    parser.add_argument("path", help="CSV (email,password,hashed_password) или JSON Lines")
+    parser.add_argument("--chunk-size", type=int, default=IMPORT_CHUNK_SIZE, help="Размер пачки")
+    parser.add_argument("--workers", type=int, default=HASH_WORKERS, help="Процессов хеширования")
+    args = parser.parse_args()
+
+    print(f"👥 Импорт пользователей из {args.path}...")
+    session = create_session()
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers) as executor:
+            stats = UserImporter(session, executor, chunk_size=args.chunk_size).run(read_users(args.path))
+    finally:
+        session.close()
+    print(
+        f"✅ Создано: {stats['imported']}, уже существовало: {stats['existing']}, "
+        f"повторов в файле: {stats['duplicates']}, отклонено: {stats['invalid']}, "
+        f"ошибок вставки: {stats['failed']}"
+    )
@@ -0,0 +1,74 @@
+"""
+Подбор стоимости bcrypt под оборудование.
+
+Замеряет время хеширования на текущей машине для нескольких значений
+стоимости и выбирает наибольшую, при которой медиана не превышает
+целевую задержку. Найденное значение задается в AUTH_BCRYPT_ROUNDS;
+хеши существующих пользователей пересчитываются при их следующем входе.
+
+Запуск: python calibrate_hash.py [--target-ms 250] [--samples 5]
+"""
+
+import os
+import statistics
+import time
+from typing import Dict, Tuple
+
+from security import pwd_context, BCRYPT_ROUNDS
+
+# Целевое время хеширования одного пароля (миллисекунды)
+HASH_TARGET_MS = float(os.getenv("AUTH_HASH_TARGET_MS", "250"))
+
+# Допустимый диапазон стоимости bcrypt
+MIN_ROUNDS = 10
+MAX_ROUNDS = 16
+
+
+def measure_rounds(rounds: int, samples: int) -> float:
+    """Медианное время хеширования (мс) при заданной стоимости"""
+    context = pwd_context.copy(
+        bcrypt__default_rounds=rounds, bcrypt__min_rounds=rounds, bcrypt__max_rounds=rounds
+    )
+    timings = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        context.hash("calibration-password")
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def calibrate(target_ms: float = HASH_TARGET_MS, samples: int = 5) -> Tuple[int, Dict[int, float]]:
+    """
+    Подбирает стоимость bcrypt.
+
+    Каждый шаг стоимости удваивает время, поэтому замеры прекращаются,
+    как только медиана превысила цель.
+
+    Returns:
+        (выбранная стоимость, замеры {стоимость: мс})
+    """
+    timings = {}
+    chosen = MIN_ROUNDS
+    for rounds in range(MIN_ROUNDS, MAX_ROUNDS + 1):
+        timings[rounds] = measure_rounds(rounds, samples)
+        if timings[rounds] > target_ms:
+            break
+        chosen = rounds
+    return chosen, timings
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Подбор стоимости bcrypt")
+    parser.add_argument("--target-ms", type=float, default=HASH_TARGET_MS, help="Целевое время хеширования")
+    parser.add_argument("--samples", type=int, default=5, help="Замеров на каждую стоимость")
+    args = parser.parse_args()
+
+    print(f"⏱️ Подбор стоимости bcrypt (цель {args.target_ms:.0f} мс, текущая {BCRYPT_ROUNDS})...")
+    chosen, timings = calibrate(args.target_ms, args.samples)
+    for rounds, elapsed in timings.items():
+        print(f"   rounds={rounds}: {elapsed:.1f} мс")
+    if timings[chosen] > args.target_ms:
+        print(f"⚠️ Даже минимальная стоимость {MIN_ROUNDS} медленнее цели")
+    print(f"✅ Рекомендуется: AUTH_BCRYPT_ROUNDS={chosen}")
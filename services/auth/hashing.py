@@ -0,0 +1,116 @@
+"""
+Хеширование паролей вне цикла событий.
+
+bcrypt занимает процессор на десятки-сотни миллисекунд и в части сборок
+плохо отпускает GIL, поэтому хеширование и проверка паролей выполняются
+в ограниченном пуле процессов. Контроль допуска ограничивает очередь:
+при ее переполнении запрос сразу получает отказ (503), а не ждет, так что
+всплеск входов замедляет только вход, а не весь сервис.
+"""
+
+import asyncio
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Tuple
+
+from security import get_password_hash, verify_password, verify_and_update_password
+
+# Количество процессов хеширования
+HASH_WORKERS = int(os.getenv("AUTH_HASH_WORKERS", str(os.cpu_count() or 1)))
+# Максимум операций в работе и в очереди пула
+HASH_MAX_PENDING = int(os.getenv("AUTH_HASH_MAX_PENDING", str(HASH_WORKERS * 8)))
+
+
+class PasswordHasherBusyError(Exception):
+    """Очередь хеширования переполнена"""
+
+
+class PasswordHasher:
+    """Хеширование и проверка паролей в пуле процессов с контролем допуска"""
+
+    def __init__(self, workers: int = HASH_WORKERS, max_pending: int = HASH_MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+        self._pending = 0
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            return self._executor
+
+    def _replace_broken(self, broken: ProcessPoolExecutor) -> None:
+        """
+        Убирает сломанный пул, если его еще не заменил другой запрос.
+
+        Несколько запросов получают BrokenProcessPool одновременно; пул
+        пересоздается один раз, а сломанный останавливается.
+        """
+        with self._executor_lock:
+            if self._executor is not broken:
+                return
+            self._executor = None
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    async def _run(self, function, *args):
+        if self._pending >= self.max_pending:
+            raise PasswordHasherBusyError("Сервис перегружен, повторите попытку позже")
+
+        self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            executor = self._get_executor()
+            try:
+                return await loop.run_in_executor(executor, function, *args)
+            except BrokenProcessPool:
+                # Процесс пула завершился аварийно - пересоздаем пул и повторяем
+                self._replace_broken(executor)
+                return await loop.run_in_executor(self._get_executor(), function, *args)
+        finally:
+            self._pending -= 1
+
+    async def hash(self, password: str) -> str:
+        """
+        Создает хеш пароля в пуле процессов.
+
+        Raises:
+            PasswordHasherBusyError: Если очередь хеширования переполнена
+        """
+        return await self._run(get_password_hash, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        """
+        Проверяет пароль в пуле процессов.
+
+        Raises:
+            PasswordHasherBusyError: Если очередь хеширования переполнена
+        """
+        return await self._run(verify_password, plain_password, hashed_password)
+
+    async def verify_and_update(self, plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        """
+        Проверяет пароль и пересчитывает устаревший хеш в пуле процессов.
+
+        Raises:
+            PasswordHasherBusyError: Если очередь хеширования переполнена
+        """
+        return await self._run(verify_and_update_password, plain_password, hashed_password)
+
+    def shutdown(self) -> None:
+        """Останавливает пул процессов"""
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Хешер процесса
+password_hasher = PasswordHasher()
@@ -1,10 +1,12 @@
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, Request, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, EmailStr
 from sqlalchemy.orm import Session
 from datetime import timedelta
 from typing import Optional
+from contextlib import asynccontextmanager
+import asyncio
 import sys
 import os
 
@@ -13,16 +15,35 @@ sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
 
 from database.models import User, Base
 from database.connection import get_db, get_engine
-from security import get_password_hash, verify_password, create_access_token, ACCESS_TOKEN_EXPIRE_MINUTES
+from security import create_access_token, normalize_email, ACCESS_TOKEN_EXPIRE_MINUTES
+from hashing import password_hasher, PasswordHasherBusyError
+from rate_limit import login_rate_limiter, resolve_client_ip
+from sessions import session_store, purge_sessions_periodically, SessionInfo
+from auth_tokens import token_verifier, revoke_token, sync_revocations_periodically
 
 # Создаем таблицы в базе данных
 engine = get_engine()
 Base.metadata.create_all(bind=engine)
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Управление жизненным циклом приложения"""
+    # Загрузка отзывов токенов из других процессов и очистка истекших записей
+    revocation_sync_task = asyncio.create_task(sync_revocations_periodically(purge=True))
+    session_purge_task = asyncio.create_task(purge_sessions_periodically())
+    yield
+    revocation_sync_task.cancel()
+    session_purge_task.cancel()
+    # Останавливаем пул процессов хеширования паролей
+    password_hasher.shutdown()
+
+
 app = FastAPI(
     title="Сервис аутентификации",
     description="Микросервис для регистрации и аутентификации пользователей",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Настройка CORS для разрешения запросов с фронтенда
@@ -38,6 +59,28 @@ app.add_middleware(
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 
+def service_busy_error() -> HTTPException:
+    """Ответ при переполнении очереди хеширования паролей"""
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Сервис перегружен, повторите попытку позже",
+        headers={"Retry-After": "1"},
+    )
+
+
+def issue_access_token(session_info: SessionInfo) -> str:
+    """
+    Создает токен доступа сессии.
+    
+    ID пользователя в токене позволяет другим микросервисам проверять
+    запросы локально (см. auth_tokens), ID сессии - отозвать ее при выходе.
+    """
+    return create_access_token(
+        data={"sub": session_info.email, "user_id": session_info.user_id, "sid": session_info.session_id},
+        expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    )
+
+
 class UserCreate(BaseModel):
     """
     Схема для создания пользователя (процесс Registration).
@@ -66,16 +109,25 @@ class Token(BaseModel):
     """
     access_token: str
     token_type: str = "bearer"
+    expires_in: int = ACCESS_TOKEN_EXPIRE_MINUTES * 60
+    refresh_token: Optional[str] = None
     
     class Config:
         schema_extra = {
             "example": {
                 "access_token": "eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9...",
-                "token_type": "bearer"
+                "token_type": "bearer",
+                "expires_in": 900,
+                "refresh_token": "Qm9vdHN0cmFw..."
             }
         }
 
 
+class RefreshRequest(BaseModel):
+    """Схема запроса нового токена доступа по refresh токену"""
+    refresh_token: str
+
+
 class UserResponse(BaseModel):
     """
     Схема для ответа с информацией о пользователе.
@@ -117,19 +169,24 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db)):
         
     Raises:
         HTTPException: Если пользователь с таким email уже существует
+            или очередь хеширования паролей переполнена (503)
     """
     # Проверяем, существует ли пользователь с таким email
-    existing_user = db.query(User).filter(User.email == user_data.email).first()
+    email = normalize_email(user_data.email)
+    existing_user = db.query(User).filter(User.email == email).first()
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Пользователь с таким email уже зарегистрирован"
         )
     
-    # Создаем нового пользователя
-    hashed_password = get_password_hash(user_data.password)
+    # Создаем нового пользователя (хеширование - в пуле процессов)
+    try:
+        hashed_password = await password_hasher.hash(user_data.password)
+    except PasswordHasherBusyError:
+        raise service_busy_error()
     new_user = User(
-        email=user_data.email,
+        email=email,
         hashed_password=hashed_password
     )
     
@@ -141,7 +198,11 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db)):
 
 
 @app.post("/token", response_model=Token)
-async def authenticate_for_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def authenticate_for_token(
+    request: Request,
+    form_data: OAuth2PasswordRequestForm = Depends(),
+    db: Session = Depends(get_db)
+):
     """
     Эндпоинт для аутентификации и получения токена доступа.
     
@@ -149,6 +210,7 @@ async def authenticate_for_token(form_data: OAuth2PasswordRequestForm = Depends(
     который проверяет учетные данные пользователя и выдает токен.
     
     Args:
+        request: HTTP запрос (IP клиента для ограничения попыток)
         form_data: Форма с учетными данными (email и password)
         db: Сессия базы данных
         
@@ -156,26 +218,90 @@ async def authenticate_for_token(form_data: OAuth2PasswordRequestForm = Depends(
         JWT токен доступа
         
     Raises:
-        HTTPException: Если учетные данные неверны
+        HTTPException: Если учетные данные неверны, превышен лимит
+            попыток входа (429) или очередь хеширования паролей переполнена (503)
     """
+    # Ограничение попыток - до обращения к базе данных и bcrypt
+    client_ip = resolve_client_ip(request.client.host if request.client else None, request.headers)
+    allowed, retry_after = login_rate_limiter.check(form_data.username, client_ip)
+    if not allowed:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Слишком много попыток входа, повторите попытку позже",
+            headers={"Retry-After": str(retry_after)},
+        )
+    
     # Ищем пользователя по email
-    user = db.query(User).filter(User.email == form_data.username).first()
+    user = db.query(User).filter(User.email == normalize_email(form_data.username)).first()
+    
+    # Проверяем пароль (в пуле процессов, не блокируя цикл событий)
+    password_valid, new_hash = False, None
+    try:
+        if user is not None:
+            password_valid, new_hash = await password_hasher.verify_and_update(
+                form_data.password, user.hashed_password
+            )
+    except PasswordHasherBusyError:
+        raise service_busy_error()
     
-    # Проверяем пароль
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    if not password_valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Неверный email или пароль",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    # Создаем токен доступа
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": user.email}, expires_delta=access_token_expires
-    )
+    login_rate_limiter.succeeded(form_data.username)
+    
+    # Хеш с устаревшей стоимостью заменяем, пока пароль известен
+    if new_hash is not None:
+        user.hashed_password = new_hash
     
-    return {"access_token": access_token, "token_type": "bearer"}
+    # Создаем сессию и токен доступа
+    refresh_token, session_info = session_store.create(db, user)
+    
+    return {
+        "access_token": issue_access_token(session_info),
+        "token_type": "bearer",
+        "refresh_token": refresh_token
+    }
+
+
+@app.post("/token/refresh", response_model=Token)
+async def refresh_access_token(refresh_data: RefreshRequest, db: Session = Depends(get_db)):
+    """
+    Эндпоинт для получения нового токена доступа по refresh токену.
+    
+    Не требует пароля и bcrypt. Refresh токен одноразовый: в ответе
+    выдается новый, а повторное предъявление старого отзывает сессию.
+    
+    Args:
+        refresh_data: Refresh токен
+        db: Сессия базы данных
+        
+    Returns:
+        Новый JWT токен доступа и новый refresh токен
+        
+    Raises:
+        HTTPException: Если refresh токен неизвестен, истек, отозван
+            или уже использован
+    """
+    rotated = session_store.rotate(db, refresh_data.refresh_token)
+    if rotated is None:
+        # Сохраняем отзыв сессии при повторном использовании токена
+        db.commit()
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Недействительный refresh токен",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    
+    refresh_token, session_info = rotated
+    return {
+        "access_token": issue_access_token(session_info),
+        "token_type": "bearer",
+        "refresh_token": refresh_token
+    }
 
 
 @app.get("/users/me", response_model=UserResponse)
@@ -196,10 +322,8 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
     Raises:
         HTTPException: Если токен недействителен или пользователь не найден
     """
-    from security import verify_token
-    
-    # Проверяем токен
-    payload = verify_token(token)
+    # Проверяем токен (декодированные токены кешируются)
+    payload = token_verifier.verify(token)
     if payload is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -207,16 +331,21 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    email: str = payload.get("sub")
-    if email is None:
+    # Получаем пользователя из базы данных: по ID, а для токенов,
+    # выпущенных до добавления ID, - по email
+    user_id = payload.get("user_id")
+    email = payload.get("sub")
+    if user_id is not None:
+        user = db.get(User, int(user_id))
+    elif email is not None:
+        user = db.query(User).filter(User.email == email).first()
+    else:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Недействительный токен",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    # Получаем пользователя из базы данных
-    user = db.query(User).filter(User.email == email).first()
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -227,6 +356,40 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
     return UserResponse.from_orm(user)
 
 
+@app.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+async def logout(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    """
+    Эндпоинт для выхода из системы - отзыв текущего токена доступа
+    и его сессии (refresh токена).
+    
+    Токен перестает приниматься этим процессом сразу, а остальными
+    сервисами - после ближайшей загрузки списка отзывов.
+    
+    Args:
+        token: JWT токен доступа
+        db: Сессия базы данных
+        
+    Raises:
+        HTTPException: Если токен недействителен или выпущен без идентификатора
+    """
+    payload = token_verifier.verify(token)
+    if payload is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Недействительный токен",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    
+    if not revoke_token(db, payload):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Токен не поддерживает отзыв, дождитесь истечения его срока"
+        )
+    
+    if payload.get("sid") is not None:
+        session_store.revoke(db, int(payload["sid"]))
+
+
 @app.get("/health")
 async def health_check():
     """
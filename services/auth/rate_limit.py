@@ -0,0 +1,185 @@
+"""
+Ограничение частоты попыток входа.
+
+Каждая попытка /token стоит десятки миллисекунд процессора на bcrypt,
+поэтому перебор паролей - это и атака на доступность сервиса. Попытки
+считаются по email и по IP клиента скользящим окном и проверяются до
+обращения к базе данных и хеширования: отказ стоит микросекунды.
+
+Скользящее окно приближается двумя фиксированными: счетчик текущего окна
+плюс счетчик предыдущего с весом оставшейся в окне доли. На ключ
+хранятся три числа, а ключи без попыток за последние два окна
+вытесняются автоматически.
+
+IP клиента - адрес TCP-соединения. За обратным прокси все запросы
+приходят с его адреса, поэтому IP берется из заголовка прокси
+(AUTH_TRUSTED_PROXY_HEADER), если соединение установлено доверенным
+прокси (AUTH_TRUSTED_PROXIES). Без этих настроек сервис должен быть
+доступен клиентам напрямую.
+"""
+
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Mapping, Optional, Tuple
+
+from security import normalize_email
+
+# Попытки входа для одного email
+LOGIN_EMAIL_LIMIT = int(os.getenv("AUTH_LOGIN_EMAIL_LIMIT", "10"))
+LOGIN_EMAIL_WINDOW = int(os.getenv("AUTH_LOGIN_EMAIL_WINDOW", "900"))
+# Попытки входа с одного IP
+LOGIN_IP_LIMIT = int(os.getenv("AUTH_LOGIN_IP_LIMIT", "50"))
+LOGIN_IP_WINDOW = int(os.getenv("AUTH_LOGIN_IP_WINDOW", "300"))
+# Максимум отслеживаемых ключей в каждом ограничителе
+LOGIN_LIMITER_MAX_KEYS = int(os.getenv("AUTH_LOGIN_LIMITER_MAX_KEYS", "100000"))
+# Заголовок с IP клиента, который выставляет обратный прокси (например, X-Forwarded-For); пусто - не читать
+TRUSTED_PROXY_HEADER = os.getenv("AUTH_TRUSTED_PROXY_HEADER", "").strip()
+# Адреса доверенных прокси через запятую; пусто - заголовку доверяют от любого соединения
+TRUSTED_PROXIES = frozenset(
+    address.strip() for address in os.getenv("AUTH_TRUSTED_PROXIES", "").split(",") if address.strip()
+)
+
+
+def resolve_client_ip(
+    peer: Optional[str],
+    headers: Mapping[str, str],
+    header_name: str = TRUSTED_PROXY_HEADER,
+    trusted_proxies: frozenset = TRUSTED_PROXIES
+) -> str:
+    """
+    Определяет IP клиента для ограничения попыток.
+
+    Args:
+        peer: Адрес TCP-соединения
+        headers: Заголовки запроса
+        header_name: Заголовок прокси с IP клиента
+        trusted_proxies: Адреса доверенных прокси
+
+    Returns:
+        IP клиента
+    """
+    peer = peer or "unknown"
+    if not header_name or (trusted_proxies and peer not in trusted_proxies):
+        return peer
+    addresses = [address.strip() for address in headers.get(header_name, "").split(",") if address.strip()]
+    # Каждый прокси дописывает адрес справа: клиент - самый правый адрес,
+    # не принадлежащий доверенным прокси (левые части может подделать клиент)
+    for address in reversed(addresses):
+        if address not in trusted_proxies:
+            return address
+    return addresses[0] if addresses else peer
+
+
+class SlidingWindowLimiter:
+    """Ограничитель частоты по ключу со скользящим окном"""
+
+    def __init__(
+        self,
+        limit: int,
+        window_seconds: int,
+        max_keys: int = LOGIN_LIMITER_MAX_KEYS,
+        clock=time.monotonic
+    ):
+        self.limit = limit
+        self.window_seconds = window_seconds
+        self.max_keys = max_keys
+        self._clock = clock
+        # Ключ -> [номер окна, попыток в окне, попыток в предыдущем окне];
+        # порядок - по времени последней попытки
+        self._entries: "OrderedDict[str, List[int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _evict(self, window: int) -> None:
+        while self._entries:
+            entry = next(iter(self._entries.values()))
+            if entry[0] >= window - 1 and len(self._entries) <= self.max_keys:
+                break
+            self._entries.popitem(last=False)
+
+    def hit(self, key: str) -> float:
+        """
+        Регистрирует попытку, если лимит не превышен.
+
+        Отклоненные попытки не считаются.
+
+        Args:
+            key: Ключ (email или IP)
+
+        Returns:
+            0, если попытка разрешена, иначе - через сколько секунд повторить
+        """
+        now = self._clock()
+        window, offset = divmod(now, self.window_seconds)
+        window = int(window)
+        weight = 1 - offset / self.window_seconds
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < window - 1:
+                current, previous = 0, 0
+            elif entry[0] == window - 1:
+                current, previous = 0, entry[1]
+            else:
+                current, previous = entry[1], entry[2]
+
+            if previous * weight + current + 1 > self.limit:
+                return self._retry_after(current, previous, offset)
+
+            if entry is None:
+                self._entries[key] = [window, current + 1, previous]
+            else:
+                entry[:] = [window, current + 1, previous]
+                self._entries.move_to_end(key)
+            self._evict(window)
+        return 0.0
+
+    def _retry_after(self, current: int, previous: int, offset: float) -> float:
+        remaining = self.window_seconds - offset
+        if current + 1 > self.limit:
+            # До конца окна попытки текущего окна не освободятся
+            return remaining
+        # Вес предыдущего окна должен упасть до (limit - current - 1) / previous
+        allowed_weight = (self.limit - current - 1) / previous
+        return max(remaining - allowed_weight * self.window_seconds, 0.001)
+
+    def reset(self, key: str) -> None:
+        """Сбрасывает счетчик ключа"""
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class LoginRateLimiter:
+    """Ограничение попыток входа по email и по IP клиента"""
+
+    def __init__(self, by_email: SlidingWindowLimiter, by_ip: SlidingWindowLimiter):
+        self.by_email = by_email
+        self.by_ip = by_ip
+
+    def check(self, email: str, client_ip: str) -> Tuple[bool, int]:
+        """
+        Регистрирует попытку входа.
+
+        Returns:
+            (разрешена ли попытка, Retry-After в секундах для отказа)
+        """
+        retry_after = self.by_ip.hit(client_ip)
+        if not retry_after:
+            retry_after = self.by_email.hit(normalize_email(email))
+        return not retry_after, math.ceil(retry_after)
+
+    def succeeded(self, email: str) -> None:
+        """Сбрасывает счетчик email после успешного входа"""
+        self.by_email.reset(normalize_email(email))
+
+
+# Ограничитель процесса
+login_rate_limiter = LoginRateLimiter(
+    by_email=SlidingWindowLimiter(LOGIN_EMAIL_LIMIT, LOGIN_EMAIL_WINDOW),
+    by_ip=SlidingWindowLimiter(LOGIN_IP_LIMIT, LOGIN_IP_WINDOW),
+)
@@ -1,16 +1,44 @@
 from datetime import datetime, timedelta
-from typing import Optional
-from jose import JWTError, jwt
+from typing import Optional, Tuple
+from jose import jwt
 from passlib.context import CryptContext
+import secrets
+import sys
 import os
 
+# Добавляем путь к корневой директории проекта для импорта общих модулей
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from auth_tokens import SECRET_KEY, ALGORITHM, decode_token
+
 # Настройки безопасности
-SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-here-change-in-production")
-ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 30
+# Короткий срок: токен обновляется по refresh токену (см. sessions.py)
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("AUTH_ACCESS_TOKEN_EXPIRE_MINUTES", "15"))
+
+# Стоимость bcrypt (log2 числа раундов); подбирается под оборудование
+# командой python calibrate_hash.py
+BCRYPT_ROUNDS = int(os.getenv("AUTH_BCRYPT_ROUNDS", "12"))
+
+# Контекст для хеширования паролей; min/max_rounds равны стоимости, чтобы
+# needs_update отмечал хеши с любой другой стоимостью
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
+
 
-# Контекст для хеширования паролей
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+def normalize_email(email: str) -> str:
+    """
+    Приводит email к виду, в котором он хранится и сравнивается.
+    
+    Уникальный индекс users.email в MySQL не различает регистр, поэтому
+    регистрация, вход, ограничение попыток и импорт сравнивают email
+    в нижнем регистре.
+    """
+    return email.strip().lower()
 
 
 def get_password_hash(password: str) -> str:
@@ -40,6 +68,24 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 
+def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """
+    Проверяет пароль и при необходимости пересчитывает хеш.
+    
+    Хеш пересчитывается, если он создан с другой стоимостью или устаревшей
+    схемой (needs_update контекста) - так изменение AUTH_BCRYPT_ROUNDS
+    применяется при входе, без сброса паролей.
+    
+    Args:
+        plain_password: Пароль в открытом виде
+        hashed_password: Хешированный пароль
+        
+    Returns:
+        (True, если пароли совпадают; новый хеш или None)
+    """
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """
     Создает JWT токен доступа.
@@ -57,7 +103,8 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     else:
         expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     
-    to_encode.update({"exp": expire})
+    # jti - идентификатор токена для отзыва (см. auth_tokens.revocation)
+    to_encode.update({"exp": expire, "jti": secrets.token_hex(16)})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
@@ -72,8 +119,4 @@ def verify_token(token: str) -> Optional[dict]:
     Returns:
         Декодированные данные токена или None, если токен недействителен
     """
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
-    except JWTError:
-        return None
+    return decode_token(token)
@@ -0,0 +1,236 @@
+"""
+Сессии пользователей и refresh токены.
+
+При входе выдается короткоживущий токен доступа и долгоживущий refresh
+токен. Refresh токен - случайная строка; в таблице user_sessions хранится
+только ее HMAC. Обновление токена доступа (/token/refresh) стоит HMAC и
+одного условного UPDATE по уникальному индексу - без bcrypt.
+
+Refresh токен одноразовый: при обновлении выдается новый, а старый
+перестает приниматься. Условие UPDATE (текущий HMAC токена) делает замену
+атомарной, поэтому из двух запросов с одним токеном успешен только один.
+Повторное предъявление уже замененного токена означает, что токен
+скопирован, и сессия отзывается.
+
+Индекс сессий процесса хранит данные сессии (пользователь, email, срок),
+чтобы не читать их соединением таблиц при каждом обновлении; запись
+индекса живет не дольше AUTH_SESSION_INDEX_TTL.
+"""
+
+import asyncio
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from database.connection import create_session
+from database.models import User, UserSession
+from security import SECRET_KEY
+
+# Время жизни refresh токена (дни)
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("AUTH_REFRESH_TOKEN_EXPIRE_DAYS", "30"))
+# Количество сессий в индексе процесса
+SESSION_INDEX_SIZE = int(os.getenv("AUTH_SESSION_INDEX_SIZE", "10000"))
+# Время жизни записи индекса (секунды)
+SESSION_INDEX_TTL = float(os.getenv("AUTH_SESSION_INDEX_TTL", "60"))
+# Интервал удаления истекших сессий из базы данных (секунды)
+SESSION_PURGE_INTERVAL = float(os.getenv("AUTH_SESSION_PURGE_INTERVAL", "3600"))
+
+
+class SessionInfo(NamedTuple):
+    """Данные сессии, достаточные для выпуска токена доступа"""
+    session_id: int
+    user_id: int
+    email: str
+    expires_at: datetime
+
+
+def hash_refresh_token(token: str) -> str:
+    """HMAC-SHA256 refresh токена (ключ - SECRET_KEY)"""
+    return hmac.new(SECRET_KEY.encode("utf-8"), token.encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+class SessionIndex:
+    """LRU-индекс сессий процесса: HMAC токена -> данные сессии"""
+
+    def __init__(self, max_size: int = SESSION_INDEX_SIZE, ttl: float = SESSION_INDEX_TTL, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._clock = clock
+        self._entries: "OrderedDict[str, Tuple[SessionInfo, float]]" = OrderedDict()
+        self._by_session: Dict[int, str] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, token_hash: str) -> Optional[SessionInfo]:
+        with self._lock:
+            entry = self._entries.get(token_hash)
+            if entry is None:
+                return None
+            info, cached_until = entry
+            if cached_until <= self._clock() or info.expires_at <= datetime.utcnow():
+                self._remove(token_hash)
+                return None
+            self._entries.move_to_end(token_hash)
+            return info
+
+    def put(self, token_hash: str, info: SessionInfo) -> None:
+        with self._lock:
+            self._entries[token_hash] = (info, self._clock() + self.ttl)
+            self._entries.move_to_end(token_hash)
+            self._by_session[info.session_id] = token_hash
+            while len(self._entries) > self.max_size:
+                oldest, _ = next(iter(self._entries.items()))
+                self._remove(oldest)
+
+    def discard_session(self, session_id: int) -> None:
+        with self._lock:
+            token_hash = self._by_session.get(session_id)
+            if token_hash is not None:
+                self._remove(token_hash)
+
+    def _remove(self, token_hash: str) -> None:
+        info, _ = self._entries.pop(token_hash)
+        self._by_session.pop(info.session_id, None)
+
+
+class SessionStore:
+    """Создание, проверка и отзыв сессий"""
+
+    def __init__(self, index: Optional[SessionIndex] = None):
+        self.index = index if index is not None else SessionIndex()
+
+    def create(self, db, user: User) -> Tuple[str, SessionInfo]:
+        """
+        Создает сессию пользователя.
+
+        Args:
+            db: Сессия базы данных (фиксируется вызывающим кодом)
+            user: Пользователь
+
+        Returns:
+            (refresh токен, данные сессии)
+        """
+        refresh_token = secrets.token_urlsafe(32)
+        token_hash = hash_refresh_token(refresh_token)
+        now = datetime.utcnow()
+        session = UserSession(
+            user_id=user.id,
+            token_hash=token_hash,
+            created_at=now,
+            expires_at=now + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
+        )
+        db.add(session)
+        db.flush()
+
+        info = SessionInfo(session.id, user.id, user.email, session.expires_at)
+        self.index.put(token_hash, info)
+        return refresh_token, info
+
+    def _find(self, db, token_hash: str) -> Optional[SessionInfo]:
+        info = self.index.get(token_hash)
+        if info is not None:
+            return info
+        row = (
+            db.query(UserSession.id, UserSession.user_id, User.email, UserSession.expires_at)
+            .join(User, User.id == UserSession.user_id)
+            .filter(UserSession.token_hash == token_hash)
+            .first()
+        )
+        return SessionInfo(*row) if row is not None else None
+
+    def rotate(self, db, refresh_token: str) -> Optional[Tuple[str, SessionInfo]]:
+        """
+        Заменяет refresh токен действующей сессии новым.
+
+        Повторно предъявленный замененный токен отзывает сессию.
+
+        Args:
+            db: Сессия базы данных (фиксируется вызывающим кодом, в том
+                числе при отказе - чтобы сохранить отзыв сессии)
+            refresh_token: Текущий refresh токен
+
+        Returns:
+            (новый refresh токен, данные сессии) или None, если токен
+            неизвестен, истек, отозван или уже использован
+        """
+        token_hash = hash_refresh_token(refresh_token)
+        info = self._find(db, token_hash)
+        if info is None:
+            self._revoke_reused(db, token_hash)
+            return None
+
+        new_token = secrets.token_urlsafe(32)
+        new_hash = hash_refresh_token(new_token)
+        rotated = db.query(UserSession).filter(
+            UserSession.id == info.session_id,
+            UserSession.token_hash == token_hash,
+            UserSession.revoked_at.is_(None),
+            UserSession.expires_at > datetime.utcnow()
+        ).update(
+            {UserSession.token_hash: new_hash, UserSession.previous_token_hash: token_hash},
+            synchronize_session=False
+        )
+        self.index.discard_session(info.session_id)
+        if not rotated:
+            # Токен уже заменен параллельным запросом, сессия отозвана или истекла
+            self._revoke_reused(db, token_hash)
+            return None
+
+        self.index.put(new_hash, info)
+        return new_token, info
+
+    def _revoke_reused(self, db, token_hash: str) -> None:
+        session_id = (
+            db.query(UserSession.id)
+            .filter(UserSession.previous_token_hash == token_hash, UserSession.revoked_at.is_(None))
+            .scalar()
+        )
+        if session_id is not None:
+            print(f"⚠️ Повторное использование refresh токена сессии {session_id} - сессия отозвана")
+            self.revoke(db, session_id)
+
+    def revoke(self, db, session_id: int) -> None:
+        """Отзывает сессию (фиксируется вызывающим кодом)"""
+        db.query(UserSession).filter(
+            UserSession.id == session_id,
+            UserSession.revoked_at.is_(None)
+        ).update({UserSession.revoked_at: datetime.utcnow()}, synchronize_session=False)
+        self.index.discard_session(session_id)
+
+
+def purge_expired_sessions(db) -> int:
+    """Удаляет из базы данных истекшие сессии"""
+    return db.query(UserSession).filter(
+        UserSession.expires_at <= datetime.utcnow()
+    ).delete(synchronize_session=False)
+
+
+def _purge_with_session() -> None:
+    session = create_session()
+    try:
+        purge_expired_sessions(session)
+        session.commit()
+    finally:
+        session.close()
+
+
+async def purge_sessions_periodically(interval: float = SESSION_PURGE_INTERVAL) -> None:
+    """Периодически удаляет истекшие сессии (задача в lifespan сервиса)"""
+    while True:
+        try:
+            await asyncio.to_thread(_purge_with_session)
+        except Exception as e:
+            print(f"❌ Не удалось удалить истекшие сессии: {str(e)}")
+        await asyncio.sleep(interval)
+
+
+# Сессии процесса
+session_store = SessionStore()
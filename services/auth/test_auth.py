@@ -0,0 +1,499 @@
+#!/usr/bin/env python3
+"""
+Тесты для микросервиса 'Аутентификация'
+"""
+
+import pytest
+import asyncio
+import bcrypt
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from fastapi.testclient import TestClient
+from unittest.mock import AsyncMock, patch
+
+# Небольшая стоимость bcrypt, чтобы тесты выполнялись быстро
+os.environ.setdefault("AUTH_BCRYPT_ROUNDS", "5")
+
+# Добавляем корневую директорию проекта в путь
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+# Модули сервиса импортируются по плоским именам; main другого сервиса,
+# загруженный тестами из того же запуска pytest, убираем из кэша импортов
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.modules.pop("main", None)
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import database.connection
+from database.models import Base, User
+
+# main создает таблицы при импорте - подменяем MySQL на in-memory SQLite
+test_engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+database.connection.get_engine = lambda: test_engine
+TestSession = sessionmaker(bind=test_engine)
+
+import main
+from main import app
+from database.connection import get_db
+from hashing import PasswordHasher, PasswordHasherBusyError
+from bulk_import import UserImporter
+from rate_limit import SlidingWindowLimiter, LoginRateLimiter, resolve_client_ip
+from sessions import SessionIndex, SessionInfo
+from security import get_password_hash, BCRYPT_ROUNDS
+
+
+def override_get_db():
+    session = TestSession()
+    try:
+        yield session
+        session.commit()
+    finally:
+        session.close()
+
+
+app.dependency_overrides[get_db] = override_get_db
+
+
+@pytest.fixture(autouse=True)
+def clean_database():
+    """Пустые таблицы для каждого теста"""
+    Base.metadata.drop_all(test_engine)
+    Base.metadata.create_all(test_engine)
+    yield
+
+
+@pytest.fixture
+def client():
+    return TestClient(app)
+
+
+# Функции выполняются в процессах пула, поэтому объявлены на уровне модуля
+
+def _slow_double(value: int) -> int:
+    time.sleep(0.5)
+    return value * 2
+
+
+def _crash_once(marker: str) -> str:
+    """Первый вызов аварийно завершает процесс пула, повторный - возвращает ответ"""
+    if not os.path.exists(marker):
+        open(marker, "w").close()
+        os._exit(1)
+    return "ok"
+
+
+class TestPasswordHasher:
+    """Тесты для хеширования паролей в пуле процессов"""
+
+    def test_rejects_requests_over_queue_limit(self):
+        """Запрос сверх лимита очереди сразу получает отказ"""
+        hasher = PasswordHasher(workers=1, max_pending=1)
+
+        async def scenario():
+            first = asyncio.create_task(hasher._run(_slow_double, 2))
+            await asyncio.sleep(0)
+            assert hasher.pending == 1
+            with pytest.raises(PasswordHasherBusyError):
+                await hasher._run(_slow_double, 3)
+            assert await first == 4
+            assert hasher.pending == 0
+
+        try:
+            asyncio.run(scenario())
+        finally:
+            hasher.shutdown()
+
+    def test_broken_pool_is_replaced(self, tmp_path):
+        """После аварии процесса пул пересоздается, старый останавливается"""
+        hasher = PasswordHasher(workers=1, max_pending=4)
+        try:
+            broken = hasher._get_executor()
+            result = asyncio.run(hasher._run(_crash_once, str(tmp_path / "crashed")))
+            assert result == "ok"
+            assert hasher._executor is not None
+            assert hasher._executor is not broken
+            assert broken._shutdown_thread
+        finally:
+            hasher.shutdown()
+
+    def test_broken_pool_replaced_once(self):
+        """Запрос, получивший ошибку сломанного пула позже, не заменяет уже новый пул"""
+        hasher = PasswordHasher(workers=1, max_pending=4)
+        try:
+            broken = hasher._get_executor()
+            hasher._replace_broken(broken)
+            replacement = hasher._get_executor()
+
+            hasher._replace_broken(broken)
+            assert hasher._executor is replacement
+        finally:
+            hasher.shutdown()
+
+    def test_busy_hasher_returns_503(self, client):
+        """Переполненная очередь хеширования - 503 с Retry-After"""
+        busy = AsyncMock(side_effect=PasswordHasherBusyError("busy"))
+        with patch.object(main.password_hasher, "hash", busy):
+            response = client.post("/register", json={"email": "user@example.com", "password": "secret123"})
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
+
+        with patch.object(main.password_hasher, "verify_and_update", busy):
+            client.post("/register", json={"email": "user@example.com", "password": "secret123"})
+            response = client.post("/token", data={"username": "user@example.com", "password": "secret123"})
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
+
+
+class TestBulkImport:
+    """Тесты для массового импорта пользователей"""
+
+    def make_importer(self, session, chunk_size=2):
+        return UserImporter(session, ThreadPoolExecutor(max_workers=2), chunk_size=chunk_size)
+
+    def test_imports_in_chunks(self):
+        """Записи импортируются и фиксируются пачками"""
+        session = TestSession()
+        importer = self.make_importer(session)
+        records = [{"email": f"user{index}@example.com", "password": "secret"} for index in range(5)]
+        records.append({"email": "hashed@example.com", "hashed_password": get_password_hash("secret")})
+
+        with patch.object(importer, "import_chunk", wraps=importer.import_chunk) as import_chunk:
+            stats = importer.run(records)
+
+        assert import_chunk.call_count == 3
+        assert stats["imported"] == 6
+        assert session.query(User).count() == 6
+        session.close()
+
+    def test_deduplicates_emails_case_insensitively(self):
+        """Повторы email в файле и уже зарегистрированные email не импортируются"""
+        session = TestSession()
+        session.add(User(email="existing@example.com", hashed_password=get_password_hash("secret")))
+        session.commit()
+
+        stats = self.make_importer(session).run([
+            {"email": "User@Example.com", "password": "secret"},
+            {"email": " user@example.com ", "password": "other"},
+            {"email": "EXISTING@example.com", "password": "secret"},
+            {"email": "not-an-email", "password": "secret"},
+            {"email": "nopassword@example.com"},
+        ])
+
+        assert stats == {"imported": 1, "existing": 1, "duplicates": 1, "invalid": 2, "failed": 0}
+        assert [email for (email,) in session.query(User.email).order_by(User.email)] == [
+            "existing@example.com", "user@example.com"
+        ]
+        session.close()
+
+    def test_legacy_mixed_case_email_counted_as_existing(self):
+        """Email, сохраненный до нормализации в исходном регистре, считается существующим"""
+        session = TestSession()
+        session.add(User(email="Legacy@Example.com", hashed_password="x"))
+        session.commit()
+
+        with patch("bulk_import.get_password_hash", wraps=get_password_hash) as hash_password:
+            stats = self.make_importer(session).run([
+                {"email": "legacy@example.com", "password": "secret"},
+                {"email": "fresh@example.com", "password": "secret"},
+            ])
+
+        assert stats["existing"] == 1
+        assert stats["failed"] == 0
+        assert stats["imported"] == 1
+        # Пароль существующего пользователя не хешируется
+        hash_password.assert_called_once_with("secret")
+        assert session.query(User).filter(User.email.in_(["Legacy@Example.com", "legacy@example.com"])).count() == 1
+        session.close()
+
+    def test_concurrent_registration_falls_back_to_rows(self):
+        """Email, зарегистрированный во время импорта, отклоняет только свою строку"""
+        session = TestSession()
+        importer = self.make_importer(session, chunk_size=10)
+        real_existing = importer._existing_emails
+        calls = []
+
+        def existing_emails(emails):
+            calls.append(emails)
+            if len(calls) == 1:
+                # Пользователь регистрируется между проверкой и вставкой пачки
+                other = TestSession()
+                other.add(User(email="race@example.com", hashed_password="x"))
+                other.commit()
+                other.close()
+                return set()
+            return real_existing(emails)
+
+        records = [{"email": email, "password": "secret"} for email in ("a@example.com", "race@example.com", "b@example.com")]
+        with patch.object(importer, "_existing_emails", side_effect=existing_emails), \
+                patch("bulk_import.get_password_hash", wraps=get_password_hash) as hash_password:
+            stats = importer.run(records)
+
+        assert stats["imported"] == 2
+        assert stats["existing"] == 1
+        assert stats["failed"] == 0
+        # Хеши, вычисленные для первой попытки, не пересчитываются
+        assert hash_password.call_count == 3
+        assert session.query(User).count() == 3
+        session.close()
+
+    def test_row_conflicts_counted_as_failed(self):
+        """Строка, отклоненная при построчной вставке, учитывается как ошибка"""
+        session = TestSession()
+        importer = self.make_importer(session, chunk_size=10)
+        session.add(User(email="taken@example.com", hashed_password="x"))
+        session.commit()
+
+        records = [{"email": email, "password": "secret"} for email in ("a@example.com", "taken@example.com")]
+        # Проверка существующих email ничего не находит - конфликт видит только вставка
+        with patch.object(importer, "_existing_emails", return_value=set()):
+            stats = importer.run(records)
+
+        assert stats["imported"] == 1
+        assert stats["failed"] == 1
+        assert stats["existing"] == 0
+        session.close()
+
+
+
+class TestSlidingWindowLimiter:
+    """Тесты для ограничения попыток скользящим окном"""
+
+    def make_limiter(self, now, limit=10, max_keys=100):
+        return SlidingWindowLimiter(limit, 100, max_keys=max_keys, clock=lambda: now[0])
+
+    def test_limit_within_window(self):
+        """Сверх лимита попытки отклоняются до конца окна и не считаются"""
+        now = [50.0]
+        limiter = self.make_limiter(now)
+        assert all(limiter.hit("key") == 0 for _ in range(10))
+        assert limiter.hit("key") == pytest.approx(50)
+        assert limiter.hit("key") == pytest.approx(50)
+        assert limiter.hit("other") == 0
+
+    def test_previous_window_weighted_by_remaining_share(self):
+        """Попытки предыдущего окна учитываются с весом оставшейся доли окна"""
+        now = [50.0]
+        limiter = self.make_limiter(now)
+        for _ in range(10):
+            limiter.hit("key")
+
+        # Середина следующего окна: 10 * 0.5 + текущие попытки <= 10
+        now[0] = 150.0
+        assert all(limiter.hit("key") == 0 for _ in range(5))
+        # Следующая попытка станет возможна, когда вес упадет до 0.4
+        assert limiter.hit("key") == pytest.approx(10)
+
+        now[0] = 160.0
+        assert limiter.hit("key") == 0
+        assert limiter.hit("key") > 0
+
+    def test_current_window_full_waits_until_window_end(self):
+        """Если лимит исчерпан попытками текущего окна, ждать нужно до его конца"""
+        now = [110.0]
+        limiter = self.make_limiter(now, limit=3)
+        for _ in range(3):
+            limiter.hit("key")
+        assert limiter.hit("key") == pytest.approx(90)
+
+    def test_counters_forgotten_after_two_windows(self):
+        """Через два окна попытки забываются, ключ вытесняется"""
+        now = [50.0]
+        limiter = self.make_limiter(now)
+        for _ in range(10):
+            limiter.hit("key")
+
+        now[0] = 250.0
+        assert all(limiter.hit("key") == 0 for _ in range(10))
+        now[0] = 450.0
+        limiter.hit("other")
+        assert len(limiter) == 1
+
+    def test_max_keys_evicts_oldest(self):
+        """При превышении числа ключей вытесняются давние"""
+        now = [0.0]
+        limiter = self.make_limiter(now, max_keys=2)
+        for key in ("a", "b", "c"):
+            limiter.hit(key)
+        assert len(limiter) == 2
+
+    def test_successful_login_resets_email(self):
+        """Успешный вход сбрасывает счетчик email, но не IP"""
+        now = [0.0]
+        login_limiter = LoginRateLimiter(
+            by_email=self.make_limiter(now, limit=2),
+            by_ip=self.make_limiter(now, limit=3)
+        )
+        assert login_limiter.check("User@Example.com", "10.0.0.1") == (True, 0)
+        assert login_limiter.check("user@example.com", "10.0.0.1") == (True, 0)
+        assert login_limiter.check("user@example.com", "10.0.0.1") == (False, 100)
+
+        login_limiter.succeeded("USER@example.com ")
+        assert login_limiter.check("user@example.com", "10.0.0.1") == (False, 100)
+        assert login_limiter.check("user@example.com", "10.0.0.2") == (True, 0)
+
+
+class TestClientIp:
+    """Тесты для определения IP клиента"""
+
+    def test_peer_address_without_proxy_header(self):
+        """Без настроенного заголовка используется адрес соединения"""
+        headers = {"X-Forwarded-For": "1.2.3.4"}
+        assert resolve_client_ip("10.0.0.5", headers, header_name="") == "10.0.0.5"
+        assert resolve_client_ip(None, {}, header_name="") == "unknown"
+
+    def test_forwarded_header_from_trusted_proxy(self):
+        """От доверенного прокси берется самый правый недоверенный адрес"""
+        proxies = frozenset({"10.0.0.1", "10.0.0.2"})
+        headers = {"X-Forwarded-For": "6.6.6.6, 1.2.3.4, 10.0.0.2"}
+        assert resolve_client_ip("10.0.0.1", headers, "X-Forwarded-For", proxies) == "1.2.3.4"
+        # Заголовок от недоверенного соединения игнорируется
+        assert resolve_client_ip("5.5.5.5", headers, "X-Forwarded-For", proxies) == "5.5.5.5"
+        # Нет заголовка - адрес прокси
+        assert resolve_client_ip("10.0.0.1", {}, "X-Forwarded-For", proxies) == "10.0.0.1"
+
+    def test_forwarded_header_without_proxy_list(self):
+        """Без списка прокси заголовку доверяют от любого соединения"""
+        headers = {"X-Real-IP": "1.2.3.4"}
+        assert resolve_client_ip("10.0.0.1", headers, "X-Real-IP", frozenset()) == "1.2.3.4"
+
+
+
+def login(client, email="user@example.com", password="secret123") -> dict:
+    client.post("/register", json={"email": email, "password": password})
+    response = client.post("/token", data={"username": email, "password": password})
+    assert response.status_code == 200
+    return response.json()
+
+
+class TestSessions:
+    """Тесты для refresh токенов и выхода"""
+
+    def test_refresh_rotates_token(self, client):
+        """Обновление выдает новый refresh токен, старый больше не принимается"""
+        tokens = login(client)
+        response = client.post("/token/refresh", json={"refresh_token": tokens["refresh_token"]})
+        assert response.status_code == 200
+        rotated = response.json()
+        assert rotated["refresh_token"] != tokens["refresh_token"]
+        assert client.get("/users/me", headers={"Authorization": f"Bearer {rotated['access_token']}"}).status_code == 200
+
+        response = client.post("/token/refresh", json={"refresh_token": rotated["refresh_token"]})
+        assert response.status_code == 200
+
+    def test_reused_refresh_token_revokes_session(self, client):
+        """Повторное использование замененного токена отзывает сессию"""
+        tokens = login(client)
+        rotated = client.post("/token/refresh", json={"refresh_token": tokens["refresh_token"]}).json()
+
+        response = client.post("/token/refresh", json={"refresh_token": tokens["refresh_token"]})
+        assert response.status_code == 401
+        # Новый токен сессии тоже больше не действует
+        response = client.post("/token/refresh", json={"refresh_token": rotated["refresh_token"]})
+        assert response.status_code == 401
+
+    def test_unknown_refresh_token_rejected(self, client):
+        """Неизвестный refresh токен отклоняется"""
+        login(client)
+        assert client.post("/token/refresh", json={"refresh_token": "unknown"}).status_code == 401
+
+    def test_logout_revokes_access_and_refresh_tokens(self, client):
+        """После выхода не принимаются ни токен доступа, ни refresh токен"""
+        tokens = login(client)
+        headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+        assert client.post("/logout", headers=headers).status_code == 204
+
+        assert client.get("/users/me", headers=headers).status_code == 401
+        response = client.post("/token/refresh", json={"refresh_token": tokens["refresh_token"]})
+        assert response.status_code == 401
+
+
+class TestSessionIndex:
+    """Тесты для индекса сессий процесса"""
+
+    def make_info(self, session_id: int, expires_in: timedelta = timedelta(days=1)) -> SessionInfo:
+        return SessionInfo(session_id, 1, "user@example.com", datetime.utcnow() + expires_in)
+
+    def test_entries_expire_after_ttl(self):
+        """Запись индекса живет не дольше ttl и не дольше сессии"""
+        now = [0.0]
+        index = SessionIndex(max_size=10, ttl=60, clock=lambda: now[0])
+        index.put("a", self.make_info(1))
+        index.put("b", self.make_info(2, expires_in=timedelta(seconds=-1)))
+
+        assert index.get("a").session_id == 1
+        assert index.get("b") is None
+        now[0] = 60
+        assert index.get("a") is None
+        assert len(index) == 0
+
+    def test_lru_eviction(self):
+        """При переполнении вытесняется давно использованная запись"""
+        index = SessionIndex(max_size=2, ttl=60)
+        index.put("a", self.make_info(1))
+        index.put("b", self.make_info(2))
+        index.get("a")
+        index.put("c", self.make_info(3))
+
+        assert index.get("b") is None
+        assert index.get("a") is not None
+        assert index.get("c") is not None
+
+    def test_discard_session(self):
+        """Запись удаляется по ID сессии"""
+        index = SessionIndex(max_size=10, ttl=60)
+        index.put("a", self.make_info(1))
+        index.discard_session(1)
+        index.discard_session(2)
+        assert index.get("a") is None
+
+
+
+class TestPasswordRehash:
+    """Тесты для пересчета хешей с устаревшей стоимостью"""
+
+    def test_login_upgrades_hash_cost(self, client):
+        """Вход с хешем меньшей стоимости заменяет его хешем с BCRYPT_ROUNDS"""
+        old_rounds = 4
+        assert old_rounds != BCRYPT_ROUNDS
+        old_hash = bcrypt.hashpw(b"secret123", bcrypt.gensalt(rounds=old_rounds)).decode()
+        session = TestSession()
+        session.add(User(email="user@example.com", hashed_password=old_hash))
+        session.commit()
+
+        response = client.post("/token", data={"username": "user@example.com", "password": "secret123"})
+        assert response.status_code == 200
+
+        session.expire_all()
+        new_hash = session.query(User.hashed_password).filter(User.email == "user@example.com").scalar()
+        assert new_hash != old_hash
+        assert int(new_hash.split("$")[2]) == BCRYPT_ROUNDS
+        assert bcrypt.checkpw(b"secret123", new_hash.encode())
+        session.close()
+
+        # Повторный вход хеш не меняет
+        client.post("/token", data={"username": "user@example.com", "password": "secret123"})
+        session = TestSession()
+        assert session.query(User.hashed_password).filter(User.email == "user@example.com").scalar() == new_hash
+        session.close()
+
+    def test_failed_login_keeps_hash(self, client):
+        """Неверный пароль не меняет хеш"""
+        old_hash = bcrypt.hashpw(b"secret123", bcrypt.gensalt(rounds=4)).decode()
+        session = TestSession()
+        session.add(User(email="user@example.com", hashed_password=old_hash))
+        session.commit()
+
+        response = client.post("/token", data={"username": "user@example.com", "password": "wrong"})
+        assert response.status_code == 401
+        session.expire_all()
+        assert session.query(User.hashed_password).filter(User.email == "user@example.com").scalar() == old_hash
+        session.close()
+
+
+if __name__ == "__main__":
+    print("🧪 Запуск тестов микросервиса 'Аутентификация'...")
+    pytest.main([__file__, "-v"])
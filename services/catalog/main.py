@@ -6,8 +6,9 @@
 # - Систему отзывов и рейтингов
 # - Рекомендации похожих книг
 
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Request, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, JSONResponse, Response
 from sqlalchemy.orm import Session
 from typing import List, Optional
 import sys
@@ -21,6 +22,14 @@ from database.repositories import AuthorRepository, CategoryRepository, Audioboo
 from database.services import CatalogDomainService
 from database.connection import get_db, initialize_database, get_database_info
 from schemas import AudiobookCreate, AudiobookUpdate, AudiobookSchema, ErrorResponseSchema
+from media import find_audio_file, audio_cache_headers
+from segments import (
+    ingest_mp3, find_segment, playlist_path, InvalidAudioError, UploadTooLargeError, MAX_UPLOAD_SIZE,
+    PLAYLIST_MEDIA_TYPE, PLAYLIST_CACHE_CONTROL, SEGMENT_MEDIA_TYPE, SEGMENT_CACHE_CONTROL
+)
+import asyncio
+import hashlib
+import tempfile
 
 # Инициализация базы данных
 initialize_database()
@@ -115,14 +124,30 @@ async def create_category(name: str, db: Session = Depends(get_db)):
 @app.get("/audiobooks", response_model=List[dict])
 @app.get("/api/v1/audiobooks", response_model=List[dict])
 async def get_audiobooks(
+    request: Request,
     limit: Optional[int] = None,
     offset: Optional[int] = None,
     db: Session = Depends(get_db)
 ):
-    """Получить все аудиокниги с пагинацией."""
+    """
+    Получить все аудиокниги с пагинацией.
+    
+    Ответ содержит ETag: клиент, периодически перечитывающий каталог,
+    передает его в If-None-Match и при отсутствии изменений получает 304
+    без тела. ETag строится по агрегатам таблиц каталога
+    (AudiobookRepository.get_catalog_version), поэтому 304 отдается без
+    загрузки и сериализации аудиокниг. Часть изменений он не замечает
+    (см. get_catalog_version) - клиенты периодически перечитывают каталог
+    целиком.
+    """
     repo = AudiobookRepository(db)
+    version = (repo.get_catalog_version(), limit, offset)
+    etag = f'"{hashlib.sha256(repr(version).encode("utf-8")).hexdigest()[:32]}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    
     audiobooks = repo.get_all(limit=limit, offset=offset)
-    return [
+    items = [
         {
             "id": ab.id,
             "title": ab.title,
@@ -134,6 +159,7 @@ async def get_audiobooks(
         }
         for ab in audiobooks
     ]
+    return JSONResponse(content=items, headers={"ETag": etag})
 
 
 @app.get("/api/v1/search", response_model=List[dict])
@@ -179,6 +205,117 @@ async def get_audiobook(audiobook_id: int, db: Session = Depends(get_db)):
     }
 
 
+@app.get("/api/v1/audiobooks/{audiobook_id}/preview")
+async def get_audiobook_preview(audiobook_id: int, request: Request):
+    """
+    Аудиофрагмент аудиокниги для прослушивания.
+    
+    Поддерживает запросы Range (перемотка и частичная загрузка): читается
+    только запрошенный диапазон файла, а целиком файл отдается через
+    sendfile, если сервер это поддерживает. Ответ кешируется клиентом
+    (Cache-Control, ETag/Last-Modified); запрос не обращается к базе данных.
+    """
+    audio = find_audio_file(audiobook_id)
+    if audio is None:
+        raise HTTPException(status_code=404, detail="Аудиофрагмент не найден")
+    
+    path, media_type, stat_result = audio
+    response = FileResponse(
+        path,
+        media_type=media_type,
+        headers=audio_cache_headers(),
+        stat_result=stat_result
+    )
+    
+    if request.headers.get("if-none-match") == response.headers["etag"]:
+        return Response(
+            status_code=304,
+            headers={"ETag": response.headers["etag"], **audio_cache_headers()}
+        )
+    return response
+
+
+def _ingest_upload(audiobook_id: int, upload: UploadFile) -> dict:
+    """
+    Сохраняет загруженный файл во временный каталог на диске и нарезает его.
+    
+    Файл закрывается до нарезки (на Windows открытый временный файл нельзя
+    открыть повторно по имени) и удаляется вместе с каталогом.
+    
+    Raises:
+        UploadTooLargeError: Если файл больше MAX_UPLOAD_SIZE
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "upload.mp3")
+        size = 0
+        with open(path, "wb") as tmp:
+            while True:
+                chunk = upload.file.read(1024 * 1024)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > MAX_UPLOAD_SIZE:
+                    raise UploadTooLargeError(
+                        f"Файл больше {MAX_UPLOAD_SIZE // (1024 * 1024)} МБ"
+                    )
+                tmp.write(chunk)
+        return ingest_mp3(audiobook_id, path)
+
+
+@app.post("/api/v1/audiobooks/{audiobook_id}/preview/segments", response_model=dict)
+async def upload_audiobook_preview(
+    audiobook_id: int,
+    file: UploadFile = File(...),
+    db: Session = Depends(get_db)
+):
+    """
+    Загружает MP3 аудиофрагмента и нарезает его на сегменты с плейлистом HLS.
+    
+    Новая версия сегментов заменяет предыдущую атомарно.
+    """
+    repo = AudiobookRepository(db)
+    if not repo.get_by_id(audiobook_id):
+        raise HTTPException(status_code=404, detail="Аудиокнига не найдена")
+    
+    try:
+        result = await asyncio.to_thread(_ingest_upload, audiobook_id, file)
+    except InvalidAudioError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    
+    return {"audiobook_id": audiobook_id, **result}
+
+
+@app.get("/api/v1/audiobooks/{audiobook_id}/preview/playlist.m3u8")
+async def get_audiobook_preview_playlist(audiobook_id: int):
+    """Плейлист HLS сегментов аудиофрагмента"""
+    path = playlist_path(audiobook_id)
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="Плейлист не найден")
+    return FileResponse(
+        path,
+        media_type=PLAYLIST_MEDIA_TYPE,
+        headers={"Cache-Control": PLAYLIST_CACHE_CONTROL}
+    )
+
+
+@app.get("/api/v1/audiobooks/{audiobook_id}/preview/segments/{version}/{segment}")
+async def get_audiobook_preview_segment(audiobook_id: int, version: str, segment: str):
+    """Сегмент аудиофрагмента (неизменяемый, кешируется навсегда)"""
+    found = find_segment(audiobook_id, version, segment)
+    if found is None:
+        raise HTTPException(status_code=404, detail="Сегмент не найден")
+    
+    path, stat_result = found
+    return FileResponse(
+        path,
+        media_type=SEGMENT_MEDIA_TYPE,
+        headers={"Cache-Control": SEGMENT_CACHE_CONTROL},
+        stat_result=stat_result
+    )
+
+
 @app.post("/api/v1/audiobooks", response_model=dict)
 async def create_audiobook(audiobook_data: AudiobookCreate, db: Session = Depends(get_db)):
     """Создать новую аудиокнигу."""
@@ -0,0 +1,53 @@
+"""
+Хранилище аудиофрагментов каталога для прослушивания.
+
+Файлы фрагментов лежат в локальном каталоге и адресуются по ID аудиокниги:
+CATALOG_AUDIO_DIR/<audiobook_id>.mp3 (а также .m4a, .ogg, .opus).
+"""
+
+import os
+import stat
+from typing import Optional, Tuple
+
+# Каталог аудиофрагментов
+AUDIO_STORAGE_DIR = os.getenv(
+    "CATALOG_AUDIO_DIR",
+    os.path.join(os.path.dirname(__file__), '..', '..', 'media', 'audio')
+)
+
+# Время кеширования фрагментов клиентами и CDN (секунды)
+AUDIO_CACHE_MAX_AGE = int(os.getenv("CATALOG_AUDIO_CACHE_MAX_AGE", str(7 * 24 * 3600)))
+
+# Поддерживаемые форматы в порядке поиска
+AUDIO_MEDIA_TYPES = {
+    ".mp3": "audio/mpeg",
+    ".m4a": "audio/mp4",
+    ".ogg": "audio/ogg",
+    ".opus": "audio/ogg",
+}
+
+
+def find_audio_file(audiobook_id: int) -> Optional[Tuple[str, str, os.stat_result]]:
+    """
+    Ищет файл фрагмента аудиокниги.
+
+    Args:
+        audiobook_id: ID аудиокниги
+
+    Returns:
+        (путь, MIME-тип, результат stat) или None, если файла нет
+    """
+    for extension, media_type in AUDIO_MEDIA_TYPES.items():
+        path = os.path.join(AUDIO_STORAGE_DIR, f"{audiobook_id}{extension}")
+        try:
+            stat_result = os.stat(path)
+        except OSError:
+            continue
+        if stat.S_ISREG(stat_result.st_mode):
+            return path, media_type, stat_result
+    return None
+
+
+def audio_cache_headers() -> dict:
+    """Заголовки кеширования фрагментов"""
+    return {"Cache-Control": f"public, max-age={AUDIO_CACHE_MAX_AGE}"}
@@ -0,0 +1,359 @@
+"""
+Хранилище сегментов аудиофрагментов (в стиле HLS).
+
+Загруженный MP3 делится по границам MPEG-кадров на сегменты фиксированной
+длительности без перекодирования (packed audio в терминах HLS) и
+сохраняется на диск вместе с плейлистом:
+
+    CATALOG_SEGMENTS_DIR/<audiobook_id>/playlist.m3u8
+    CATALOG_SEGMENTS_DIR/<audiobook_id>/<version>/00000.mp3, 00001.mp3, ...
+
+Каждая загрузка создает новую версию, а плейлист заменяется атомарно,
+поэтому сегменты неизменяемы и кешируются навсегда. Воспроизведение и
+перемотка - последовательное чтение небольших файлов.
+
+Загрузки одной аудиокниги в процессе выполняются по очереди; при
+параллельных загрузках из разных процессов удаляются только версии
+старше замененной, поэтому опубликованная более новая версия не удаляется.
+
+Загрузка из командной строки: python segments.py <audiobook_id> <file.mp3>
+"""
+
+import os
+import math
+import mmap
+import re
+import shutil
+import stat
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Каталог сегментов
+SEGMENTS_STORAGE_DIR = os.getenv(
+    "CATALOG_SEGMENTS_DIR",
+    os.path.join(os.path.dirname(__file__), '..', '..', 'media', 'segments')
+)
+
+# Длительность сегмента (секунды)
+SEGMENT_SECONDS = float(os.getenv("CATALOG_SEGMENT_SECONDS", "6"))
+
+# Максимальный размер загружаемого MP3 (байты)
+MAX_UPLOAD_SIZE = int(os.getenv("CATALOG_MAX_UPLOAD_MB", "50")) * 1024 * 1024
+
+# Кеширование: сегменты неизменяемы, плейлист меняется при новой загрузке
+SEGMENT_CACHE_CONTROL = "public, max-age=31536000, immutable"
+PLAYLIST_CACHE_CONTROL = "public, max-age=60"
+
+PLAYLIST_NAME = "playlist.m3u8"
+PLAYLIST_MEDIA_TYPE = "application/vnd.apple.mpegurl"
+SEGMENT_MEDIA_TYPE = "audio/mpeg"
+
+# Допустимые имена версий и сегментов (защита от выхода за пределы каталога)
+VERSION_PATTERN = re.compile(r"^[0-9a-f]{1,16}$")
+SEGMENT_PATTERN = re.compile(r"^[0-9]{5}\.mp3$")
+
+# Битрейты (кбит/с) по индексу: [MPEG-1 / MPEG-2(.5)][слой I, II, III]
+_BITRATES = {
+    (1, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (1, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (1, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (2, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (2, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (2, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+# Частоты дискретизации по версии MPEG (биты заголовка: 3 - MPEG-1, 2 - MPEG-2, 0 - MPEG-2.5)
+_SAMPLE_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+
+
+class _IngestLock:
+    """Блокировка загрузки аудиокниги и число потоков, которые ее держат или ждут"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.users = 0
+
+
+# Блокировки загрузки по аудиокнигам (в пределах процесса); блокировка
+# удаляется, когда ее больше никто не ждет
+_ingest_locks: Dict[int, _IngestLock] = {}
+_ingest_locks_guard = threading.Lock()
+
+
+class InvalidAudioError(ValueError):
+    """Файл не является поддерживаемым MP3"""
+
+
+class UploadTooLargeError(ValueError):
+    """Загружаемый файл больше MAX_UPLOAD_SIZE"""
+
+
+def _parse_frame_header(data, offset: int) -> Optional[Tuple[int, int, int]]:
+    """
+    Разбирает заголовок MPEG-кадра.
+
+    Returns:
+        (длина кадра в байтах, сэмплов в кадре, частота дискретизации) или None
+    """
+    if offset + 4 > len(data):
+        return None
+    b1, b2, b3 = data[offset + 1], data[offset + 2], data[offset + 3]
+    if data[offset] != 0xFF or (b1 & 0xE0) != 0xE0:
+        return None
+
+    version_bits = (b1 >> 3) & 0x03
+    layer_bits = (b1 >> 1) & 0x03
+    bitrate_index = b2 >> 4
+    rate_index = (b2 >> 2) & 0x03
+    if version_bits == 1 or layer_bits == 0 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+
+    layer = 4 - layer_bits
+    mpeg1 = version_bits == 3
+    bitrate = _BITRATES[(1 if mpeg1 else 2, layer)][bitrate_index] * 1000
+    sample_rate = _SAMPLE_RATES[version_bits][rate_index]
+    padding = (b2 >> 1) & 0x01
+
+    if layer == 1:
+        return (12 * bitrate // sample_rate + padding) * 4, 384, sample_rate
+    if layer == 3 and not mpeg1:
+        return 72 * bitrate // sample_rate + padding, 576, sample_rate
+    return 144 * bitrate // sample_rate + padding, 1152, sample_rate
+
+
+def _skip_id3v2(data) -> int:
+    if len(data) >= 10 and data[:3] == b"ID3":
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        footer = 10 if data[5] & 0x10 else 0
+        return 10 + size + footer
+    return 0
+
+
+def iter_mp3_frames(data) -> Iterator[Tuple[int, int, float]]:
+    """
+    Перебирает MPEG-кадры MP3.
+
+    Args:
+        data: Содержимое файла (bytes или mmap)
+
+    Yields:
+        (смещение кадра, длина кадра, длительность кадра в секундах)
+    """
+    offset = _skip_id3v2(data)
+    size = len(data)
+    synced = True
+    while offset + 4 <= size:
+        header = _parse_frame_header(data, offset)
+        valid = header is not None and offset + header[0] <= size
+        if valid and not synced:
+            # После потери синхронизации кадр подтверждается заголовком следующего
+            next_offset = offset + header[0]
+            valid = next_offset + 4 > size or _parse_frame_header(data, next_offset) is not None
+        if not valid:
+            # Мусор между кадрами или теги (ID3v1/APE) - ищем следующую синхронизацию
+            synced = False
+            next_sync = data.find(b"\xff", offset + 1)
+            if next_sync == -1:
+                return
+            offset = next_sync
+            continue
+        synced = True
+        frame_length, samples, sample_rate = header
+        yield offset, frame_length, samples / sample_rate
+        offset += frame_length
+
+
+def split_mp3(data, segment_seconds: float = SEGMENT_SECONDS) -> List[Tuple[List[Tuple[int, int]], float]]:
+    """
+    Делит MP3 на сегменты по границам кадров.
+
+    Returns:
+        Список сегментов: (диапазоны байтов [(начало, конец)], длительность)
+    """
+    segments = []
+    start = end = None
+    duration = 0.0
+    ranges: List[Tuple[int, int]] = []
+
+    for offset, length, frame_duration in iter_mp3_frames(data):
+        if start is not None and offset != end:
+            # Разрыв (пропущенный мусор) - закрываем непрерывный диапазон
+            ranges.append((start, end))
+            start = None
+        if start is None:
+            start = offset
+        end = offset + length
+        duration += frame_duration
+
+        if duration >= segment_seconds:
+            ranges.append((start, end))
+            segments.append((ranges, duration))
+            start, ranges, duration = None, [], 0.0
+
+    if start is not None:
+        ranges.append((start, end))
+    if ranges:
+        segments.append((ranges, duration))
+    return segments
+
+
+def build_playlist(version: str, durations: List[float]) -> str:
+    """Формирует плейлист HLS (VOD) для сегментов версии"""
+    lines = [
+        "#EXTM3U",
+        "#EXT-X-VERSION:3",
+        f"#EXT-X-TARGETDURATION:{math.ceil(max(durations))}",
+        "#EXT-X-MEDIA-SEQUENCE:0",
+        "#EXT-X-PLAYLIST-TYPE:VOD",
+    ]
+    for index, duration in enumerate(durations):
+        lines.append(f"#EXTINF:{duration:.3f},")
+        lines.append(f"segments/{version}/{index:05d}.mp3")
+    lines.append("#EXT-X-ENDLIST")
+    return "\n".join(lines) + "\n"
+
+
+def _audiobook_dir(audiobook_id: int) -> str:
+    return os.path.join(SEGMENTS_STORAGE_DIR, str(audiobook_id))
+
+
+@contextmanager
+def _ingest_lock(audiobook_id: int) -> Iterator[None]:
+    with _ingest_locks_guard:
+        entry = _ingest_locks.get(audiobook_id)
+        if entry is None:
+            entry = _ingest_locks[audiobook_id] = _IngestLock()
+        entry.users += 1
+    try:
+        with entry.lock:
+            yield
+    finally:
+        with _ingest_locks_guard:
+            entry.users -= 1
+            if entry.users == 0:
+                del _ingest_locks[audiobook_id]
+
+
+def _prune_versions(book_dir: str, version: str, previous: Optional[str]) -> None:
+    """
+    Удаляет версии старше замененной.
+
+    Замененная версия остается для уже начатых воспроизведений; версии
+    новее опубликованной (параллельная загрузка другого процесса) не трогаем.
+    """
+    keep_from = int(version, 16)
+    if previous is not None and VERSION_PATTERN.match(previous):
+        keep_from = min(keep_from, int(previous, 16))
+    for name in os.listdir(book_dir):
+        if VERSION_PATTERN.match(name) and int(name, 16) < keep_from:
+            shutil.rmtree(os.path.join(book_dir, name), ignore_errors=True)
+
+
+def ingest_mp3(audiobook_id: int, source_path: str, segment_seconds: float = SEGMENT_SECONDS) -> dict:
+    """
+    Делит MP3 на сегменты и публикует новую версию плейлиста аудиокниги.
+
+    Файл читается через mmap; сегменты пишутся во временный каталог,
+    который затем переименовывается, после чего плейлист заменяется
+    атомарно. Предыдущая версия сохраняется для уже начатых
+    воспроизведений, более старые удаляются. Загрузки одной аудиокниги
+    в процессе выполняются по очереди.
+
+    Args:
+        audiobook_id: ID аудиокниги
+        source_path: Путь к MP3
+        segment_seconds: Длительность сегмента
+
+    Returns:
+        Версия, количество сегментов и общая длительность
+
+    Raises:
+        InvalidAudioError: Если в файле нет MPEG-кадров
+    """
+    with _ingest_lock(audiobook_id):
+        return _ingest(audiobook_id, source_path, segment_seconds)
+
+
+def _ingest(audiobook_id: int, source_path: str, segment_seconds: float) -> dict:
+    with open(source_path, "rb") as source:
+        if os.fstat(source.fileno()).st_size == 0:
+            raise InvalidAudioError("Пустой файл")
+        with mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            segments = split_mp3(data, segment_seconds)
+            if not segments:
+                raise InvalidAudioError("Файл не содержит MPEG-кадров")
+
+            book_dir = _audiobook_dir(audiobook_id)
+            os.makedirs(book_dir, exist_ok=True)
+            version = format(time.time_ns() // 1000, "x")
+            staging_dir = os.path.join(book_dir, f".tmp-{version}")
+            os.makedirs(staging_dir)
+            try:
+                for index, (ranges, _) in enumerate(segments):
+                    with open(os.path.join(staging_dir, f"{index:05d}.mp3"), "wb") as segment:
+                        for start, end in ranges:
+                            segment.write(data[start:end])
+                os.rename(staging_dir, os.path.join(book_dir, version))
+            except Exception:
+                shutil.rmtree(staging_dir, ignore_errors=True)
+                raise
+
+    durations = [duration for _, duration in segments]
+    playlist_tmp = os.path.join(book_dir, f".{PLAYLIST_NAME}.{version}")
+    with open(playlist_tmp, "w", encoding="utf-8") as playlist:
+        playlist.write(build_playlist(version, durations))
+    previous = current_version(audiobook_id)
+    os.replace(playlist_tmp, os.path.join(book_dir, PLAYLIST_NAME))
+    _prune_versions(book_dir, version, previous)
+
+    return {
+        "version": version,
+        "segments": len(segments),
+        "duration": round(sum(durations), 3)
+    }
+
+
+def current_version(audiobook_id: int) -> Optional[str]:
+    """Версия сегментов, на которую указывает плейлист аудиокниги"""
+    try:
+        with open(playlist_path(audiobook_id), encoding="utf-8") as playlist:
+            for line in playlist:
+                if line.startswith("segments/"):
+                    return line.split("/")[1]
+    except OSError:
+        pass
+    return None
+
+
+def playlist_path(audiobook_id: int) -> str:
+    return os.path.join(_audiobook_dir(audiobook_id), PLAYLIST_NAME)
+
+
+def find_segment(audiobook_id: int, version: str, name: str) -> Optional[Tuple[str, os.stat_result]]:
+    """
+    Ищет файл сегмента.
+
+    Returns:
+        (путь, результат stat) или None, если сегмента нет или имя недопустимо
+    """
+    if not VERSION_PATTERN.match(version) or not SEGMENT_PATTERN.match(name):
+        return None
+    path = os.path.join(_audiobook_dir(audiobook_id), version, name)
+    try:
+        stat_result = os.stat(path)
+    except OSError:
+        return None
+    return (path, stat_result) if stat.S_ISREG(stat_result.st_mode) else None
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) != 3:
+        print("Использование: python segments.py <audiobook_id> <file.mp3>")
+        sys.exit(1)
+
+    print(f"✂️ Нарезка {sys.argv[2]} на сегменты по {SEGMENT_SECONDS} с...")
+    result = ingest_mp3(int(sys.argv[1]), sys.argv[2])
+    print(f"✅ Версия {result['version']}: сегментов {result['segments']}, длительность {result['duration']} с")
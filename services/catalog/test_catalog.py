@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Тесты для эндпоинтов аудиофрагментов микросервиса 'Каталог'
+"""
+
+import os
+import sys
+import tempfile
+
+import pytest
+from fastapi.testclient import TestClient
+
+# Добавляем корневую директорию проекта в путь
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+# Модули сервиса импортируются по плоским именам; модули других сервисов
+# с теми же именами, загруженные тестами из того же запуска pytest, убираем
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+for module_name in ("services", "main", "schemas"):
+    sys.modules.pop(module_name, None)
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import database.connection
+from database.models import Base, Author, Audiobook
+
+# main создает таблицы при импорте - подменяем MySQL на in-memory SQLite
+test_engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+database.connection.get_engine = lambda: test_engine
+TestSession = sessionmaker(bind=test_engine)
+
+import main
+import media
+import segments
+from main import app
+from database.connection import get_db
+
+AUDIO = bytes(range(256)) * 40
+
+# MPEG-1 Layer III, 128 кбит/с, 44100 Гц: 417 байт на кадр
+MP3_FRAME = bytes([0xFF, 0xFB, 0x90, 0x64]) + bytes(413)
+
+
+@pytest.fixture
+def audio_dir(tmp_path, monkeypatch):
+    """Временный каталог аудиофрагментов с фрагментом книги 1"""
+    monkeypatch.setattr(media, "AUDIO_STORAGE_DIR", str(tmp_path))
+    with open(tmp_path / "1.mp3", "wb") as audio:
+        audio.write(AUDIO)
+    return tmp_path
+
+
+@pytest.fixture
+def db_session():
+    """Сессия базы данных с аудиокнигой 1"""
+    Base.metadata.drop_all(test_engine)
+    Base.metadata.create_all(test_engine)
+    session = TestSession()
+    author = Author(name="Автор")
+    session.add(author)
+    session.flush()
+    session.add(Audiobook(id=1, title="Книга", price=100, author_id=author.id))
+    session.commit()
+    app.dependency_overrides[get_db] = lambda: session
+    yield session
+    app.dependency_overrides.clear()
+    session.close()
+
+
+@pytest.fixture
+def segments_dir(tmp_path, monkeypatch):
+    """Временный каталог сегментов"""
+    monkeypatch.setattr(segments, "SEGMENTS_STORAGE_DIR", str(tmp_path / "segments"))
+    return tmp_path / "segments"
+
+
+class TestAudiobookPreview:
+    """Тесты для отдачи аудиофрагмента"""
+
+    def setup_method(self):
+        self.client = TestClient(app)
+
+    def test_full_file(self, audio_dir):
+        """Без Range файл отдается целиком с заголовками кеширования"""
+        response = self.client.get("/api/v1/audiobooks/1/preview")
+        assert response.status_code == 200
+        assert response.content == AUDIO
+        assert response.headers["content-type"] == "audio/mpeg"
+        assert response.headers["accept-ranges"] == "bytes"
+        assert response.headers["cache-control"] == media.audio_cache_headers()["Cache-Control"]
+        assert response.headers["etag"]
+
+    def test_range_request(self, audio_dir):
+        """Запрос Range возвращает 206 и только запрошенный диапазон"""
+        response = self.client.get("/api/v1/audiobooks/1/preview", headers={"Range": "bytes=100-199"})
+        assert response.status_code == 206
+        assert response.content == AUDIO[100:200]
+        assert response.headers["content-range"] == f"bytes 100-199/{len(AUDIO)}"
+
+        response = self.client.get("/api/v1/audiobooks/1/preview", headers={"Range": "bytes=-10"})
+        assert response.status_code == 206
+        assert response.content == AUDIO[-10:]
+
+    def test_not_modified(self, audio_dir):
+        """If-None-Match с текущим ETag возвращает 304 без тела"""
+        etag = self.client.get("/api/v1/audiobooks/1/preview").headers["etag"]
+
+        response = self.client.get("/api/v1/audiobooks/1/preview", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers["etag"] == etag
+        assert "cache-control" in response.headers
+
+        response = self.client.get("/api/v1/audiobooks/1/preview", headers={"If-None-Match": '"other"'})
+        assert response.status_code == 200
+
+    def test_missing_file(self, audio_dir):
+        """Для книги без фрагмента возвращается 404"""
+        response = self.client.get("/api/v1/audiobooks/2/preview")
+        assert response.status_code == 404
+        assert response.json()["detail"] == "Аудиофрагмент не найден"
+
+
+class TestPreviewUpload:
+    """Тесты для загрузки MP3 аудиофрагмента"""
+
+    def setup_method(self):
+        self.client = TestClient(app)
+
+    def upload(self, audiobook_id: int, data: bytes):
+        return self.client.post(
+            f"/api/v1/audiobooks/{audiobook_id}/preview/segments",
+            files={"file": ("preview.mp3", data, "audio/mpeg")}
+        )
+
+    def test_upload_creates_segments(self, db_session, segments_dir, tmp_path, monkeypatch):
+        """Загруженный файл нарезается, временный файл удаляется"""
+        temp_dir = tmp_path / "tmp"
+        temp_dir.mkdir()
+        monkeypatch.setattr(tempfile, "tempdir", str(temp_dir))
+        response = self.upload(1, MP3_FRAME * 10)
+        assert response.status_code == 200
+        data = response.json()
+        assert data["audiobook_id"] == 1
+        assert data["segments"] == 1
+        assert os.path.isfile(segments.playlist_path(1))
+        assert os.listdir(temp_dir) == []
+        assert segments._ingest_locks == {}
+
+    def test_upload_size_limited(self, db_session, segments_dir, monkeypatch):
+        """Файл больше MAX_UPLOAD_SIZE отклоняется с кодом 413"""
+        monkeypatch.setattr(main, "MAX_UPLOAD_SIZE", len(MP3_FRAME) * 5)
+        response = self.upload(1, MP3_FRAME * 10)
+        assert response.status_code == 413
+        assert not os.path.exists(segments.playlist_path(1))
+
+        assert self.upload(1, MP3_FRAME * 5).status_code == 200
+
+    def test_upload_rejects_unknown_book_and_invalid_file(self, db_session, segments_dir):
+        """Загрузка для несуществующей книги - 404, файл без MPEG-кадров - 400"""
+        assert self.upload(2, MP3_FRAME * 10).status_code == 404
+        assert self.upload(1, b"not an mp3" * 100).status_code == 400
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
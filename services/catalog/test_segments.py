@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Тесты для нарезки аудиофрагментов на сегменты (segments.py)
+"""
+
+import os
+import sys
+import threading
+
+import pytest
+
+# Модули сервиса импортируются по плоским именам
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import segments
+from segments import (
+    InvalidAudioError, iter_mp3_frames, split_mp3, ingest_mp3,
+    current_version, find_segment, playlist_path
+)
+
+# MPEG-1 Layer III, 128 кбит/с, 44100 Гц: 417 байт и 1152 сэмпла на кадр
+FRAME_LENGTH = 417
+FRAME_SECONDS = 1152 / 44100
+
+
+def make_frame(padding: bool = False) -> bytes:
+    header = bytes([0xFF, 0xFB, 0x90 | (0x02 if padding else 0x00), 0x64])
+    return header + bytes(FRAME_LENGTH + padding - 4)
+
+
+def make_mp3(frames: int) -> bytes:
+    return b"".join(make_frame() for _ in range(frames))
+
+
+def make_id3(payload_size: int) -> bytes:
+    size = bytes([(payload_size >> shift) & 0x7F for shift in (21, 14, 7, 0)])
+    return b"ID3\x04\x00\x00" + size + bytes(payload_size)
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    """Временный каталог сегментов"""
+    monkeypatch.setattr(segments, "SEGMENTS_STORAGE_DIR", str(tmp_path / "segments"))
+    return tmp_path
+
+
+def write_mp3(directory, name: str, data: bytes) -> str:
+    path = os.path.join(str(directory), name)
+    with open(path, "wb") as source:
+        source.write(data)
+    return path
+
+
+class TestFrameParser:
+    """Тесты для разбора MPEG-кадров"""
+
+    def test_frames_and_durations(self):
+        """Кадры находятся по заголовкам, длина учитывает бит заполнения"""
+        data = make_frame() + make_frame(padding=True) + make_frame()
+        frames = list(iter_mp3_frames(data))
+        assert [(offset, length) for offset, length, _ in frames] == [
+            (0, FRAME_LENGTH), (FRAME_LENGTH, FRAME_LENGTH + 1), (2 * FRAME_LENGTH + 1, FRAME_LENGTH)
+        ]
+        assert frames[0][2] == pytest.approx(FRAME_SECONDS)
+
+    def test_id3_tag_skipped(self):
+        """Тег ID3v2 в начале файла пропускается"""
+        data = make_id3(100) + make_mp3(2)
+        assert [offset for offset, _, _ in iter_mp3_frames(data)] == [110, 110 + FRAME_LENGTH]
+
+    def test_resync_after_garbage(self):
+        """После мусора между кадрами синхронизация восстанавливается"""
+        garbage = b"\x00\xff\x00" * 5
+        data = make_mp3(2) + garbage + make_mp3(2) + b"TAG" + bytes(125)
+        offsets = [offset for offset, _, _ in iter_mp3_frames(data)]
+        resumed = 2 * FRAME_LENGTH + len(garbage)
+        assert offsets == [0, FRAME_LENGTH, resumed, resumed + FRAME_LENGTH]
+
+    def test_no_frames(self):
+        """В данных без заголовков кадров ничего не находится"""
+        assert list(iter_mp3_frames(b"not an mp3 file" * 10)) == []
+
+
+class TestSplit:
+    """Тесты для деления на сегменты"""
+
+    def test_segments_cover_whole_file(self):
+        """Сегменты идут по границам кадров, последний - остаток"""
+        data = make_mp3(10)
+        result = split_mp3(data, segment_seconds=4 * FRAME_SECONDS - 1e-9)
+        assert [ranges for ranges, _ in result] == [
+            [(0, 4 * FRAME_LENGTH)],
+            [(4 * FRAME_LENGTH, 8 * FRAME_LENGTH)],
+            [(8 * FRAME_LENGTH, 10 * FRAME_LENGTH)],
+        ]
+        assert [duration for _, duration in result] == pytest.approx(
+            [4 * FRAME_SECONDS, 4 * FRAME_SECONDS, 2 * FRAME_SECONDS]
+        )
+
+    def test_gap_splits_byte_ranges(self):
+        """Пропущенный мусор разделяет диапазоны байтов внутри сегмента"""
+        data = make_mp3(2) + b"\x00" * 7 + make_mp3(2)
+        [(ranges, duration)] = split_mp3(data, segment_seconds=60)
+        assert ranges == [(0, 2 * FRAME_LENGTH), (2 * FRAME_LENGTH + 7, 4 * FRAME_LENGTH + 7)]
+        assert duration == pytest.approx(4 * FRAME_SECONDS)
+
+
+class TestIngest:
+    """Тесты для публикации версий сегментов"""
+
+    def test_ingest_writes_segments_and_playlist(self, storage):
+        """Сегменты и плейлист записываются, сегменты совпадают с исходными байтами"""
+        data = make_mp3(10)
+        result = ingest_mp3(1, write_mp3(storage, "book.mp3", data), segment_seconds=4 * FRAME_SECONDS - 1e-9)
+
+        assert result["segments"] == 3
+        assert result["duration"] == pytest.approx(10 * FRAME_SECONDS, abs=0.001)
+        version = result["version"]
+        assert current_version(1) == version
+
+        with open(playlist_path(1), encoding="utf-8") as playlist:
+            lines = playlist.read().splitlines()
+        assert lines[0] == "#EXTM3U"
+        assert lines[-1] == "#EXT-X-ENDLIST"
+        assert f"segments/{version}/00002.mp3" in lines
+
+        path, _ = find_segment(1, version, "00000.mp3")
+        with open(path, "rb") as segment:
+            assert segment.read() == data[:4 * FRAME_LENGTH]
+        assert find_segment(1, version, "00003.mp3") is None
+        assert find_segment(1, "../..", "00000.mp3") is None
+
+    def test_invalid_file_rejected(self, storage):
+        """Файл без MPEG-кадров отклоняется"""
+        with pytest.raises(InvalidAudioError):
+            ingest_mp3(1, write_mp3(storage, "empty.mp3", b""))
+        with pytest.raises(InvalidAudioError):
+            ingest_mp3(1, write_mp3(storage, "text.mp3", b"not an mp3" * 50))
+
+    def test_previous_version_kept_older_removed(self, storage):
+        """Замененная версия сохраняется, более старые удаляются"""
+        source = write_mp3(storage, "book.mp3", make_mp3(5))
+        versions = [ingest_mp3(1, source)["version"] for _ in range(3)]
+
+        book_dir = os.path.dirname(playlist_path(1))
+        remaining = sorted(name for name in os.listdir(book_dir) if segments.VERSION_PATTERN.match(name))
+        assert remaining == sorted(versions[1:])
+
+    def test_newer_version_of_parallel_ingest_kept(self, storage):
+        """Загрузка не удаляет более новую версию, опубликованную параллельно"""
+        source = write_mp3(storage, "book.mp3", make_mp3(5))
+        first = ingest_mp3(1, source)["version"]
+        book_dir = os.path.dirname(playlist_path(1))
+        # Другой процесс уже записал более новую версию, но еще не заменил плейлист
+        newer = format(int(first, 16) + 10 ** 12, "x")
+        os.makedirs(os.path.join(book_dir, newer))
+
+        second = ingest_mp3(1, source)["version"]
+        remaining = {name for name in os.listdir(book_dir) if segments.VERSION_PATTERN.match(name)}
+        assert remaining == {first, second, newer}
+
+    def test_ingest_locks_released(self, storage):
+        """Загрузка ждет параллельную загрузку той же книги, блокировка затем удаляется"""
+        source = write_mp3(storage, "book.mp3", make_mp3(5))
+        results = []
+        with segments._ingest_lock(1):
+            worker = threading.Thread(target=lambda: results.append(ingest_mp3(1, source)))
+            worker.start()
+            worker.join(timeout=0.2)
+            assert worker.is_alive()
+            assert segments._ingest_locks[1].users == 2
+        worker.join()
+
+        assert len(results) == 1
+        assert segments._ingest_locks == {}
+        with pytest.raises(InvalidAudioError):
+            ingest_mp3(2, write_mp3(storage, "empty.mp3", b""))
+        assert segments._ingest_locks == {}
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
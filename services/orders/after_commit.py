@@ -0,0 +1,54 @@
+"""
+Действия, отложенные до фиксации транзакции сессии.
+
+Используются для изменений в памяти процесса (публикация статуса заказа,
+сброс кеша библиотеки), которые должны произойти только если изменение
+в базе данных действительно зафиксировано.
+"""
+
+from typing import Callable
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+_PENDING_KEY = "after_commit_callbacks"
+
+
+def _within(transaction, ancestor) -> bool:
+    while transaction is not None:
+        if transaction is ancestor:
+            return True
+        transaction = transaction.parent
+    return False
+
+
+def call_after_commit(session: Session, callback: Callable, *args) -> None:
+    """
+    Откладывает вызов callback(*args) до фиксации транзакции сессии.
+
+    Вызов отбрасывается при откате транзакции или точки сохранения, в
+    которой он добавлен; вызовы внешней транзакции при откате вложенной
+    точки сохранения сохраняются.
+    """
+    pending = session.info.get(_PENDING_KEY)
+    if pending is None:
+        pending = session.info[_PENDING_KEY] = []
+
+        def flush_pending(sess: Session) -> None:
+            # after_commit вызывается и при освобождении точки сохранения -
+            # вызовы выполняются только при фиксации внешней транзакции
+            if sess.in_nested_transaction():
+                return
+            calls = list(pending)
+            pending.clear()
+            for _, pending_callback, pending_args in calls:
+                pending_callback(*pending_args)
+
+        def drop_pending(sess: Session, previous_transaction) -> None:
+            pending[:] = [entry for entry in pending if not _within(entry[0], previous_transaction)]
+
+        event.listen(session, "after_commit", flush_pending)
+        event.listen(session, "after_soft_rollback", drop_pending)
+
+    transaction = session.get_nested_transaction() or session.get_transaction()
+    pending.append((transaction, callback, args))
@@ -0,0 +1,273 @@
+"""
+Аналитика продаж микросервиса "Заказы".
+
+Сводные таблицы (sales_daily, sales_by_audiobook, order_status_counts)
+обновляются инкрементально обработчиками событий outbox при создании
+заказа и смене его статуса. Отчеты читают только сводки, поэтому их
+стоимость зависит от числа дней/книг/статусов, а не от числа заказов.
+"""
+
+import sys
+import os
+
+# Добавляем корневую директорию проекта в путь Python
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Any, Dict, List
+
+from sqlalchemy import func, insert, update
+from sqlalchemy.orm import Session, selectinload
+
+from database.models import (
+    Order, OrderItem, ArchivedOrder, ArchivedOrderItem, Category, audiobook_category,
+    SalesDaily, AudiobookSales, OrderStatusCount
+)
+
+
+class SalesAnalytics:
+    """Инкрементальные сводки продаж и отчеты по ним"""
+
+    def __init__(self, db_session: Session):
+        self.db = db_session
+
+    def _increment(self, model, key: Dict[str, Any], deltas: Dict[str, Any], assign: Dict[str, Any] = None) -> None:
+        """
+        Атомарно прибавляет deltas к строке сводки, создавая ее при отсутствии.
+
+        Args:
+            model: Модель сводной таблицы
+            key: Значения первичного ключа
+            deltas: Приращения числовых колонок
+            assign: Колонки, которые просто перезаписываются
+        """
+        table = model.__table__
+        assign = assign or {}
+        values = {name: table.c[name] + delta for name, delta in deltas.items()}
+        values.update(assign)
+
+        result = self.db.execute(
+            update(table)
+            .where(*[table.c[name] == value for name, value in key.items()])
+            .values(values)
+        )
+        if result.rowcount == 0:
+            self.db.execute(insert(table).values({**key, **deltas, **assign}))
+
+    def _apply_sales(self, day: date, items: List[dict], sign: int) -> None:
+        """Добавляет (sign=1) или вычитает (sign=-1) продажи заказа из сводок."""
+        units = 0
+        revenue = Decimal("0")
+        by_audiobook: Dict[int, dict] = {}
+
+        for item in items:
+            quantity = int(item["quantity"])
+            item_revenue = Decimal(str(item["price_per_unit"])) * quantity
+            units += quantity
+            revenue += item_revenue
+
+            entry = by_audiobook.setdefault(
+                item["audiobook_id"],
+                {"title": item["title"], "units": 0, "revenue": Decimal("0")}
+            )
+            entry["units"] += quantity
+            entry["revenue"] += item_revenue
+
+        self._increment(
+            SalesDaily,
+            {"day": day},
+            {"orders_count": sign, "units": sign * units, "revenue": sign * revenue}
+        )
+        # Фиксированный порядок ключей снижает риск взаимных блокировок
+        for audiobook_id in sorted(by_audiobook):
+            entry = by_audiobook[audiobook_id]
+            self._increment(
+                AudiobookSales,
+                {"audiobook_id": audiobook_id},
+                {"units": sign * entry["units"], "revenue": sign * entry["revenue"]},
+                assign={"title": entry["title"]}
+            )
+
+    def record_order_created(self, payload: dict) -> None:
+        """
+        Учитывает созданный заказ (payload события order_created).
+
+        Args:
+            payload: Данные события
+        """
+        day = datetime.fromisoformat(payload["created_at"]).date()
+        self._apply_sales(day, payload["items"], 1)
+        self._increment(OrderStatusCount, {"status": "pending"}, {"count": 1})
+
+    def record_status_change(self, payload: dict) -> None:
+        """
+        Учитывает смену статуса (payload события order_status_changed).
+
+        Отмена заказа вычитает его из выручки, выход из отмены - возвращает.
+
+        Args:
+            payload: Данные события
+        """
+        old_status = payload["old_status"]
+        new_status = payload["new_status"]
+        self._increment(OrderStatusCount, {"status": old_status}, {"count": -1})
+        self._increment(OrderStatusCount, {"status": new_status}, {"count": 1})
+
+        if new_status == "cancelled" and old_status != "cancelled":
+            sign = -1
+        elif old_status == "cancelled" and new_status != "cancelled":
+            sign = 1
+        else:
+            return
+
+        order = (
+            self.db.query(Order)
+            .options(selectinload(Order.items))
+            .filter(Order.id == payload["order_id"])
+            .first()
+        )
+        if order is None:
+            return
+        items = [
+            {
+                "audiobook_id": item.audiobook_id,
+                "title": item.title,
+                "price_per_unit": item.price_per_unit,
+                "quantity": item.quantity
+            }
+            for item in order.items
+        ]
+        self._apply_sales(order.created_at.date(), items, sign)
+
+    def rebuild(self) -> None:
+        """
+        Полностью пересчитывает сводки по таблицам заказов и их архиву.
+
+        Нужен один раз для уже существующих заказов; выполняется за O(заказов).
+        """
+        for model in (SalesDaily, AudiobookSales, OrderStatusCount):
+            self.db.query(model).delete()
+
+        status_counts: Dict[str, int] = defaultdict(int)
+        audiobooks: Dict[int, dict] = {}
+        daily: Dict[date, dict] = defaultdict(lambda: {"orders_count": 0, "units": 0, "revenue": Decimal("0")})
+
+        for order_model, item_model in ((Order, OrderItem), (ArchivedOrder, ArchivedOrderItem)):
+            for status, count in self.db.query(order_model.status, func.count(order_model.id)).group_by(order_model.status):
+                status_counts[status] += count
+
+            active = order_model.status != "cancelled"
+            audiobook_rows = (
+                self.db.query(
+                    item_model.audiobook_id,
+                    func.max(item_model.title),
+                    func.sum(item_model.quantity),
+                    func.sum(item_model.price_per_unit * item_model.quantity)
+                )
+                .join(order_model, order_model.id == item_model.order_id)
+                .filter(active)
+                .group_by(item_model.audiobook_id)
+            )
+            for audiobook_id, title, units, revenue in audiobook_rows:
+                entry = audiobooks.setdefault(audiobook_id, {"title": title, "units": 0, "revenue": Decimal("0")})
+                entry["units"] += units
+                entry["revenue"] += Decimal(str(revenue))
+
+            order_rows = (
+                self.db.query(order_model.created_at, order_model.total_amount, func.sum(item_model.quantity))
+                .join(item_model, item_model.order_id == order_model.id)
+                .filter(active)
+                .group_by(order_model.id, order_model.created_at, order_model.total_amount)
+            )
+            for created_at, total_amount, units in order_rows:
+                bucket = daily[created_at.date()]
+                bucket["orders_count"] += 1
+                bucket["units"] += units
+                bucket["revenue"] += Decimal(str(total_amount))
+
+        for status, count in status_counts.items():
+            self.db.add(OrderStatusCount(status=status, count=count))
+        for audiobook_id, entry in audiobooks.items():
+            self.db.add(AudiobookSales(audiobook_id=audiobook_id, **entry))
+        for day, bucket in daily.items():
+            self.db.add(SalesDaily(day=day, **bucket))
+
+        self.db.commit()
+
+    def get_stats(self, days: int = 30, top: int = 10) -> Dict[str, Any]:
+        """
+        Возвращает отчет по продажам из сводных таблиц.
+
+        Args:
+            days: Количество последних дней в отчете по выручке
+            top: Количество самых продаваемых аудиокниг
+
+        Returns:
+            Словарь с выручкой по дням, топом аудиокниг, продажами
+            по категориям и количеством заказов по статусам
+        """
+        since_day = date.today() - timedelta(days=days - 1)
+        daily = (
+            self.db.query(SalesDaily)
+            .filter(SalesDaily.day >= since_day)
+            .order_by(SalesDaily.day)
+            .all()
+        )
+        top_audiobooks = (
+            self.db.query(AudiobookSales)
+            .order_by(AudiobookSales.units.desc())
+            .limit(top)
+            .all()
+        )
+        # Проход по сводке книг (размер каталога), а не по позициям заказов
+        categories = (
+            self.db.query(
+                Category.name,
+                func.sum(AudiobookSales.units),
+                func.sum(AudiobookSales.revenue)
+            )
+            .join(audiobook_category, audiobook_category.c.category_id == Category.id)
+            .join(AudiobookSales, AudiobookSales.audiobook_id == audiobook_category.c.audiobook_id)
+            .group_by(Category.name)
+            .order_by(func.sum(AudiobookSales.units).desc())
+            .all()
+        )
+        status_counts = self.db.query(OrderStatusCount).all()
+
+        return {
+            "daily_revenue": [
+                {
+                    "day": row.day.isoformat(),
+                    "orders_count": row.orders_count,
+                    "units": row.units,
+                    "revenue": float(row.revenue)
+                }
+                for row in daily
+            ],
+            "total_revenue": float(sum((row.revenue for row in daily), Decimal("0"))),
+            "top_audiobooks": [
+                {
+                    "audiobook_id": row.audiobook_id,
+                    "title": row.title,
+                    "units": row.units,
+                    "revenue": float(row.revenue)
+                }
+                for row in top_audiobooks
+            ],
+            "categories": [
+                {"category": name, "units": int(units or 0), "revenue": float(revenue or 0)}
+                for name, units, revenue in categories
+            ],
+            "status_counts": {row.status: row.count for row in status_counts}
+        }
+
+
+if __name__ == "__main__":
+    from database.connection import get_db_session
+
+    print("🔄 Пересчет сводок продаж...")
+    with get_db_session() as session:
+        SalesAnalytics(session).rebuild()
+    print("✅ Сводки продаж пересчитаны")
@@ -0,0 +1,152 @@
+"""
+Архивация завершенных заказов микросервиса "Заказы".
+
+Доставленные и отмененные заказы старше заданного возраста переносятся
+пачками из orders/order_items в orders_archive/order_items_archive, чтобы
+рабочие таблицы и их индексы оставались небольшими. Заказ сохраняет свой
+ID и номер; чтение заказа по ID и номеру, поток статусов и список заказов
+находят его в архиве.
+
+Запуск (например, по cron): python archive.py [--days N]
+"""
+
+import sys
+import os
+
+# Добавляем корневую директорию проекта в путь Python
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from sqlalchemy import delete, exists, func, insert, select, update
+from sqlalchemy.orm import Session
+
+from database.models import (
+    Order, OrderItem, ArchivedOrder, ArchivedOrderItem,
+    OrderOutboxEvent, IdempotencyKey
+)
+
+# Конфигурация архивации
+ARCHIVE_AFTER_DAYS = int(os.getenv("ORDERS_ARCHIVE_AFTER_DAYS", "180"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ORDERS_ARCHIVE_BATCH_SIZE", "500"))
+
+# Заказы в этих статусах больше не меняются
+ARCHIVABLE_STATUSES = ('delivered', 'cancelled')
+
+
+def _copy_columns(target) -> List[str]:
+    """Колонки архивной таблицы, совпадающие с колонками рабочей"""
+    return [column.name for column in target.__table__.columns if column.name != 'archived_at']
+
+
+class OrderArchiver:
+    """Перенос завершенных заказов в архивные таблицы"""
+
+    def __init__(self, db_session: Session, batch_size: int = ARCHIVE_BATCH_SIZE):
+        self.db = db_session
+        self.batch_size = batch_size
+
+    def archive_batch(self, cutoff: datetime) -> int:
+        """
+        Переносит в архив одну пачку заказов, завершенных до cutoff.
+
+        Пачка захватывается через SELECT ... FOR UPDATE SKIP LOCKED и
+        переносится в одной транзакции. Заказы с необработанными событиями
+        outbox пропускаются до следующего запуска.
+
+        Args:
+            cutoff: Граница по времени последнего изменения заказа
+
+        Returns:
+            Количество перенесенных заказов
+        """
+        has_pending_events = exists().where(
+            OrderOutboxEvent.order_id == Order.id,
+            OrderOutboxEvent.status == 'pending'
+        )
+        order_ids = [
+            row.id
+            for row in self.db.query(Order.id)
+            .filter(
+                Order.status.in_(ARCHIVABLE_STATUSES),
+                func.coalesce(Order.updated_at, Order.created_at) < cutoff,
+                ~has_pending_events
+            )
+            .order_by(Order.id)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+        ]
+        if not order_ids:
+            self.db.rollback()
+            return 0
+
+        order_columns = _copy_columns(ArchivedOrder)
+        self.db.execute(
+            insert(ArchivedOrder).from_select(
+                order_columns,
+                select(*[Order.__table__.c[name] for name in order_columns]).where(Order.id.in_(order_ids))
+            )
+        )
+        item_columns = _copy_columns(ArchivedOrderItem)
+        self.db.execute(
+            insert(ArchivedOrderItem).from_select(
+                item_columns,
+                select(*[OrderItem.__table__.c[name] for name in item_columns])
+                .where(OrderItem.order_id.in_(order_ids))
+            )
+        )
+
+        # Сохраненные ответы ключей идемпотентности остаются действительными
+        self.db.execute(
+            update(IdempotencyKey)
+            .where(IdempotencyKey.order_id.in_(order_ids))
+            .values(order_id=None)
+            .execution_options(synchronize_session=False)
+        )
+        for statement in (
+            delete(OrderOutboxEvent).where(OrderOutboxEvent.order_id.in_(order_ids)),
+            delete(OrderItem).where(OrderItem.order_id.in_(order_ids)),
+            delete(Order).where(Order.id.in_(order_ids)),
+        ):
+            self.db.execute(statement.execution_options(synchronize_session=False))
+
+        self.db.commit()
+        return len(order_ids)
+
+    def run(self, max_age_days: int = ARCHIVE_AFTER_DAYS, max_batches: Optional[int] = None) -> int:
+        """
+        Переносит в архив все подходящие заказы пачками.
+
+        Args:
+            max_age_days: Возраст завершенного заказа (в днях) для архивации
+            max_batches: Ограничение числа пачек за запуск
+
+        Returns:
+            Количество перенесенных заказов
+        """
+        cutoff = datetime.now() - timedelta(days=max_age_days)
+        archived = 0
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            moved = self.archive_batch(cutoff)
+            if not moved:
+                break
+            archived += moved
+            batches += 1
+        return archived
+
+
+if __name__ == "__main__":
+    import argparse
+    from database.connection import get_db_session
+
+    parser = argparse.ArgumentParser(description="Архивация завершенных заказов")
+    parser.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS, help="Возраст заказа в днях")
+    parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE, help="Размер пачки")
+    args = parser.parse_args()
+
+    print(f"🗄️ Архивация заказов старше {args.days} дней...")
+    with get_db_session() as session:
+        archived = OrderArchiver(session, batch_size=args.batch_size).run(max_age_days=args.days)
+    print(f"✅ Перенесено в архив заказов: {archived}")
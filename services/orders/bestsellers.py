@@ -0,0 +1,393 @@
+"""
+Потоковый трекер бестселлеров микросервиса "Заказы".
+
+Продажи из событий создания заказа накапливаются в скетчах Count-Min по
+временным корзинам скользящих окон (1 час, 24 часа, 7 дней). Для каждого
+окна поддерживается ограниченный набор кандидатов, из которого куча
+выбирает top-K. Готовый список хранится в памяти, поэтому чтение
+бестселлеров не обращается к базе данных и не зависит от числа заказов.
+
+Каждый процесс учитывает только обработанные им события и периодически
+сохраняет свое состояние в таблицу bestseller_checkpoints под своим именем
+(по идентификатору узла, см. ORDERS_NODE_ID). Список бестселлеров строится
+по сумме скетчей всех процессов: Count-Min линеен, поэтому скетчи
+объединяются поэлементным сложением.
+"""
+
+import sys
+import os
+
+# Добавляем корневую директорию проекта в путь Python
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import asyncio
+import base64
+import heapq
+import json
+import random
+import threading
+import time
+import zlib
+from array import array
+from collections import deque
+from datetime import datetime, timedelta
+from operator import itemgetter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from database.models import BestsellerCheckpoint
+from db_session import run_with_session
+from order_numbers import order_number_generator
+
+# Параметры скетча: ошибка оценки ~ e / width от объема окна с вероятностью 1 - e^-depth
+SKETCH_WIDTH = 1024
+SKETCH_DEPTH = 4
+SKETCH_SEED = 0x5EED
+
+# Размер top-K и число отслеживаемых кандидатов на окно
+TOP_K = 20
+CANDIDATES_PER_WINDOW = 4 * TOP_K
+
+# Окна: название -> (длина окна, длина корзины) в секундах
+WINDOWS = {
+    "1h": (3600, 300),
+    "24h": (86400, 3600),
+    "7d": (7 * 86400, 6 * 3600),
+}
+
+# Контрольные точки процессов: "bestsellers:<узел>"
+CHECKPOINT_PREFIX = "bestsellers:"
+CHECKPOINT_INTERVAL = float(os.getenv("ORDERS_BESTSELLERS_CHECKPOINT_INTERVAL", "60"))
+
+# Простое число Мерсенна для универсального хеширования
+_PRIME = (1 << 61) - 1
+
+
+class CountMinSketch:
+    """Скетч Count-Min для целочисленных ключей"""
+
+    def __init__(self, width: int = SKETCH_WIDTH, depth: int = SKETCH_DEPTH, seed: int = SKETCH_SEED):
+        self.width = width
+        self.depth = depth
+        rng = random.Random(seed)
+        self._hashes = [(rng.randrange(1, _PRIME), rng.randrange(0, _PRIME)) for _ in range(depth)]
+        self.rows = [array('q', bytes(8 * width)) for _ in range(depth)]
+
+    def _indexes(self, key: int) -> List[int]:
+        return [((a * key + b) % _PRIME) % self.width for a, b in self._hashes]
+
+    def add(self, key: int, count: int = 1) -> None:
+        """Увеличивает счетчик ключа"""
+        for row, index in zip(self.rows, self._indexes(key)):
+            row[index] += count
+
+    def estimate(self, key: int) -> int:
+        """Оценка сверху для счетчика ключа"""
+        return min(row[index] for row, index in zip(self.rows, self._indexes(key)))
+
+    def merge(self, other: "CountMinSketch", sign: int = 1) -> None:
+        """Прибавляет (sign=1) или вычитает (sign=-1) другой скетч с теми же параметрами"""
+        for row, other_row in zip(self.rows, other.rows):
+            for index, value in enumerate(other_row):
+                if value:
+                    row[index] += sign * value
+
+    def to_bytes(self) -> bytes:
+        return b"".join(row.tobytes() for row in self.rows)
+
+    def load_bytes(self, data: bytes) -> None:
+        row_size = 8 * self.width
+        for depth_index in range(self.depth):
+            self.rows[depth_index] = array('q', data[depth_index * row_size:(depth_index + 1) * row_size])
+
+
+class SlidingWindowTopK:
+    """
+    Top-K по скользящему окну из временных корзин.
+
+    Каждая корзина - отдельный скетч; скетч окна равен их сумме и при
+    устаревании корзины уменьшается на ее скетч (Count-Min линеен).
+    """
+
+    def __init__(
+        self,
+        window_seconds: int,
+        bucket_seconds: int,
+        k: int = TOP_K,
+        capacity: int = CANDIDATES_PER_WINDOW
+    ):
+        self.window_seconds = window_seconds
+        self.bucket_seconds = bucket_seconds
+        self.k = k
+        self.capacity = capacity
+        self._buckets: deque = deque()  # [(начало корзины, скетч)]
+        self._window = CountMinSketch()
+        self._candidates: Dict[int, int] = {}
+        self._top: List[Tuple[int, int]] = []
+
+    def _refresh_top(self) -> None:
+        self._top = heapq.nlargest(self.k, self._candidates.items(), key=itemgetter(1))
+
+    def _expire(self, now: float) -> None:
+        horizon = now - self.window_seconds
+        expired = False
+        while self._buckets and self._buckets[0][0] + self.bucket_seconds <= horizon:
+            _, sketch = self._buckets.popleft()
+            self._window.merge(sketch, sign=-1)
+            expired = True
+
+        if expired:
+            self._candidates = {
+                key: estimate
+                for key, estimate in ((key, self._window.estimate(key)) for key in self._candidates)
+                if estimate > 0
+            }
+            self._refresh_top()
+
+    def _bucket_for(self, timestamp: float) -> CountMinSketch:
+        start = int(timestamp // self.bucket_seconds) * self.bucket_seconds
+        position = len(self._buckets)
+        for bucket_start, sketch in reversed(self._buckets):
+            if bucket_start == start:
+                return sketch
+            if bucket_start < start:
+                break
+            position -= 1
+        # Корзины упорядочены по времени; опоздавшее событие получает свою корзину
+        sketch = CountMinSketch()
+        self._buckets.insert(position, (start, sketch))
+        return sketch
+
+    def add(self, key: int, count: int, timestamp: float, now: Optional[float] = None) -> None:
+        """
+        Учитывает продажу.
+
+        Args:
+            key: ID аудиокниги
+            count: Количество единиц
+            timestamp: Время продажи (Unix time)
+            now: Текущее время (по умолчанию time.time())
+        """
+        now = time.time() if now is None else now
+        self._expire(now)
+        if timestamp <= now - self.window_seconds:
+            return
+
+        self._bucket_for(timestamp).add(key, count)
+        self._window.add(key, count)
+
+        self._candidates[key] = self._window.estimate(key)
+        if len(self._candidates) > self.capacity:
+            weakest = min(self._candidates.items(), key=itemgetter(1))[0]
+            del self._candidates[weakest]
+        self._refresh_top()
+
+    def merge(self, other: "SlidingWindowTopK") -> None:
+        """Прибавляет корзины и кандидатов другого окна с теми же параметрами"""
+        for start, sketch in other._buckets:
+            self._bucket_for(start).merge(sketch)
+            self._window.merge(sketch)
+        keys = set(self._candidates) | set(other._candidates)
+        estimates = ((key, self._window.estimate(key)) for key in keys)
+        self._candidates = dict(heapq.nlargest(self.capacity, estimates, key=itemgetter(1)))
+        self._refresh_top()
+
+    def top(self, now: float) -> List[Tuple[int, int]]:
+        """
+        Возвращает готовый top-K [(ключ, оценка количества)].
+
+        Пересчет выполняется только при устаревании корзины.
+        """
+        self._expire(now)
+        return self._top
+
+    def state(self) -> dict:
+        return {
+            "window_seconds": self.window_seconds,
+            "bucket_seconds": self.bucket_seconds,
+            "buckets": [
+                [start, base64.b64encode(sketch.to_bytes()).decode("ascii")]
+                for start, sketch in self._buckets
+            ],
+            "candidates": [[key, estimate] for key, estimate in self._candidates.items()],
+        }
+
+    def restore(self, state: dict) -> None:
+        if (state["window_seconds"], state["bucket_seconds"]) != (self.window_seconds, self.bucket_seconds):
+            return
+        self._buckets.clear()
+        self._window = CountMinSketch()
+        for start, encoded in state["buckets"]:
+            sketch = CountMinSketch()
+            sketch.load_bytes(base64.b64decode(encoded))
+            self._buckets.append((start, sketch))
+            self._window.merge(sketch)
+        self._candidates = {key: estimate for key, estimate in state["candidates"]}
+        self._refresh_top()
+
+
+class BestsellerTracker:
+    """
+    Потокобезопасный трекер бестселлеров по нескольким окнам.
+
+    Хранит два набора окон: собственные продажи процесса (сохраняются в
+    его контрольную точку) и представление для чтения - собственные
+    продажи плюс контрольные точки остальных процессов.
+    """
+
+    def __init__(self, windows: Dict[str, Tuple[int, int]] = None, checkpoint_name: Optional[str] = None):
+        self._window_config = windows or WINDOWS
+        self.checkpoint_name = checkpoint_name or f"{CHECKPOINT_PREFIX}{order_number_generator.node_id:04X}"
+        self._windows = self._new_windows()
+        self._view = self._new_windows()
+        self._titles: Dict[int, str] = {}
+        self._lock = threading.Lock()
+
+    def _new_windows(self) -> Dict[str, SlidingWindowTopK]:
+        return {
+            name: SlidingWindowTopK(window_seconds, bucket_seconds)
+            for name, (window_seconds, bucket_seconds) in self._window_config.items()
+        }
+
+    @property
+    def window_names(self) -> List[str]:
+        return list(self._windows)
+
+    def record(self, items: Iterable[dict], timestamp: float) -> None:
+        """
+        Учитывает позиции заказа.
+
+        Args:
+            items: Позиции (audiobook_id, title, quantity)
+            timestamp: Время заказа (Unix time)
+        """
+        now = time.time()
+        with self._lock:
+            for item in items:
+                audiobook_id = int(item["audiobook_id"])
+                quantity = int(item["quantity"])
+                self._titles[audiobook_id] = item.get("title", "")
+                for name, window in self._windows.items():
+                    window.add(audiobook_id, quantity, timestamp, now)
+                    self._view[name].add(audiobook_id, quantity, timestamp, now)
+
+    def top(self, window: str, limit: int = TOP_K) -> List[dict]:
+        """
+        Возвращает бестселлеры окна.
+
+        Args:
+            window: Название окна ("1h", "24h", "7d")
+            limit: Количество позиций (не больше TOP_K)
+
+        Returns:
+            Список {audiobook_id, title, units}, units - оценка сверху
+        """
+        with self._lock:
+            ranked = self._view[window].top(time.time())[:limit]
+            return [
+                {"audiobook_id": audiobook_id, "title": self._titles.get(audiobook_id, ""), "units": units}
+                for audiobook_id, units in ranked
+            ]
+
+    def checkpoint(self, session: Session) -> None:
+        """
+        Сохраняет собственное состояние процесса в его контрольную точку
+        и обновляет представление по контрольным точкам остальных процессов.
+        """
+        with self._lock:
+            own = set()
+            for window in self._windows.values():
+                own.update(window._candidates)
+            tracked = set(own)
+            for window in self._view.values():
+                tracked.update(window._candidates)
+            self._titles = {key: title for key, title in self._titles.items() if key in tracked}
+            state = {
+                "windows": {name: window.state() for name, window in self._windows.items()},
+                "titles": [[key, title] for key, title in self._titles.items() if key in own],
+            }
+        data = zlib.compress(json.dumps(state).encode("utf-8"))
+
+        record = session.get(BestsellerCheckpoint, self.checkpoint_name)
+        if record is None:
+            session.add(BestsellerCheckpoint(name=self.checkpoint_name, data=data))
+        else:
+            record.data = data
+        session.commit()
+        self.refresh_view(session)
+
+    def _decode(self, data: bytes) -> Tuple[Dict[str, SlidingWindowTopK], Dict[int, str]]:
+        state = json.loads(zlib.decompress(data).decode("utf-8"))
+        windows = self._new_windows()
+        for name, window_state in state["windows"].items():
+            if name in windows:
+                windows[name].restore(window_state)
+        return windows, {key: title for key, title in state["titles"]}
+
+    def refresh_view(self, session: Session) -> int:
+        """
+        Пересобирает представление для чтения: собственные продажи процесса
+        плюс контрольные точки остальных процессов.
+
+        Контрольные точки, не обновлявшиеся дольше самого длинного окна,
+        удаляются: все их продажи уже вышли из окон.
+
+        Returns:
+            Количество учтенных контрольных точек других процессов
+        """
+        longest_window = max(window_seconds for window_seconds, _ in self._window_config.values())
+        session.query(BestsellerCheckpoint).filter(
+            BestsellerCheckpoint.name.like(f"{CHECKPOINT_PREFIX}%"),
+            BestsellerCheckpoint.updated_at < datetime.now() - timedelta(seconds=longest_window)
+        ).delete(synchronize_session=False)
+        session.commit()
+
+        rows = session.query(BestsellerCheckpoint.data).filter(
+            BestsellerCheckpoint.name.like(f"{CHECKPOINT_PREFIX}%"),
+            BestsellerCheckpoint.name != self.checkpoint_name
+        ).all()
+        peers = [self._decode(data) for (data,) in rows]
+
+        with self._lock:
+            view = self._new_windows()
+            for name, window in view.items():
+                window.merge(self._windows[name])
+                for peer_windows, _ in peers:
+                    window.merge(peer_windows[name])
+            for _, peer_titles in peers:
+                for key, title in peer_titles.items():
+                    self._titles.setdefault(key, title)
+            self._view = view
+        return len(peers)
+
+    def restore(self, session: Session) -> bool:
+        """
+        Восстанавливает собственное состояние процесса из его контрольной
+        точки (при постоянном ORDERS_NODE_ID) и строит представление.
+
+        Returns:
+            True, если контрольная точка процесса найдена
+        """
+        record = session.get(BestsellerCheckpoint, self.checkpoint_name)
+        if record is not None:
+            windows, titles = self._decode(record.data)
+            with self._lock:
+                self._windows = windows
+                self._titles.update(titles)
+        self.refresh_view(session)
+        return record is not None
+
+
+async def checkpoint_periodically(tracker: BestsellerTracker, interval: float = CHECKPOINT_INTERVAL) -> None:
+    """Периодически сохраняет состояние трекера в базу данных"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(run_with_session, tracker.checkpoint)
+        except Exception as e:
+            print(f"❌ Не удалось сохранить состояние бестселлеров: {str(e)}")
+
+
+# Трекер процесса
+bestseller_tracker = BestsellerTracker()
@@ -0,0 +1,24 @@
+"""
+Выполнение действий с базой данных вне запроса.
+
+Фоновые задачи сервиса (контрольные точки бестселлеров, загрузка статуса
+заказа для Server-Sent Events) работают в пуле потоков и не могут
+использовать сессию запроса, поэтому открывают собственную.
+"""
+
+import sys
+import os
+
+# Добавляем корневую директорию проекта в путь Python
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from database.connection import create_session
+
+
+def run_with_session(action):
+    """Выполняет action(session) в отдельной сессии (для вызова из пула потоков)"""
+    session = create_session()
+    try:
+        return action(session)
+    finally:
+        session.close()
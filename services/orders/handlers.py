@@ -0,0 +1,90 @@
+"""
+Обработчики событий outbox микросервиса "Заказы".
+
+Выполняются фоновыми обработчиками вне запроса клиента.
+"""
+
+import sys
+import os
+from datetime import datetime
+
+# Добавляем корневую директорию проекта в путь Python
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from sqlalchemy.orm import Session
+
+from database.models import OrderOutboxEvent
+from outbox import OutboxProcessor, EVENT_ORDER_CREATED, EVENT_ORDER_STATUS_CHANGED
+from services import OrderService
+from analytics import SalesAnalytics
+from bestsellers import bestseller_tracker
+from library import update_on_status_changed
+from after_commit import call_after_commit
+
+# Автоматически подтверждать новые заказы (пока нет интеграции с платежными системами)
+AUTO_CONFIRM_ORDERS = os.getenv("ORDERS_AUTO_CONFIRM", "false").lower() == "true"
+
+
+def notify_order_created(session: Session, event: OrderOutboxEvent, payload: dict) -> None:
+    """Уведомление о создании заказа"""
+    print(f"📧 Заказ {payload['order_number']} создан на сумму {payload['total_amount']}")
+
+
+def notify_order_status_changed(session: Session, event: OrderOutboxEvent, payload: dict) -> None:
+    """Уведомление о смене статуса заказа"""
+    print(
+        f"📧 Статус заказа {payload['order_number']} изменен: "
+        f"'{payload['old_status']}' -> '{payload['new_status']}'"
+    )
+
+
+def update_sales_on_order_created(session: Session, event: OrderOutboxEvent, payload: dict) -> None:
+    """Обновляет сводки продаж по созданному заказу"""
+    SalesAnalytics(session).record_order_created(payload)
+
+
+def update_sales_on_status_changed(session: Session, event: OrderOutboxEvent, payload: dict) -> None:
+    """Обновляет сводки продаж при смене статуса заказа"""
+    SalesAnalytics(session).record_status_change(payload)
+
+
+def update_library_on_status_changed(session: Session, event: OrderOutboxEvent, payload: dict) -> None:
+    """Добавляет книги оплаченного заказа в библиотеку покупателя или пересчитывает ее при отмене"""
+    update_on_status_changed(session, payload)
+
+
+def track_bestsellers(session: Session, event: OrderOutboxEvent, payload: dict) -> None:
+    """
+    Передает продажи заказа в трекер бестселлеров (приблизительный учет в памяти).
+
+    Скетч обновляется только после фиксации отметки о выполнении события:
+    если фиксация не удалась и событие будет доставлено повторно, продажи
+    не учитываются дважды.
+    """
+    timestamp = datetime.fromisoformat(payload["created_at"]).timestamp()
+    call_after_commit(session, bestseller_tracker.record, payload["items"], timestamp)
+
+
+def confirm_order(session: Session, event: OrderOutboxEvent, payload: dict) -> None:
+    """Переводит новый заказ в статус 'confirmed', если он еще ожидает подтверждения"""
+    order_service = OrderService(session)
+    order = order_service.get_order_by_id(payload['order_id'])
+    if order is not None and order.status == 'pending':
+        order_service.update_order_status(order.id, 'confirmed', commit=False)
+
+
+def register_default_handlers(processor: OutboxProcessor) -> None:
+    """
+    Регистрирует стандартные обработчики событий заказа.
+
+    Args:
+        processor: Обработчик outbox
+    """
+    processor.register(EVENT_ORDER_CREATED, notify_order_created)
+    processor.register(EVENT_ORDER_CREATED, update_sales_on_order_created)
+    processor.register(EVENT_ORDER_STATUS_CHANGED, notify_order_status_changed)
+    processor.register(EVENT_ORDER_STATUS_CHANGED, update_sales_on_status_changed)
+    processor.register(EVENT_ORDER_STATUS_CHANGED, update_library_on_status_changed)
+    if AUTO_CONFIRM_ORDERS:
+        processor.register(EVENT_ORDER_CREATED, confirm_order)
+    processor.register(EVENT_ORDER_CREATED, track_bestsellers)
@@ -0,0 +1,193 @@
+"""
+Поддержка заголовка Idempotency-Key для создания заказов.
+
+Повтор запроса с тем же ключом возвращает сохраненный ответ, а параллельные
+дубликаты в пределах процесса дожидаются результата первого запроса,
+не запуская расчет корзины и создание заказа повторно.
+
+Сохраненные ответы хранятся ORDERS_IDEMPOTENCY_KEY_TTL_HOURS часов (по
+умолчанию 48) и удаляются фоновой задачей сервиса; повтор запроса с ключом
+старше этого срока создает новый заказ.
+"""
+
+import sys
+import os
+
+# Добавляем корневую директорию проекта в путь Python
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import asyncio
+import hashlib
+import json
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Optional, Tuple, Type
+
+from pydantic import BaseModel
+from sqlalchemy import delete
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from database.models import IdempotencyKey
+from db_session import run_with_session
+
+# Срок хранения ответов по ключам идемпотентности и период их очистки
+IDEMPOTENCY_KEY_TTL_HOURS = float(os.getenv("ORDERS_IDEMPOTENCY_KEY_TTL_HOURS", "48"))
+IDEMPOTENCY_PURGE_INTERVAL = float(os.getenv("ORDERS_IDEMPOTENCY_PURGE_INTERVAL", "3600"))
+IDEMPOTENCY_PURGE_BATCH_SIZE = 1000
+
+
+class IdempotencyConflictError(Exception):
+    """Ключ идемпотентности уже использован с другим телом запроса"""
+
+
+def compute_request_hash(payload: dict) -> str:
+    """
+    Вычисляет хеш тела запроса для сравнения повторов.
+
+    Args:
+        payload: Тело запроса
+
+    Returns:
+        SHA-256 от канонического JSON-представления
+    """
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class IdempotencyCoordinator:
+    """
+    Координатор идемпотентных запросов.
+
+    Завершенные ответы хранятся в таблице idempotency_keys (записываются
+    в транзакции заказа), выполняющиеся запросы - в памяти процесса.
+    """
+
+    def __init__(self, response_model: Type[BaseModel]):
+        self.response_model = response_model
+        self._in_flight: Dict[str, Tuple[str, asyncio.Future]] = {}
+
+    def _load(self, db: Session, key: str, request_hash: str) -> Optional[BaseModel]:
+        """
+        Загружает сохраненный ответ по ключу.
+
+        Raises:
+            IdempotencyConflictError: Если ключ сохранен для другого запроса
+        """
+        record = db.query(IdempotencyKey).filter(IdempotencyKey.key == key).first()
+        if record is None:
+            return None
+        if record.request_hash != request_hash:
+            raise IdempotencyConflictError(
+                "Idempotency-Key уже использован с другим телом запроса"
+            )
+        return self.response_model.model_validate_json(record.response_body)
+
+    async def run(
+        self,
+        db: Session,
+        key: str,
+        request_hash: str,
+        create: Callable[[], Awaitable[BaseModel]]
+    ) -> BaseModel:
+        """
+        Выполняет create() не более одного раза для ключа.
+
+        Args:
+            db: Сессия базы данных
+            key: Значение заголовка Idempotency-Key
+            request_hash: Хеш тела запроса
+            create: Корутина, создающая заказ и сохраняющая ответ по ключу
+
+        Returns:
+            Ответ первого успешного запроса с этим ключом
+
+        Raises:
+            IdempotencyConflictError: Если ключ использован с другим телом запроса
+        """
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None:
+            in_flight_hash, future = in_flight
+            if in_flight_hash != request_hash:
+                raise IdempotencyConflictError(
+                    "Idempotency-Key уже использован с другим телом запроса"
+                )
+            return await asyncio.shield(future)
+
+        stored = self._load(db, key, request_hash)
+        if stored is not None:
+            return stored
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = (request_hash, future)
+        try:
+            try:
+                response = await create()
+            except IntegrityError:
+                # Другой процесс успел сохранить ответ по этому ключу -
+                # наша транзакция с заказом уже откачена
+                stored = self._load(db, key, request_hash)
+                if stored is None:
+                    raise
+                response = stored
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # Помечаем исключение как полученное
+            raise
+        else:
+            future.set_result(response)
+            return response
+        finally:
+            self._in_flight.pop(key, None)
+
+
+def purge_expired_keys(
+    db: Session,
+    ttl: timedelta = timedelta(hours=IDEMPOTENCY_KEY_TTL_HOURS),
+    batch_size: int = IDEMPOTENCY_PURGE_BATCH_SIZE
+) -> int:
+    """
+    Удаляет ключи идемпотентности старше ttl.
+
+    Ключи удаляются пачками по ID, каждая пачка - в своей транзакции,
+    чтобы не держать долгих блокировок таблицы idempotency_keys.
+
+    Args:
+        db: Сессия базы данных
+        ttl: Срок хранения сохраненного ответа
+        batch_size: Размер пачки
+
+    Returns:
+        Количество удаленных ключей
+    """
+    cutoff = datetime.now() - ttl
+    purged = 0
+    while True:
+        key_ids = [
+            row.id
+            for row in db.query(IdempotencyKey.id)
+            .filter(IdempotencyKey.created_at < cutoff)
+            .order_by(IdempotencyKey.id)
+            .limit(batch_size)
+        ]
+        if not key_ids:
+            db.rollback()
+            return purged
+        db.execute(
+            delete(IdempotencyKey)
+            .where(IdempotencyKey.id.in_(key_ids))
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        purged += len(key_ids)
+
+
+async def purge_keys_periodically(interval: float = IDEMPOTENCY_PURGE_INTERVAL) -> None:
+    """Периодически удаляет просроченные ключи идемпотентности"""
+    while True:
+        try:
+            purged = await asyncio.to_thread(run_with_session, purge_expired_keys)
+            if purged:
+                print(f"🧹 Удалено просроченных ключей идемпотентности: {purged}")
+        except Exception as e:
+            print(f"❌ Не удалось удалить просроченные ключи идемпотентности: {str(e)}")
+        await asyncio.sleep(interval)
@@ -0,0 +1,282 @@
+"""
+Библиотека приобретенных аудиокниг пользователя (read model).
+
+Для каждого пользователя хранится отсортированный массив ID купленных
+аудиокниг (uint32, 4 байта на книгу) в таблице user_libraries. Книги дает
+заказ в оплаченном (подтвержденном) статусе: массив пополняется, когда
+заказ переходит в такой статус, и пересчитывается, когда заказ его
+покидает (отмена). В памяти процесса библиотеки кешируются как frozenset,
+поэтому проверка "принадлежит ли книга пользователю" выполняется за O(1),
+а страница "моя библиотека" - одним чтением.
+
+Библиотеку меняют фоновые обработчики любого процесса, поэтому запись
+кеша без проверки используется не дольше ORDERS_LIBRARY_CACHE_TTL секунд;
+затем она сверяется с версией строки user_libraries (чтение одного
+числа по первичному ключу) и перечитывается, только если версия изменилась.
+
+Пересчет всех библиотек по истории заказов: python library.py
+"""
+
+import sys
+import os
+
+# Добавляем корневую директорию проекта в путь Python
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import threading
+import time
+from array import array
+from collections import OrderedDict, defaultdict
+from typing import Callable, Dict, FrozenSet, Iterable, Tuple
+
+from sqlalchemy.orm import Session
+
+from database.models import Order, OrderItem, ArchivedOrder, ArchivedOrderItem, UserLibrary
+from after_commit import call_after_commit
+
+# Количество библиотек в кеше процесса
+LIBRARY_CACHE_SIZE = int(os.getenv("ORDERS_LIBRARY_CACHE_SIZE", "10000"))
+# Время использования записи кеша без сверки версии (секунды)
+LIBRARY_CACHE_TTL = float(os.getenv("ORDERS_LIBRARY_CACHE_TTL", "5"))
+
+# Заказы в этих статусах дают право на книги: оплачены (подтверждены) и не отменены
+ENTITLING_STATUSES = ('confirmed', 'processing', 'shipped', 'delivered')
+
+
+def encode_ids(audiobook_ids: Iterable[int]) -> bytes:
+    """Упаковывает ID книг в отсортированный массив uint32"""
+    return array('I', sorted(set(audiobook_ids))).tobytes()
+
+
+def decode_ids(data: bytes) -> array:
+    """Распаковывает отсортированный массив ID книг"""
+    ids = array('I')
+    ids.frombytes(data)
+    return ids
+
+
+class LibraryCache:
+    """
+    LRU-кеш библиотек процесса: user_id -> (frozenset ID книг, версия).
+
+    Запись моложе ttl возвращается без обращения к базе данных, более
+    старая сверяется с текущей версией библиотеки.
+    """
+
+    def __init__(self, max_size: int = LIBRARY_CACHE_SIZE, ttl: float = LIBRARY_CACHE_TTL, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._clock = clock
+        self._entries: "OrderedDict[int, Tuple[FrozenSet[int], int, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Счетчик инвалидаций: загрузка, начатая до инвалидации, не попадает в кеш
+        self._generation = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_or_load(
+        self,
+        user_id: int,
+        loader: Callable[[], Tuple[FrozenSet[int], int]],
+        version_loader: Callable[[], int]
+    ) -> FrozenSet[int]:
+        """
+        Возвращает библиотеку из кеша или загружает ее.
+
+        Args:
+            user_id: ID пользователя
+            loader: Загрузка (множество ID книг, версия)
+            version_loader: Загрузка только текущей версии
+        """
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                self._entries.move_to_end(user_id)
+                if self._clock() - entry[2] < self.ttl:
+                    return entry[0]
+            generation = self._generation
+
+        if entry is not None:
+            owned, version, _ = entry
+            if version_loader() != version:
+                owned, version = loader()
+        else:
+            owned, version = loader()
+
+        with self._lock:
+            if generation == self._generation:
+                self._entries[user_id] = (owned, version, self._clock())
+                self._entries.move_to_end(user_id)
+                if len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+        return owned
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            self._generation += 1
+            self._entries.pop(user_id, None)
+
+
+# Кеш процесса
+library_cache = LibraryCache()
+
+
+class LibraryService:
+    """Чтение и обновление библиотек пользователей"""
+
+    def __init__(self, db_session: Session, cache: LibraryCache = library_cache):
+        self.db = db_session
+        self.cache = cache
+
+    def _load(self, user_id: int) -> Tuple[FrozenSet[int], int]:
+        row = (
+            self.db.query(UserLibrary.audiobook_ids, UserLibrary.version)
+            .filter(UserLibrary.user_id == user_id)
+            .first()
+        )
+        if row is None:
+            return frozenset(), 0
+        return frozenset(decode_ids(row.audiobook_ids)), row.version
+
+    def _load_version(self, user_id: int) -> int:
+        version = (
+            self.db.query(UserLibrary.version)
+            .filter(UserLibrary.user_id == user_id)
+            .scalar()
+        )
+        return version or 0
+
+    def get_owned(self, user_id: int) -> FrozenSet[int]:
+        """
+        Возвращает множество ID купленных пользователем аудиокниг.
+
+        Args:
+            user_id: ID пользователя
+
+        Returns:
+            Множество ID аудиокниг
+        """
+        return self.cache.get_or_load(
+            user_id,
+            lambda: self._load(user_id),
+            lambda: self._load_version(user_id)
+        )
+
+    def owns(self, user_id: int, audiobook_id: int) -> bool:
+        """Проверяет, купил ли пользователь аудиокнигу"""
+        return audiobook_id in self.get_owned(user_id)
+
+    def _store(self, user_id: int, audiobook_ids: Iterable[int], replace: bool) -> None:
+        library = (
+            self.db.query(UserLibrary)
+            .filter(UserLibrary.user_id == user_id)
+            .with_for_update()
+            .first()
+        )
+        owned = set(audiobook_ids)
+        if library is None:
+            library = UserLibrary(user_id=user_id, version=0)
+            self.db.add(library)
+        elif not replace:
+            owned.update(decode_ids(library.audiobook_ids))
+
+        library.audiobook_ids = encode_ids(owned)
+        library.books_count = len(owned)
+        library.version += 1
+        self.db.flush()
+        # Кеш этого процесса сбрасывается сразу после фиксации,
+        # остальные процессы заметят новую версию не позже чем через ttl
+        call_after_commit(self.db, self.cache.invalidate, user_id)
+
+    def grant(self, user_id: int, audiobook_ids: Iterable[int]) -> None:
+        """
+        Добавляет аудиокниги в библиотеку (в текущей транзакции).
+
+        Args:
+            user_id: ID пользователя
+            audiobook_ids: ID купленных аудиокниг
+        """
+        self._store(user_id, audiobook_ids, replace=False)
+
+    def rebuild_user(self, user_id: int) -> None:
+        """
+        Пересчитывает библиотеку пользователя по его оплаченным заказам
+        (рабочим и архивным) - диапазонное чтение по индексу user_id.
+        """
+        owned = set()
+        for order_model, item_model in ((Order, OrderItem), (ArchivedOrder, ArchivedOrderItem)):
+            rows = (
+                self.db.query(item_model.audiobook_id)
+                .join(order_model, order_model.id == item_model.order_id)
+                .filter(order_model.user_id == user_id, order_model.status.in_(ENTITLING_STATUSES))
+                .distinct()
+            )
+            owned.update(audiobook_id for (audiobook_id,) in rows)
+        self._store(user_id, owned, replace=True)
+
+    def rebuild_all(self) -> int:
+        """
+        Пересчитывает все библиотеки по истории заказов.
+
+        Returns:
+            Количество пользователей с библиотекой
+        """
+        libraries: Dict[int, set] = defaultdict(set)
+        for order_model, item_model in ((Order, OrderItem), (ArchivedOrder, ArchivedOrderItem)):
+            rows = (
+                self.db.query(order_model.user_id, item_model.audiobook_id)
+                .join(item_model, item_model.order_id == order_model.id)
+                .filter(order_model.user_id.isnot(None), order_model.status.in_(ENTITLING_STATUSES))
+                .distinct()
+            )
+            for user_id, audiobook_id in rows:
+                libraries[user_id].add(audiobook_id)
+
+        # Версии продолжаются, чтобы кеши процессов заметили пересчет
+        versions = dict(self.db.query(UserLibrary.user_id, UserLibrary.version))
+        self.db.query(UserLibrary).delete()
+        self.db.add_all([
+            UserLibrary(
+                user_id=user_id,
+                audiobook_ids=encode_ids(owned),
+                books_count=len(owned),
+                version=versions.get(user_id, 0) + 1
+            )
+            for user_id, owned in libraries.items()
+        ])
+        self.db.commit()
+        return len(libraries)
+
+
+def update_on_status_changed(session: Session, payload: dict) -> None:
+    """
+    Обновляет библиотеку покупателя, когда заказ получает или теряет
+    право на книги (подтверждение оплаты, отмена).
+    """
+    entitled_before = payload["old_status"] in ENTITLING_STATUSES
+    entitled_after = payload["new_status"] in ENTITLING_STATUSES
+    if entitled_before == entitled_after:
+        return
+    user_id = session.query(Order.user_id).filter(Order.id == payload["order_id"]).scalar()
+    if user_id is None:
+        return
+
+    service = LibraryService(session)
+    if entitled_after:
+        audiobook_ids = [
+            audiobook_id
+            for (audiobook_id,) in session.query(OrderItem.audiobook_id).filter(OrderItem.order_id == payload["order_id"])
+        ]
+        service.grant(user_id, audiobook_ids)
+    else:
+        service.rebuild_user(user_id)
+
+
+if __name__ == "__main__":
+    from database.connection import get_db_session
+
+    print("🔄 Пересчет библиотек пользователей...")
+    with get_db_session() as session:
+        count = LibraryService(session).rebuild_all()
+    print(f"✅ Библиотеки пересчитаны: {count}")
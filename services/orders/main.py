@@ -13,23 +13,44 @@ import os
 # Добавляем корневую директорию проекта в путь Python
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Header, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+import asyncio
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import SQLAlchemyError
-import httpx
+from typing import Optional
+from datetime import datetime
 from contextlib import asynccontextmanager
 
 from database.connection import get_db
-from database.models import Order, OrderItem
+from database.models import ORDER_STATUSES
 from schemas import (
     OrderCreateRequest, 
     OrderResponse, 
     OrderItemResponse, 
-    ErrorResponse,
-    CartCalculationResponse
+    BulkStatusUpdateRequest,
+    BulkStatusUpdateResponse,
+    UserOrdersResponse
 )
 from services import OrderService
+from idempotency import (
+    IdempotencyCoordinator, IdempotencyConflictError, compute_request_hash, purge_keys_periodically
+)
+from outbox import OutboxProcessor, OutboxWorkerPool
+from handlers import register_default_handlers
+from analytics import SalesAnalytics
+from bestsellers import bestseller_tracker, checkpoint_periodically, TOP_K
+from db_session import run_with_session
+from status_stream import order_status_hub, stream_order_status
+from library import LibraryService
+from auth_tokens import get_optional_user_id, get_current_user_id, sync_revocations_periodically
+
+# Фоновая обработка событий заказов (уведомления, аналитика, смена статусов)
+outbox_processor = OutboxProcessor()
+register_default_handlers(outbox_processor)
+outbox_workers = OutboxWorkerPool(outbox_processor)
 
 
 @asynccontextmanager
@@ -37,9 +58,25 @@ async def lifespan(app: FastAPI):
     """Управление жизненным циклом приложения"""
     # Инициализация при запуске
     print("🚀 Микросервис 'Заказы' запускается...")
+    try:
+        await asyncio.to_thread(run_with_session, bestseller_tracker.restore)
+    except Exception as e:
+        print(f"⚠️ Не удалось восстановить состояние бестселлеров: {str(e)}")
+    checkpoint_task = asyncio.create_task(checkpoint_periodically(bestseller_tracker))
+    revocation_sync_task = asyncio.create_task(sync_revocations_periodically())
+    idempotency_purge_task = asyncio.create_task(purge_keys_periodically())
+    outbox_workers.start()
     yield
     # Очистка при завершении
     print("🛑 Микросервис 'Заказы' завершает работу...")
+    await outbox_workers.stop()
+    checkpoint_task.cancel()
+    revocation_sync_task.cancel()
+    idempotency_purge_task.cancel()
+    try:
+        await asyncio.to_thread(run_with_session, bestseller_tracker.checkpoint)
+    except Exception as e:
+        print(f"⚠️ Не удалось сохранить состояние бестселлеров: {str(e)}")
 
 
 app = FastAPI(
@@ -69,6 +106,12 @@ async def root():
             "create_order": "POST /api/v1/orders",
             "get_order": "GET /api/v1/orders/{order_id}",
             "get_orders": "GET /api/v1/orders",
+            "order_events": "GET /api/v1/orders/{order_id}/events",
+            "bulk_update_status": "POST /api/v1/orders/status/bulk",
+            "my_orders": "GET /api/v1/users/me/orders",
+            "my_library": "GET /api/v1/users/me/library",
+            "get_stats": "GET /api/v1/orders/stats",
+            "get_bestsellers": "GET /api/v1/orders/bestsellers",
             "health": "GET /health"
         }
     }
@@ -84,10 +127,71 @@ async def health_check():
     }
 
 
+# Координатор повторных запросов с заголовком Idempotency-Key
+idempotency_coordinator = IdempotencyCoordinator(OrderResponse)
+
+
+async def place_order(
+    order_service: OrderService,
+    request: OrderCreateRequest,
+    idempotency_key: Optional[str] = None,
+    request_hash: Optional[str] = None,
+    user_id: Optional[int] = None
+) -> OrderResponse:
+    """
+    Рассчитывает корзину и транзакционно создает заказ.
+    
+    Raises:
+        HTTPException: Если сервис корзины недоступен или корзина пуста
+        SQLAlchemyError: При ошибке базы данных
+    """
+    # Подготавливаем данные для отправки в сервис корзины
+    cart_items = [
+        {
+            "audiobook_id": item.audiobook_id,
+            "quantity": item.quantity
+        }
+        for item in request.items
+    ]
+    
+    # Валидируем корзину (через микросервис корзины или локально, см. PRICING_MODE)
+    try:
+        cart_response = await order_service.calculate_cart(cart_items)
+    except SQLAlchemyError:
+        # Ошибка общей базы данных при локальном расчете - не ошибка сервиса корзины
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Сервис корзины недоступен: {str(e)}"
+        )
+    
+    # Проверяем, что корзина не пустая
+    if not cart_response.items:
+        raise HTTPException(
+            status_code=400,
+            detail="Корзина пуста или содержит недействительные товары"
+        )
+    
+    # Создаем заказ в транзакции (вместе с событием outbox)
+    response = order_service.create_order_transaction(
+        cart_response,
+        idempotency_key=idempotency_key,
+        request_hash=request_hash,
+        user_id=user_id
+    )
+    
+    # Дальнейшая обработка заказа выполняется фоновыми обработчиками
+    outbox_workers.notify()
+    return response
+
+
 @app.post("/api/v1/orders", response_model=OrderResponse)
 async def create_order(
     request: OrderCreateRequest,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255),
+    user_id: Optional[int] = Depends(get_optional_user_id)
 ):
     """
     Создает новый заказ.
@@ -97,70 +201,45 @@ async def create_order(
     2. Обращается к микросервису "Корзина" для валидации и расчета стоимости
     3. Транзакционно создает заказ и позиции заказа
     4. Возвращает информацию о созданном заказе
+    
+    С токеном авторизации (Bearer) заказ привязывается к пользователю,
+    без токена создается анонимный заказ.
+    
+    С заголовком Idempotency-Key повтор запроса возвращает ранее созданный
+    заказ, а параллельные дубликаты ждут завершения первого запроса.
     """
     try:
         # Создаем сервис для работы с заказами
         order_service = OrderService(db)
         
-        # Подготавливаем данные для отправки в сервис корзины
-        cart_items = [
-            {
-                "audiobook_id": item.audiobook_id,
-                "quantity": item.quantity
-            }
-            for item in request.items
-        ]
-        
-        # Валидируем корзину через микросервис корзины
-        try:
-            cart_response = await order_service.validate_cart_with_cart_service(cart_items)
-        except httpx.HTTPStatusError as e:
-            raise HTTPException(
-                status_code=503,
-                detail=f"Сервис корзины недоступен: {str(e)}"
-            )
+        if idempotency_key is None:
+            return await place_order(order_service, request, user_id=user_id)
         
-        # Проверяем, что корзина не пустая
-        if not cart_response.items:
-            raise HTTPException(
-                status_code=400,
-                detail="Корзина пуста или содержит недействительные товары"
-            )
-        
-        # Создаем заказ в транзакции
-        try:
-            order = order_service.create_order_transaction(cart_response)
-        except SQLAlchemyError as e:
-            raise HTTPException(
-                status_code=500,
-                detail=f"Ошибка при создании заказа: {str(e)}"
-            )
-        
-        # Возвращаем информацию о созданном заказе
-        return OrderResponse(
-            id=order.id,
-            order_number=order.order_number,
-            total_amount=order.total_amount,
-            status=order.status,
-            items=[
-                OrderItemResponse(
-                    id=item.id,
-                    audiobook_id=item.audiobook_id,
-                    title=item.title,
-                    price_per_unit=item.price_per_unit,
-                    quantity=item.quantity,
-                    total_price=item.total_price,
-                    created_at=item.created_at
-                )
-                for item in order.items
-            ],
-            created_at=order.created_at,
-            updated_at=order.updated_at
+        # Ключ одного пользователя не возвращает заказ другого
+        request_payload = request.model_dump()
+        if user_id is not None:
+            request_payload["user_id"] = user_id
+        request_hash = compute_request_hash(request_payload)
+        return await idempotency_coordinator.run(
+            db,
+            idempotency_key,
+            request_hash,
+            lambda: place_order(order_service, request, idempotency_key, request_hash, user_id)
         )
         
     except HTTPException:
         # Перебрасываем HTTP исключения как есть
         raise
+    except IdempotencyConflictError as e:
+        raise HTTPException(
+            status_code=422,
+            detail=str(e)
+        )
+    except SQLAlchemyError as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Ошибка при создании заказа: {str(e)}"
+        )
     except Exception as e:
         # Логируем неожиданные ошибки
         print(f"Неожиданная ошибка при создании заказа: {str(e)}")
@@ -170,11 +249,115 @@ async def create_order(
         )
 
 
+def parse_orders_cursor(cursor: str) -> tuple:
+    """Разбирает курсор истории заказов вида '<created_at ISO>_<id>'"""
+    try:
+        created_at, order_id = cursor.rsplit("_", 1)
+        return datetime.fromisoformat(created_at), int(order_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Неверный курсор")
+
+
+@app.get("/api/v1/users/me/orders", response_model=UserOrdersResponse)
+async def get_my_orders(
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    user_id: int = Depends(get_current_user_id),
+    db: Session = Depends(get_db)
+):
+    """
+    История заказов текущего пользователя (требуется токен), от новых к старым.
+    
+    - cursor: значение next_cursor предыдущей страницы
+    """
+    before = parse_orders_cursor(cursor) if cursor is not None else None
+    
+    order_service = OrderService(db)
+    orders = order_service.get_user_orders(user_id, limit=limit, before=before)
+    
+    next_cursor = None
+    if len(orders) == limit:
+        last = orders[-1]
+        next_cursor = f"{last.created_at.isoformat()}_{last.id}"
+    
+    return {"orders": orders, "next_cursor": next_cursor}
+
+
+@app.get("/api/v1/users/me/library")
+async def get_my_library(
+    user_id: int = Depends(get_current_user_id),
+    db: Session = Depends(get_db)
+):
+    """
+    Библиотека текущего пользователя - ID купленных аудиокниг (требуется токен).
+    
+    Читается из read model user_libraries (с кешем в памяти), а не из истории заказов.
+    """
+    owned = LibraryService(db).get_owned(user_id)
+    return {
+        "user_id": user_id,
+        "audiobook_ids": sorted(owned),
+        "count": len(owned)
+    }
+
+
+@app.get("/api/v1/users/me/library/{audiobook_id}")
+async def check_library_entitlement(
+    audiobook_id: int,
+    user_id: int = Depends(get_current_user_id),
+    db: Session = Depends(get_db)
+):
+    """Проверяет, купил ли текущий пользователь аудиокнигу (требуется токен)"""
+    return {
+        "audiobook_id": audiobook_id,
+        "owned": LibraryService(db).owns(user_id, audiobook_id)
+    }
+
+
+@app.get("/api/v1/orders/stats")
+async def get_orders_stats(
+    days: int = Query(30, ge=1, le=366),
+    top: int = Query(10, ge=1, le=100),
+    db: Session = Depends(get_db)
+):
+    """
+    Отчет по продажам: выручка по дням, самые продаваемые аудиокниги,
+    продажи по категориям и количество заказов по статусам.
+    
+    Читает только инкрементальные сводки, обновляемые фоновыми обработчиками.
+    """
+    return SalesAnalytics(db).get_stats(days=days, top=top)
+
+
+@app.get("/api/v1/orders/bestsellers")
+async def get_bestsellers(
+    window: str = "24h",
+    limit: int = Query(10, ge=1, le=TOP_K)
+):
+    """
+    Бестселлеры за скользящее окно ("1h", "24h" или "7d").
+    
+    Список поддерживается в памяти трекером, который получает продажи
+    из событий создания заказа; запрос не обращается к базе данных.
+    Количество продаж - оценка сверху (Count-Min Sketch).
+    """
+    if window not in bestseller_tracker.window_names:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Неверное окно. Допустимые значения: {bestseller_tracker.window_names}"
+        )
+    
+    return {
+        "window": window,
+        "bestsellers": bestseller_tracker.top(window, limit)
+    }
+
+
 @app.get("/api/v1/orders/{order_id}", response_model=OrderResponse)
 async def get_order(order_id: int, db: Session = Depends(get_db)):
-    """Получает заказ по ID"""
+    """Получает заказ по ID (в том числе перенесенный в архив)"""
     order_service = OrderService(db)
-    order = order_service.get_order_by_id(order_id)
+    order = order_service.get_order_by_id(order_id, include_archived=True)
     
     if not order:
         raise HTTPException(
@@ -204,39 +387,122 @@ async def get_order(order_id: int, db: Session = Depends(get_db)):
     )
 
 
+def load_order_status(order_id: int) -> Optional[dict]:
+    """Читает текущий статус заказа (в том числе архивного) в отдельной короткой сессии"""
+    return run_with_session(lambda session: OrderService(session).get_order_status(order_id))
+
+
+@app.get("/api/v1/orders/{order_id}/events")
+async def order_status_events(order_id: int):
+    """
+    Поток изменений статуса заказа (Server-Sent Events).
+    
+    Первое сообщение - текущий статус, далее - каждое изменение статуса.
+    Открытый поток не держит соединение с базой данных и не выполняет
+    запросов: изменения приходят из хаба статусов процесса.
+    """
+    # Подписываемся до чтения статуса, чтобы не пропустить изменение между ними
+    queue = order_status_hub.subscribe(order_id)
+    try:
+        current = await asyncio.to_thread(load_order_status, order_id)
+    except Exception:
+        order_status_hub.unsubscribe(order_id, queue)
+        raise
+    
+    if current is None:
+        order_status_hub.unsubscribe(order_id, queue)
+        raise HTTPException(
+            status_code=404,
+            detail=f"Заказ с ID {order_id} не найден"
+        )
+    
+    return StreamingResponse(
+        stream_order_status(order_status_hub, order_id, queue, current),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # Отписка и при обрыве соединения до начала потока
+        background=BackgroundTask(order_status_hub.unsubscribe, order_id, queue)
+    )
+
+
 @app.get("/api/v1/orders", response_model=list[OrderResponse])
 async def get_orders(
-    limit: int = 100,
-    offset: int = 0,
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    status: Optional[str] = None,
+    before: Optional[str] = None,
+    since: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
-    """Получает список всех заказов"""
+    """
+    Получает список заказов с курсорной пагинацией.
+    
+    - before: номер заказа, после которого продолжить листание к более старым
+    - since: номер заказа, после которого вернуть более новые заказы (для отслеживания)
+    - status: фильтр по статусу заказа
+    """
+    if status is not None and status not in ORDER_STATUSES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Неверный статус заказа. Допустимые значения: {ORDER_STATUSES}"
+        )
+    
     order_service = OrderService(db)
-    orders = order_service.get_all_orders(limit=limit, offset=offset)
+    orders = order_service.get_all_orders(
+        limit=limit,
+        offset=offset,
+        status=status,
+        before=before,
+        since=since,
+        include_archived=True
+    )
     
-    return [
-        OrderResponse(
-            id=order.id,
-            order_number=order.order_number,
-            total_amount=order.total_amount,
-            status=order.status,
-            items=[
-                OrderItemResponse(
-                    id=item.id,
-                    audiobook_id=item.audiobook_id,
-                    title=item.title,
-                    price_per_unit=item.price_per_unit,
-                    quantity=item.quantity,
-                    total_price=item.total_price,
-                    created_at=item.created_at
-                )
-                for item in order.items
-            ],
-            created_at=order.created_at,
-            updated_at=order.updated_at
+    # Позиции уже загружены через selectinload - FastAPI сериализует
+    # ORM-объекты в OrderResponse за один проход (from_attributes)
+    return orders
+
+
+@app.post("/api/v1/orders/status/bulk", response_model=BulkStatusUpdateResponse)
+async def bulk_update_order_status(
+    request: BulkStatusUpdateRequest,
+    db: Session = Depends(get_db)
+):
+    """
+    Массово переводит заказы в новый статус.
+    
+    Заказы задаются списком order_ids и/или текущим статусом from_status.
+    Для каждого заказа возвращается результат: updated, unchanged,
+    skipped (не в статусе from_status) или not_found.
+    """
+    if request.order_ids is None and request.from_status is None:
+        raise HTTPException(
+            status_code=400,
+            detail="Укажите order_ids или from_status"
         )
-        for order in orders
-    ]
+    
+    order_service = OrderService(db)
+    try:
+        results = order_service.bulk_update_status(
+            request.status,
+            order_ids=request.order_ids,
+            from_status=request.from_status,
+            limit=request.limit
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except SQLAlchemyError as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Ошибка при смене статусов: {str(e)}"
+        )
+    
+    outbox_workers.notify()
+    
+    return {
+        "status": request.status,
+        "updated": sum(1 for result in results if result["outcome"] == "updated"),
+        "results": results
+    }
 
 
 @app.put("/api/v1/orders/{order_id}/status")
@@ -255,6 +521,8 @@ async def update_order_status(
             detail=f"Заказ с ID {order_id} не найден"
         )
     
+    outbox_workers.notify()
+    
     return {
         "message": f"Статус заказа {order_id} обновлен на '{status}'",
         "order_id": order_id,
@@ -0,0 +1,82 @@
+"""
+Генератор упорядоченных по времени номеров заказов (в стиле Snowflake).
+
+Формат: ORD-<YYYYMMDDHHMMSSfff>-<узел:4 hex><последовательность:4 hex>
+
+Номера монотонно возрастают в пределах процесса и лексикографически
+упорядочены по времени между процессами, поэтому вставки идут в конец
+уникального индекса order_number, а "последние заказы" читаются
+обратным проходом по нему. Время в номере - UTC.
+
+Старые номера вида ORD-<YYYYMMDDHHMMSS>-<uuid> содержат местное время
+сервера, поэтому сравниваются с новыми правильно, только если сервер
+работал в UTC или западнее. На сервере с положительным смещением от UTC
+(например, UTC+3) последние старые номера сортируются после новых,
+выданных в первые часы (по величине смещения) после обновления: в этом
+окне порядок по order_number расходится с порядком создания заказов.
+"""
+
+import os
+import secrets
+import threading
+import time
+from datetime import datetime, timezone
+
+# Идентификатор узла отличает номера разных процессов, созданные в одну миллисекунду
+NODE_ID_BITS = 16
+SEQUENCE_BITS = 16
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+
+
+class OrderNumberGenerator:
+    """Потокобезопасный генератор номеров заказов"""
+
+    def __init__(self, node_id: int = None):
+        if node_id is None:
+            node_id = secrets.randbits(NODE_ID_BITS)
+        if not 0 <= node_id < (1 << NODE_ID_BITS):
+            raise ValueError(f"Идентификатор узла должен быть в диапазоне 0..{(1 << NODE_ID_BITS) - 1}")
+        self.node_id = node_id
+        self._lock = threading.Lock()
+        self._last_ms = 0
+        self._sequence = 0
+
+    def _next_timestamp(self) -> tuple:
+        """Возвращает (миллисекунды, номер в последовательности) без повторов."""
+        with self._lock:
+            now_ms = time.time_ns() // 1_000_000
+            if now_ms > self._last_ms:
+                self._last_ms = now_ms
+                self._sequence = 0
+            elif self._sequence < MAX_SEQUENCE:
+                # Та же миллисекунда или часы отстали - продолжаем последовательность
+                self._sequence += 1
+            else:
+                # Последовательность исчерпана - переходим на следующую миллисекунду
+                self._last_ms += 1
+                self._sequence = 0
+            return self._last_ms, self._sequence
+
+    def generate(self) -> str:
+        """
+        Генерирует следующий номер заказа.
+
+        Returns:
+            Номер заказа, больший всех ранее выданных этим генератором
+        """
+        timestamp_ms, sequence = self._next_timestamp()
+        moment = datetime.fromtimestamp(timestamp_ms // 1000, tz=timezone.utc)
+        return (
+            f"ORD-{moment.strftime('%Y%m%d%H%M%S')}{timestamp_ms % 1000:03d}"
+            f"-{self.node_id:04X}{sequence:04X}"
+        )
+
+
+def _node_id_from_env():
+    """Читает идентификатор узла из ORDERS_NODE_ID, если он задан."""
+    value = os.getenv("ORDERS_NODE_ID")
+    return int(value) if value else None
+
+
+# Генератор процесса
+order_number_generator = OrderNumberGenerator(_node_id_from_env())
@@ -0,0 +1,260 @@
+"""
+Транзакционный outbox и пул фоновых обработчиков микросервиса "Заказы".
+
+События пишутся в таблицу order_outbox в той же транзакции, что и заказ,
+поэтому POST /api/v1/orders отвечает сразу после фиксации заказа, а
+уведомления, аналитика и смена статусов выполняются вне запроса.
+Каждый обработчик события выполняется в своей точке сохранения (SAVEPOINT)
+и фиксируется вместе с отметкой о его выполнении: при повторе неудачного
+события вызываются только обработчики, которые еще не выполнились
+(уведомления не отправляются повторно).
+"""
+
+import sys
+import os
+
+# Добавляем корневую директорию проекта в путь Python
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import asyncio
+import json
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from database.connection import create_session
+from database.models import OrderOutboxEvent
+
+# Конфигурация пула обработчиков
+OUTBOX_WORKERS = int(os.getenv("ORDERS_OUTBOX_WORKERS", "2"))
+OUTBOX_POLL_INTERVAL = float(os.getenv("ORDERS_OUTBOX_POLL_INTERVAL", "1.0"))
+OUTBOX_BATCH_SIZE = 50
+OUTBOX_MAX_ATTEMPTS = 5
+
+# Типы событий
+EVENT_ORDER_CREATED = "order_created"
+EVENT_ORDER_STATUS_CHANGED = "order_status_changed"
+
+# Обработчик получает сессию (транзакцию пачки), событие и разобранный payload
+OutboxHandler = Callable[[Session, OrderOutboxEvent, dict], None]
+
+
+def enqueue_event(session: Session, order_id: int, event_type: str, payload: dict) -> OrderOutboxEvent:
+    """
+    Добавляет событие в outbox текущей транзакции.
+
+    Args:
+        session: Сессия, в которой изменяется заказ
+        order_id: ID заказа
+        event_type: Тип события
+        payload: Данные события (сериализуются в JSON)
+
+    Returns:
+        Добавленное событие
+    """
+    event = OrderOutboxEvent(
+        order_id=order_id,
+        event_type=event_type,
+        payload=json.dumps(payload, default=str),
+        status='pending',
+        attempts=0,
+        available_at=datetime.now()
+    )
+    session.add(event)
+    return event
+
+
+def enqueue_events(session: Session, event_type: str, events: List[Tuple[int, dict]]) -> None:
+    """
+    Добавляет пачку однотипных событий в outbox одним INSERT (executemany).
+
+    Args:
+        session: Сессия, в которой изменяются заказы
+        event_type: Тип событий
+        events: Пары (ID заказа, данные события)
+    """
+    if not events:
+        return
+    now = datetime.now()
+    session.execute(insert(OrderOutboxEvent), [
+        {
+            "order_id": order_id,
+            "event_type": event_type,
+            "payload": json.dumps(payload, default=str),
+            "status": 'pending',
+            "attempts": 0,
+            "available_at": now,
+            "created_at": now
+        }
+        for order_id, payload in events
+    ])
+
+
+class OutboxProcessor:
+    """Разбирает пачки событий outbox и вызывает зарегистрированные обработчики"""
+
+    def __init__(self, batch_size: int = OUTBOX_BATCH_SIZE, max_attempts: int = OUTBOX_MAX_ATTEMPTS):
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self._handlers: Dict[str, List[OutboxHandler]] = defaultdict(list)
+
+    def register(self, event_type: str, handler: OutboxHandler) -> None:
+        """
+        Регистрирует обработчик для типа события.
+
+        Args:
+            event_type: Тип события
+            handler: Обработчик
+        """
+        self._handlers[event_type].append(handler)
+
+    def _run_handlers(self, session: Session, event: OrderOutboxEvent) -> Optional[str]:
+        """
+        Вызывает обработчики события, еще не выполненные в прошлых попытках.
+
+        Каждый обработчик выполняется в своей точке сохранения: ошибка
+        откатывает только его изменения, остальные обработчики выполняются
+        и отмечаются в completed_handlers.
+
+        Returns:
+            Текст первой ошибки или None, если все обработчики выполнены
+        """
+        try:
+            payload = json.loads(event.payload)
+        except ValueError as e:
+            return str(e)
+
+        completed = json.loads(event.completed_handlers) if event.completed_handlers else []
+        error = None
+        for handler in self._handlers.get(event.event_type, []):
+            name = handler.__name__
+            if name in completed:
+                continue
+            try:
+                with session.begin_nested():
+                    handler(session, event, payload)
+            except Exception as e:
+                if error is None:
+                    error = f"{name}: {str(e)}"
+            else:
+                completed.append(name)
+        event.completed_handlers = json.dumps(completed)
+        return error
+
+    def process_batch(self, session: Session) -> int:
+        """
+        Обрабатывает очередную пачку готовых событий.
+
+        Строки захватываются через SELECT ... FOR UPDATE SKIP LOCKED, поэтому
+        несколько обработчиков (и несколько процессов) не берут одно событие.
+        Неудачные события откладываются с экспоненциальной задержкой и после
+        max_attempts попыток помечаются как failed.
+
+        Args:
+            session: Сессия базы данных
+
+        Returns:
+            Количество обработанных событий
+        """
+        now = datetime.now()
+        events = (
+            session.query(OrderOutboxEvent)
+            .filter(
+                OrderOutboxEvent.status == 'pending',
+                OrderOutboxEvent.available_at <= now
+            )
+            .order_by(OrderOutboxEvent.id)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+            .all()
+        )
+
+        for event in events:
+            event.attempts += 1
+            error = self._run_handlers(session, event)
+            if error is not None:
+                event.last_error = error
+                if event.attempts >= self.max_attempts:
+                    event.status = 'failed'
+                else:
+                    event.available_at = now + timedelta(seconds=2 ** event.attempts)
+                print(f"❌ Ошибка обработки события {event.id} ({event.event_type}): {error}")
+            else:
+                event.status = 'processed'
+                event.processed_at = now
+
+        session.commit()
+        return len(events)
+
+
+class OutboxWorkerPool:
+    """
+    Пул фоновых обработчиков outbox.
+
+    Каждый обработчик - задача asyncio, выполняющая синхронную работу с БД
+    в пуле потоков. notify() будит обработчики сразу после создания события,
+    опрос по таймеру подбирает события других процессов и отложенные повторы.
+    """
+
+    def __init__(
+        self,
+        processor: OutboxProcessor,
+        workers: int = OUTBOX_WORKERS,
+        poll_interval: float = OUTBOX_POLL_INTERVAL,
+        session_factory: Callable[[], Session] = create_session
+    ):
+        self.processor = processor
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.session_factory = session_factory
+        self._wakeup = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self) -> None:
+        """Запускает обработчики в текущем цикле событий"""
+        for worker_id in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._run(worker_id)))
+
+    async def stop(self) -> None:
+        """Останавливает обработчики"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def notify(self) -> None:
+        """Сообщает обработчикам о новых событиях"""
+        self._wakeup.set()
+
+    def _drain_once(self) -> int:
+        session = self.session_factory()
+        try:
+            return self.processor.process_batch(session)
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    async def _run(self, worker_id: int) -> None:
+        while True:
+            self._wakeup.clear()
+            try:
+                processed = await asyncio.to_thread(self._drain_once)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"❌ Обработчик outbox #{worker_id}: {str(e)}")
+                processed = 0
+
+            # Полная пачка - вероятно, есть еще события
+            if processed >= self.processor.batch_size:
+                continue
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
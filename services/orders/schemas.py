@@ -1,8 +1,12 @@
-from pydantic import BaseModel, Field
-from typing import List, Optional
+from pydantic import BaseModel, Field, PlainSerializer
+from typing import Annotated, List, Optional
 from datetime import datetime
 from decimal import Decimal
 
+# Денежная сумма: внутри сервиса - Decimal, в JSON-ответе - число, как у
+# микросервиса "Корзина" (по умолчанию pydantic выводит Decimal строкой)
+Money = Annotated[Decimal, PlainSerializer(float, return_type=float, when_used="json")]
+
 
 class CartItemInput(BaseModel):
     """Схема для входного элемента корзины"""
@@ -17,12 +21,12 @@ class OrderCreateRequest(BaseModel):
 
 class OrderItemResponse(BaseModel):
     """Схема для ответа с позицией заказа"""
-    id: int
+    id: Optional[int] = Field(None, description="ID позиции (не возвращается при создании заказа)")
     audiobook_id: int
     title: str
-    price_per_unit: Decimal
+    price_per_unit: Money
     quantity: int
-    total_price: Decimal
+    total_price: Money
     created_at: datetime
 
     class Config:
@@ -33,7 +37,7 @@ class OrderResponse(BaseModel):
     """Схема для ответа с заказом"""
     id: int
     order_number: str
-    total_amount: Decimal
+    total_amount: Money
     status: str
     items: List[OrderItemResponse]
     created_at: datetime
@@ -43,10 +47,38 @@ class OrderResponse(BaseModel):
         from_attributes = True
 
 
+class UserOrdersResponse(BaseModel):
+    """Схема для страницы истории заказов пользователя"""
+    orders: List[OrderResponse]
+    next_cursor: Optional[str] = Field(None, description="Курсор следующей страницы")
+
+
+class BulkStatusUpdateRequest(BaseModel):
+    """Схема для массовой смены статуса заказов"""
+    status: str = Field(..., description="Новый статус")
+    order_ids: Optional[List[int]] = Field(None, max_length=1000, description="ID заказов")
+    from_status: Optional[str] = Field(None, description="Переводить только заказы в этом статусе")
+    limit: int = Field(1000, ge=1, le=1000, description="Максимум заказов при выборе только по статусу")
+
+
+class BulkStatusUpdateResult(BaseModel):
+    """Результат смены статуса одного заказа"""
+    order_id: int
+    outcome: str
+    old_status: Optional[str] = None
+
+
+class BulkStatusUpdateResponse(BaseModel):
+    """Схема для ответа на массовую смену статуса"""
+    status: str
+    updated: int
+    results: List[BulkStatusUpdateResult]
+
+
 class CartCalculationResponse(BaseModel):
     """Схема для ответа от сервиса корзины"""
     items: List[dict]
-    total_price: float
+    total_price: Decimal
     calculated_at: datetime
 
 
@@ -6,14 +6,26 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(
 
 import httpx
 import asyncio
-from typing import List, Optional
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime
-from sqlalchemy.orm import Session
+from decimal import Decimal
+from sqlalchemy import insert, tuple_, update
+from sqlalchemy.orm import Session, selectinload
 from sqlalchemy.exc import SQLAlchemyError
-import uuid
 
-from database.models import Order, OrderItem
-from schemas import OrderCreateRequest, CartCalculationResponse
+from database.models import Order, OrderItem, IdempotencyKey, ArchivedOrder
+from database.repositories import AudiobookRepository
+from schemas import OrderCreateRequest, CartCalculationResponse, OrderResponse, OrderItemResponse
+from order_numbers import order_number_generator
+from outbox import enqueue_event, enqueue_events, EVENT_ORDER_CREATED, EVENT_ORDER_STATUS_CHANGED
+from status_stream import order_status_hub, publish_after_commit
+from archive import ARCHIVABLE_STATUSES
+
+# Режим расчета стоимости корзины:
+# - "http" - через микросервис "Корзина" (для раздельного развертывания)
+# - "local" - напрямую из общей базы данных в рамках транзакции заказа
+PRICING_MODE = os.getenv("ORDERS_PRICING_MODE", "http")
 
 
 class OrderService:
@@ -24,14 +36,12 @@ class OrderService:
     
     def generate_order_number(self) -> str:
         """
-        Генерирует уникальный номер заказа.
+        Генерирует уникальный номер заказа, упорядоченный по времени.
         
         Returns:
             Уникальный номер заказа
         """
-        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-        unique_id = str(uuid.uuid4())[:8]
-        return f"ORD-{timestamp}-{unique_id}"
+        return order_number_generator.generate()
     
     async def validate_cart_with_cart_service(self, cart_items: List[dict]) -> CartCalculationResponse:
         """
@@ -69,98 +79,474 @@ class OrderService:
                 response=None
             )
     
-    def create_order_transaction(self, cart_response: CartCalculationResponse) -> Order:
+    def calculate_cart_locally(self, cart_items: List[dict]) -> CartCalculationResponse:
+        """
+        Рассчитывает стоимость корзины напрямую через AudiobookRepository.
+        
+        Все цены читаются одним запросом в той же сессии, в которой затем
+        создается заказ, поэтому цены и вставка заказа попадают в одну транзакцию.
+        Как и микросервис "Корзина", пропускает товары, не найденные в каталоге.
+        
+        Args:
+            cart_items: Список товаров в корзине
+            
+        Returns:
+            Информация о корзине в формате ответа микросервиса "Корзина"
+        """
+        audiobooks = AudiobookRepository(self.db).get_by_ids(
+            [item["audiobook_id"] for item in cart_items]
+        )
+        audiobooks_by_id = {audiobook.id: audiobook for audiobook in audiobooks}
+        
+        items = []
+        total_price = Decimal("0")
+        for item in cart_items:
+            audiobook = audiobooks_by_id.get(item["audiobook_id"])
+            if audiobook is None:
+                continue
+            
+            # Цены остаются Decimal (Numeric в базе) до сериализации ответа
+            price_per_unit = self._to_money(audiobook.price)
+            item_total = price_per_unit * item["quantity"]
+            items.append({
+                "audiobook_id": audiobook.id,
+                "title": audiobook.title,
+                "price_per_unit": price_per_unit,
+                "quantity": item["quantity"],
+                "total_price": item_total
+            })
+            total_price += item_total
+        
+        return CartCalculationResponse(
+            items=items,
+            total_price=total_price,
+            calculated_at=datetime.now()
+        )
+    
+    async def calculate_cart(self, cart_items: List[dict]) -> CartCalculationResponse:
+        """
+        Рассчитывает стоимость корзины в соответствии с PRICING_MODE.
+        
+        Args:
+            cart_items: Список товаров в корзине
+            
+        Returns:
+            Валидированная информация о корзине
+        """
+        if PRICING_MODE == "local":
+            return self.calculate_cart_locally(cart_items)
+        return await self.validate_cart_with_cart_service(cart_items)
+    
+    @staticmethod
+    def _to_money(value) -> Decimal:
+        """Приводит сумму к точности колонок Numeric(10, 2)."""
+        return Decimal(str(value)).quantize(Decimal("0.01"))
+    
+    def create_order_transaction(
+        self,
+        cart_response: CartCalculationResponse,
+        idempotency_key: Optional[str] = None,
+        request_hash: Optional[str] = None,
+        user_id: Optional[int] = None
+    ) -> OrderResponse:
         """
         Создает заказ в транзакции.
         
+        Позиции заказа вставляются одним executemany, а ответ собирается
+        из уже имеющихся данных без перезагрузки ORM-объектов после коммита.
+        ID позиций в ответ не входят: MySQL не возвращает их для executemany,
+        а повторно читать позиции ради них не нужно (см. GET /orders/{id}).
+        Если передан ключ идемпотентности, ответ сохраняется по нему
+        в той же транзакции.
+        
         Args:
             cart_response: Ответ от сервиса корзины
+            idempotency_key: Значение заголовка Idempotency-Key
+            request_hash: Хеш тела запроса для ключа идемпотентности
+            user_id: ID покупателя (None - анонимный заказ)
             
         Returns:
-            Созданный заказ
+            Информация о созданном заказе
             
         Raises:
             SQLAlchemyError: При ошибке базы данных
         """
         try:
+            created_at = datetime.now()
+            order_number = self.generate_order_number()
+            total_amount = self._to_money(cart_response.total_price)
+            
             # Создаем заказ
             order = Order(
-                order_number=self.generate_order_number(),
-                total_amount=cart_response.total_price,
-                status='pending'
+                order_number=order_number,
+                total_amount=total_amount,
+                status='pending',
+                user_id=user_id,
+                created_at=created_at
             )
             
             self.db.add(order)
             self.db.flush()  # Получаем ID заказа
+            order_id = order.id
             
-            # Создаем позиции заказа
-            for item in cart_response.items:
-                order_item = OrderItem(
-                    order_id=order.id,
-                    audiobook_id=item['audiobook_id'],
-                    title=item['title'],
-                    price_per_unit=item['price_per_unit'],
-                    quantity=item['quantity']
-                )
-                self.db.add(order_item)
+            # Создаем позиции заказа одним пакетным запросом
+            item_rows = [
+                {
+                    "order_id": order_id,
+                    "audiobook_id": item['audiobook_id'],
+                    "title": item['title'],
+                    "price_per_unit": self._to_money(item['price_per_unit']),
+                    "quantity": item['quantity'],
+                    "created_at": created_at
+                }
+                for item in cart_response.items
+            ]
+            if item_rows:
+                self.db.execute(insert(OrderItem), item_rows)
+            
+            response = OrderResponse(
+                id=order_id,
+                order_number=order_number,
+                total_amount=total_amount,
+                status='pending',
+                items=[
+                    OrderItemResponse(
+                        audiobook_id=row["audiobook_id"],
+                        title=row["title"],
+                        price_per_unit=row["price_per_unit"],
+                        quantity=row["quantity"],
+                        total_price=row["price_per_unit"] * row["quantity"],
+                        created_at=created_at
+                    )
+                    for row in item_rows
+                ],
+                created_at=created_at,
+                updated_at=None
+            )
+            
+            # Событие для фоновой обработки фиксируется вместе с заказом
+            enqueue_event(self.db, order_id, EVENT_ORDER_CREATED, {
+                "order_id": order_id,
+                "order_number": order_number,
+                "user_id": user_id,
+                "total_amount": str(total_amount),
+                "created_at": created_at.isoformat(),
+                "items": [
+                    {
+                        "audiobook_id": row["audiobook_id"],
+                        "title": row["title"],
+                        "price_per_unit": str(row["price_per_unit"]),
+                        "quantity": row["quantity"]
+                    }
+                    for row in item_rows
+                ]
+            })
+            
+            if idempotency_key is not None:
+                self.db.add(IdempotencyKey(
+                    key=idempotency_key,
+                    request_hash=request_hash,
+                    order_id=order_id,
+                    response_body=response.model_dump_json()
+                ))
             
             self.db.commit()
-            return order
+            return response
             
         except SQLAlchemyError as e:
             self.db.rollback()
             raise e
     
-    def get_order_by_id(self, order_id: int) -> Optional[Order]:
+    def get_order_by_id(self, order_id: int, include_archived: bool = False) -> Optional[Order]:
         """
         Получает заказ по ID.
         
         Args:
             order_id: ID заказа
+            include_archived: Искать в архиве, если заказа нет в рабочей таблице
+                (архивный заказ доступен только для чтения)
             
         Returns:
-            Заказ или None, если не найден
+            Заказ (или ArchivedOrder) или None, если не найден
         """
-        return self.db.query(Order).filter(Order.id == order_id).first()
+        order = self.db.query(Order).filter(Order.id == order_id).first()
+        if order is None and include_archived:
+            return (
+                self.db.query(ArchivedOrder)
+                .options(selectinload(ArchivedOrder.items))
+                .filter(ArchivedOrder.id == order_id)
+                .first()
+            )
+        return order
     
-    def get_order_by_number(self, order_number: str) -> Optional[Order]:
+    def get_order_by_number(self, order_number: str, include_archived: bool = True) -> Optional[Order]:
         """
         Получает заказ по номеру.
         
         Args:
             order_number: Номер заказа
+            include_archived: Искать в архиве, если заказа нет в рабочей таблице
+                (архивный заказ доступен только для чтения)
             
         Returns:
-            Заказ или None, если не найден
+            Заказ (или ArchivedOrder) или None, если не найден
         """
-        return self.db.query(Order).filter(Order.order_number == order_number).first()
+        order = self.db.query(Order).filter(Order.order_number == order_number).first()
+        if order is None and include_archived:
+            return (
+                self.db.query(ArchivedOrder)
+                .options(selectinload(ArchivedOrder.items))
+                .filter(ArchivedOrder.order_number == order_number)
+                .first()
+            )
+        return order
     
-    def get_all_orders(self, limit: int = 100, offset: int = 0) -> List[Order]:
+    def get_order_status(self, order_id: int) -> Optional[dict]:
         """
-        Получает список всех заказов.
+        Получает текущий статус заказа (в том числе архивного) без позиций.
+        
+        Args:
+            order_id: ID заказа
+            
+        Returns:
+            order_id, order_number, status, updated_at или None, если не найден
+        """
+        for model in (Order, ArchivedOrder):
+            row = (
+                self.db.query(model.id, model.order_number, model.status, model.updated_at)
+                .filter(model.id == order_id)
+                .first()
+            )
+            if row is not None:
+                return {
+                    "order_id": row.id,
+                    "order_number": row.order_number,
+                    "status": row.status,
+                    "updated_at": row.updated_at.isoformat() if row.updated_at else None
+                }
+        return None
+    
+    def get_all_orders(
+        self,
+        limit: int = 100,
+        offset: int = 0,
+        status: Optional[str] = None,
+        before: Optional[str] = None,
+        since: Optional[str] = None,
+        include_archived: bool = False
+    ) -> List[Order]:
+        """
+        Получает страницу заказов с курсорной пагинацией по номеру заказа.
+        
+        Номера заказов упорядочены по времени, поэтому выборка идет по индексу
+        order_number (или (status, order_number) при фильтре по статусу).
+        Позиции всех заказов страницы загружаются одним дополнительным запросом.
+        С архивом каждая таблица читается тем же диапазоном индекса, а
+        результаты сливаются по номеру заказа.
         
         Args:
             limit: Максимальное количество заказов
-            offset: Смещение
+            offset: Смещение (для обратной совместимости; курсоры предпочтительнее)
+            status: Фильтр по статусу
+            before: Курсор - вернуть заказы старше этого номера (от новых к старым)
+            since: Курсор - вернуть заказы новее этого номера (от старых к новым)
+            include_archived: Включать заказы, перенесенные в архив
             
         Returns:
-            Список заказов
+            Список заказов (Order или ArchivedOrder)
         """
-        return self.db.query(Order).order_by(Order.created_at.desc()).limit(limit).offset(offset).all()
+        models = [Order]
+        # В архиве только завершенные заказы - при другом фильтре он не читается
+        if include_archived and (status is None or status in ARCHIVABLE_STATUSES):
+            models.append(ArchivedOrder)
+        
+        # С курсором since заказы отдаются в хронологическом порядке,
+        # чтобы клиент мог дочитывать новые заказы по последнему номеру
+        ascending = since is not None and before is None
+        
+        orders = []
+        for model in models:
+            query = self.db.query(model).options(selectinload(model.items))
+            
+            if status is not None:
+                query = query.filter(model.status == status)
+            if before is not None:
+                query = query.filter(model.order_number < before)
+            if since is not None:
+                query = query.filter(model.order_number > since)
+            
+            if ascending:
+                query = query.order_by(model.order_number.asc())
+            else:
+                query = query.order_by(model.order_number.desc())
+            
+            if len(models) == 1:
+                return query.offset(offset).limit(limit).all()
+            # Смещение применяется к слитому списку
+            orders.extend(query.limit(offset + limit).all())
+        
+        orders.sort(key=lambda order: order.order_number, reverse=not ascending)
+        return orders[offset:offset + limit]
     
-    def update_order_status(self, order_id: int, new_status: str) -> Optional[Order]:
+    def get_user_orders(
+        self,
+        user_id: int,
+        limit: int = 20,
+        before: Optional[Tuple[datetime, int]] = None
+    ) -> List[Order]:
+        """
+        Получает историю заказов пользователя, от новых к старым.
+        
+        Каждая таблица (рабочая и архив) читается одним диапазонным
+        сканированием индекса (user_id, created_at); результаты сливаются.
+        
+        Args:
+            user_id: ID пользователя
+            limit: Количество заказов
+            before: Курсор (created_at, id) последнего заказа предыдущей страницы
+            
+        Returns:
+            Заказы (Order или ArchivedOrder) с позициями
+        """
+        orders = []
+        for model in (Order, ArchivedOrder):
+            query = (
+                self.db.query(model)
+                .options(selectinload(model.items))
+                .filter(model.user_id == user_id)
+            )
+            if before is not None:
+                query = query.filter(tuple_(model.created_at, model.id) < tuple_(*before))
+            orders.extend(
+                query.order_by(model.created_at.desc(), model.id.desc()).limit(limit).all()
+            )
+        
+        orders.sort(key=lambda order: (order.created_at, order.id), reverse=True)
+        return orders[:limit]
+    
+    def update_order_status(self, order_id: int, new_status: str, commit: bool = True) -> Optional[Order]:
         """
         Обновляет статус заказа.
         
+        Смена статуса записывает событие в outbox в той же транзакции и
+        после фиксации передается подписчикам потока статусов.
+        
         Args:
             order_id: ID заказа
             new_status: Новый статус
+            commit: Фиксировать ли транзакцию (False - для вызова из обработчиков outbox)
             
         Returns:
             Обновленный заказ или None, если не найден
         """
         order = self.get_order_by_id(order_id)
         if order:
+            old_status = order.status
             order.update_status(new_status)
+            if old_status != new_status:
+                enqueue_event(self.db, order.id, EVENT_ORDER_STATUS_CHANGED, {
+                    "order_id": order.id,
+                    "order_number": order.order_number,
+                    "old_status": old_status,
+                    "new_status": new_status
+                })
+                publish_after_commit(self.db, order_status_hub, order.id, {
+                    "order_id": order.id,
+                    "order_number": order.order_number,
+                    "status": new_status,
+                    "updated_at": datetime.now().isoformat()
+                })
+            if commit:
+                self.db.commit()
+        return order
+
+    def bulk_update_status(
+        self,
+        new_status: str,
+        order_ids: Optional[List[int]] = None,
+        from_status: Optional[str] = None,
+        limit: int = 1000
+    ) -> List[Dict[str, object]]:
+        """
+        Переводит группу заказов в новый статус в одной транзакции.
+        
+        Заказы выбираются по списку ID и/или по текущему статусу (from_status)
+        и блокируются на время транзакции. Изменение выполняется одним
+        UPDATE на каждый исходный статус, события outbox добавляются одним
+        INSERT.
+        
+        Args:
+            new_status: Новый статус
+            order_ids: ID заказов
+            from_status: Переводить только заказы в этом статусе
+            limit: Максимум заказов при выборе только по статусу
+            
+        Returns:
+            Результаты по заказам: order_id, outcome (updated, unchanged,
+            skipped - не в статусе from_status, not_found) и old_status
+            
+        Raises:
+            ValueError: Если статус недопустим
+            SQLAlchemyError: При ошибке базы данных (транзакция откатывается)
+        """
+        Order.validate_status(new_status)
+        if from_status is not None:
+            Order.validate_status(from_status)
+        
+        try:
+            query = self.db.query(Order.id, Order.order_number, Order.status)
+            if order_ids is not None:
+                query = query.filter(Order.id.in_(order_ids))
+            else:
+                query = query.filter(Order.status == from_status).order_by(Order.id).limit(limit)
+            rows = {row.id: row for row in query.with_for_update()}
+            
+            results: Dict[int, Dict[str, object]] = {}
+            by_source_status: Dict[str, List[int]] = defaultdict(list)
+            for order_id, row in rows.items():
+                if from_status is not None and row.status != from_status:
+                    outcome = "skipped"
+                elif row.status == new_status:
+                    outcome = "unchanged"
+                else:
+                    outcome = "updated"
+                    by_source_status[row.status].append(order_id)
+                results[order_id] = {"order_id": order_id, "outcome": outcome, "old_status": row.status}
+            
+            now = datetime.now()
+            events = []
+            for source_status, ids in by_source_status.items():
+                self.db.execute(
+                    update(Order)
+                    .where(Order.id.in_(ids), Order.status == source_status)
+                    .values(status=new_status, updated_at=now)
+                    .execution_options(synchronize_session=False)
+                )
+                for order_id in ids:
+                    order_number = rows[order_id].order_number
+                    events.append((order_id, {
+                        "order_id": order_id,
+                        "order_number": order_number,
+                        "old_status": source_status,
+                        "new_status": new_status
+                    }))
+                    publish_after_commit(self.db, order_status_hub, order_id, {
+                        "order_id": order_id,
+                        "order_number": order_number,
+                        "status": new_status,
+                        "updated_at": now.isoformat()
+                    })
+            
+            enqueue_events(self.db, EVENT_ORDER_STATUS_CHANGED, events)
             self.db.commit()
-        return order 
\ No newline at end of file
+        except SQLAlchemyError as e:
+            # Откат снимает блокировки и отбрасывает отложенные публикации статусов
+            self.db.rollback()
+            raise e
+        
+        if order_ids is None:
+            return list(results.values())
+        return [
+            results.get(order_id, {"order_id": order_id, "outcome": "not_found", "old_status": None})
+            for order_id in order_ids
+        ]
@@ -0,0 +1,144 @@
+"""
+Рассылка изменений статусов заказов подписчикам Server-Sent Events.
+
+OrderService.update_order_status передает изменение в хаб после фиксации
+транзакции; хаб раздает его очередям подписчиков этого заказа. Ожидающий
+подписчик занимает только очередь в памяти и не обращается к базе данных.
+"""
+
+import sys
+import os
+
+# Добавляем корневую директорию проекта в путь Python
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import asyncio
+import json
+import threading
+from collections import defaultdict
+from typing import AsyncIterator, Dict, Optional, Set
+
+from sqlalchemy.orm import Session
+
+from after_commit import call_after_commit
+
+# Интервал комментариев-пингов, удерживающих соединение через прокси
+SSE_HEARTBEAT_INTERVAL = float(os.getenv("ORDERS_SSE_HEARTBEAT_INTERVAL", "15"))
+# Размер очереди подписчика; при переполнении отбрасываются самые старые изменения
+SUBSCRIBER_QUEUE_SIZE = 16
+
+
+class OrderStatusHub:
+    """Хаб подписок на изменения статусов заказов в пределах процесса"""
+
+    def __init__(self, queue_size: int = SUBSCRIBER_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subscribers: Dict[int, Set[asyncio.Queue]] = defaultdict(set)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+
+    @property
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return sum(len(queues) for queues in self._subscribers.values())
+
+    def subscribe(self, order_id: int) -> asyncio.Queue:
+        """Создает очередь изменений заказа (вызывается в цикле событий)"""
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._loop = asyncio.get_running_loop()
+            self._subscribers[order_id].add(queue)
+        return queue
+
+    def unsubscribe(self, order_id: int, queue: asyncio.Queue) -> None:
+        """Удаляет очередь подписчика"""
+        with self._lock:
+            queues = self._subscribers.get(order_id)
+            if queues is None:
+                return
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[order_id]
+
+    def publish(self, order_id: int, update: dict) -> None:
+        """
+        Передает изменение подписчикам заказа.
+
+        Можно вызывать из любого потока: доставка выполняется в цикле
+        событий, в котором созданы очереди.
+        """
+        with self._lock:
+            loop = self._loop
+            has_subscribers = order_id in self._subscribers
+        if loop is None or not has_subscribers or loop.is_closed():
+            return
+
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._deliver(order_id, update)
+        else:
+            loop.call_soon_threadsafe(self._deliver, order_id, update)
+
+    def _deliver(self, order_id: int, update: dict) -> None:
+        with self._lock:
+            queues = list(self._subscribers.get(order_id, ()))
+        for queue in queues:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(update)
+
+
+def publish_after_commit(session: Session, hub: OrderStatusHub, order_id: int, update: dict) -> None:
+    """
+    Откладывает публикацию изменения до фиксации транзакции сессии.
+
+    Изменение отбрасывается при откате транзакции или точки сохранения, в
+    которой оно сделано, поэтому подписчики не видят статусов, которых нет
+    в базе данных.
+    """
+    call_after_commit(session, hub.publish, order_id, update)
+
+
+def format_sse(data: dict, event_name: str = "status") -> str:
+    """Форматирует сообщение Server-Sent Events"""
+    return f"event: {event_name}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def stream_order_status(
+    hub: OrderStatusHub,
+    order_id: int,
+    queue: asyncio.Queue,
+    current: dict,
+    heartbeat_interval: float = SSE_HEARTBEAT_INTERVAL
+) -> AsyncIterator[str]:
+    """
+    Поток SSE по заказу: текущий статус, затем изменения по мере поступления.
+
+    Подписка (queue) оформляется до чтения текущего статуса, чтобы не
+    пропустить изменение между чтением и началом потока.
+
+    Args:
+        hub: Хаб статусов
+        order_id: ID заказа
+        queue: Очередь подписчика из hub.subscribe
+        current: Текущее состояние заказа (первое сообщение)
+        heartbeat_interval: Интервал пингов в секундах
+    """
+    try:
+        yield format_sse(current)
+        while True:
+            try:
+                update = await asyncio.wait_for(queue.get(), timeout=heartbeat_interval)
+            except asyncio.TimeoutError:
+                yield ": ping\n\n"
+                continue
+            yield format_sse(update)
+    finally:
+        hub.unsubscribe(order_id, queue)
+
+
+# Хаб процесса
+order_status_hub = OrderStatusHub()
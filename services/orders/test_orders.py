@@ -6,16 +6,65 @@
 import pytest
 import httpx
 import asyncio
+import importlib.util
+import json
+import time
 from fastapi.testclient import TestClient
+from jose import jwt
 from unittest.mock import patch, AsyncMock
 
 # Добавляем корневую директорию проекта в путь
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+# Модули сервиса импортируются по плоским именам. pytest импортирует этот файл
+# как services.orders.test_orders, и пакет services из корня проекта перекрыл
+# бы модуль services.py сервиса, а при запуске из корня вместе с тестами других
+# сервисов в кэше импортов могут оказаться их main и schemas - убираем их
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+for module_name in ("services", "main", "schemas"):
+    sys.modules.pop(module_name, None)
 
-from main import app
-from schemas import OrderCreateRequest, CartItemInput
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from database.models import (
+    Base, Audiobook, Author, Category, audiobook_category, Order, OrderItem, OrderOutboxEvent, BestsellerCheckpoint,
+    ArchivedOrder, ArchivedOrderItem, IdempotencyKey
+)
+from main import app, parse_orders_cursor
+from database.connection import get_db
+import services as order_services
+from services import OrderService
+from schemas import (
+    OrderCreateRequest, OrderResponse, CartItemInput, BulkStatusUpdateRequest, CartCalculationResponse
+)
+from idempotency import IdempotencyCoordinator, IdempotencyConflictError, compute_request_hash, purge_expired_keys
+from order_numbers import OrderNumberGenerator
+from bestsellers import SlidingWindowTopK, BestsellerTracker
+from status_stream import OrderStatusHub
+from library import LibraryCache, LibraryService, library_cache, encode_ids, decode_ids, update_on_status_changed
+from auth_tokens import SECRET_KEY, ALGORITHM
+from outbox import OutboxProcessor, enqueue_event, EVENT_ORDER_CREATED
+from analytics import SalesAnalytics
+import handlers
+from handlers import track_bestsellers
+from archive import OrderArchiver
+
+
+@pytest.fixture
+def db_session():
+    """Сессия in-memory базы данных SQLite со всеми таблицами"""
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+    engine.dispose()
 
 
 class TestOrdersService:
@@ -41,8 +90,8 @@ class TestOrdersService:
         assert data["status"] == "healthy"
         assert data["service"] == "orders"
     
-    @patch('services.OrderService.validate_cart_with_cart_service')
-    @patch('services.OrderService.create_order_transaction')
+    @patch.object(OrderService, 'validate_cart_with_cart_service')
+    @patch.object(OrderService, 'create_order_transaction')
     def test_create_order_success(self, mock_create_order, mock_validate_cart):
         """Тест успешного создания заказа"""
         # Мокаем ответ от сервиса корзины
@@ -97,7 +146,7 @@ class TestOrdersService:
         assert data["status"] == "pending"
         assert len(data["items"]) == 1
     
-    @patch('services.OrderService.validate_cart_with_cart_service')
+    @patch.object(OrderService, 'validate_cart_with_cart_service')
     def test_create_order_empty_cart(self, mock_validate_cart):
         """Тест создания заказа с пустой корзиной"""
         # Мокаем пустой ответ от сервиса корзины
@@ -119,7 +168,7 @@ class TestOrdersService:
         data = response.json()
         assert "Корзина пуста" in data["detail"]
     
-    @patch('services.OrderService.validate_cart_with_cart_service')
+    @patch.object(OrderService, 'validate_cart_with_cart_service')
     def test_create_order_cart_service_unavailable(self, mock_validate_cart):
         """Тест создания заказа при недоступности сервиса корзины"""
         # Мокаем ошибку сервиса корзины
@@ -138,6 +187,496 @@ class TestOrdersService:
         assert "Сервис корзины недоступен" in data["detail"]
 
 
+class TestOrderTransaction:
+    """Тесты для создания заказа в базе данных"""
+    
+    def test_create_order_builds_response_without_reselect(self, db_session):
+        """Позиции вставляются одним запросом, ответ собирается без повторного чтения"""
+        cart = CartCalculationResponse(
+            items=[
+                {"audiobook_id": 1, "title": "Книга 1", "price_per_unit": 100.0, "quantity": 2},
+                {"audiobook_id": 2, "title": "Книга 2", "price_per_unit": 50.5, "quantity": 1},
+            ],
+            total_price=250.5,
+            calculated_at=datetime.now()
+        )
+        statements = []
+        
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        
+        engine = db_session.get_bind()
+        event.listen(engine, "before_cursor_execute", record)
+        try:
+            response = OrderService(db_session).create_order_transaction(cart, user_id=7)
+        finally:
+            event.remove(engine, "before_cursor_execute", record)
+        
+        assert [str(item.total_price) for item in response.items] == ["200.00", "50.50"]
+        assert all(item.id is None for item in response.items)
+        assert not any(statement.lstrip().upper().startswith("SELECT") for statement in statements)
+        assert db_session.query(OrderItem).filter(OrderItem.order_id == response.id).count() == 2
+        assert db_session.query(OrderOutboxEvent).filter(OrderOutboxEvent.order_id == response.id).count() == 1
+
+
+def load_cart_service():
+    """Загружает main.py микросервиса "Корзина" под отдельным именем модуля"""
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cart", "main.py")
+    spec = importlib.util.spec_from_file_location("cart_service_main", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class TestLocalPricing:
+    """Тесты для локального расчета стоимости корзины"""
+    
+    PRICES = {1: Decimal("19.99"), 2: Decimal("0.10"), 3: Decimal("1234.56")}
+    
+    def add_audiobooks(self, db_session):
+        author = Author(name="Автор")
+        db_session.add(author)
+        db_session.flush()
+        for audiobook_id, price in self.PRICES.items():
+            db_session.add(Audiobook(id=audiobook_id, title=f"Книга {audiobook_id}", price=price, author_id=author.id))
+        db_session.commit()
+    
+    def test_local_mode_matches_cart_service(self, db_session):
+        """Локальный расчет и микросервис "Корзина" дают одинаковые суммы, ненайденная книга пропускается"""
+        self.add_audiobooks(db_session)
+        cart_items = [
+            {"audiobook_id": 1, "quantity": 3},
+            {"audiobook_id": 999, "quantity": 2},
+            {"audiobook_id": 2, "quantity": 7},
+            {"audiobook_id": 3, "quantity": 1},
+        ]
+        service = OrderService(db_session)
+        
+        local = service.calculate_cart_locally(cart_items)
+        assert [item["audiobook_id"] for item in local.items] == [1, 2, 3]
+        assert local.total_price == Decimal("1295.23")
+        
+        # Микросервис "Корзина" получает цены из каталога (JSON-числа)
+        cart_service = load_cart_service()
+        
+        async def get_audiobook_info(audiobook_id, client):
+            price = self.PRICES.get(audiobook_id)
+            if price is None:
+                return None
+            return cart_service.AudiobookInfo(id=audiobook_id, title=f"Книга {audiobook_id}", price=float(price))
+        
+        http_client = httpx.AsyncClient
+        
+        def cart_client(**kwargs):
+            return http_client(transport=httpx.ASGITransport(app=cart_service.app), **kwargs)
+        
+        with patch.object(cart_service, "get_audiobook_info", get_audiobook_info), \
+                patch.object(order_services.httpx, "AsyncClient", cart_client):
+            remote = asyncio.run(service.validate_cart_with_cart_service(cart_items))
+        
+        local_order = service.create_order_transaction(local)
+        remote_order = service.create_order_transaction(remote)
+        assert local_order.total_amount == remote_order.total_amount == Decimal("1295.23")
+        assert [(item.audiobook_id, item.price_per_unit, item.total_price) for item in local_order.items] == \
+            [(item.audiobook_id, item.price_per_unit, item.total_price) for item in remote_order.items]
+
+
+class TestBulkStatusUpdate:
+    """Тесты для массовой смены статуса заказов"""
+    
+    def make_orders(self, db_session, statuses):
+        orders = [
+            Order(order_number=f"ORD-{index}", total_amount=100, status=status)
+            for index, status in enumerate(statuses)
+        ]
+        db_session.add_all(orders)
+        db_session.commit()
+        return [order.id for order in orders]
+    
+    def test_mixed_source_statuses(self, db_session):
+        """Заказы из разных статусов переводятся, события пишутся в outbox"""
+        pending, confirmed, shipped = self.make_orders(db_session, ["pending", "confirmed", "shipped"])
+        
+        results = OrderService(db_session).bulk_update_status(
+            "shipped", order_ids=[pending, confirmed, shipped, 999]
+        )
+        
+        assert [(result["outcome"], result["old_status"]) for result in results] == [
+            ("updated", "pending"), ("updated", "confirmed"), ("unchanged", "shipped"), ("not_found", None)
+        ]
+        db_session.expire_all()
+        assert {order.status for order in db_session.query(Order)} == {"shipped"}
+        events = db_session.query(OrderOutboxEvent).order_by(OrderOutboxEvent.order_id).all()
+        assert [(event.order_id, json.loads(event.payload)["old_status"]) for event in events] == [
+            (pending, "pending"), (confirmed, "confirmed")
+        ]
+    
+    def test_from_status_skips_other_orders(self, db_session):
+        """С from_status заказы в другом статусе пропускаются"""
+        pending, confirmed = self.make_orders(db_session, ["pending", "confirmed"])
+        results = OrderService(db_session).bulk_update_status(
+            "cancelled", order_ids=[pending, confirmed], from_status="pending"
+        )
+        assert [result["outcome"] for result in results] == ["updated", "skipped"]
+        assert db_session.get(Order, confirmed).status == "confirmed"
+    
+    def test_failure_rolls_back(self, db_session):
+        """Ошибка базы данных откатывает смену статусов целиком"""
+        first, second = self.make_orders(db_session, ["pending", "confirmed"])
+        with patch.object(order_services, "enqueue_events", side_effect=SQLAlchemyError("сбой")):
+            with pytest.raises(SQLAlchemyError):
+                OrderService(db_session).bulk_update_status("shipped", order_ids=[first, second])
+        
+        db_session.expire_all()
+        assert [db_session.get(Order, order_id).status for order_id in (first, second)] == ["pending", "confirmed"]
+        assert db_session.query(OrderOutboxEvent).count() == 0
+
+
+class TestOrderArchiver:
+    """Тесты для архивации завершенных заказов"""
+    
+    def add_order(self, db_session, number, status, age_days):
+        moment = datetime.now() - timedelta(days=age_days)
+        order = Order(order_number=number, total_amount=100, status=status, created_at=moment, updated_at=moment)
+        db_session.add(order)
+        db_session.flush()
+        db_session.add(OrderItem(
+            order_id=order.id, audiobook_id=1, title="Книга", price_per_unit=100, quantity=1, created_at=moment
+        ))
+        return order.id
+    
+    def make_orders(self, db_session):
+        ids = {
+            "old_delivered": self.add_order(db_session, "ORD-1", "delivered", 200),
+            "old_cancelled_with_event": self.add_order(db_session, "ORD-2", "cancelled", 200),
+            "old_pending": self.add_order(db_session, "ORD-3", "pending", 200),
+            "recent_delivered": self.add_order(db_session, "ORD-4", "delivered", 1),
+        }
+        enqueue_event(db_session, ids["old_cancelled_with_event"], "test_event", {})
+        db_session.add(IdempotencyKey(
+            key="key-1", request_hash="hash", order_id=ids["old_delivered"], response_body="{}"
+        ))
+        db_session.commit()
+        return ids
+    
+    def test_moves_only_finished_old_orders(self, db_session):
+        """В архив переносятся завершенные старые заказы без необработанных событий"""
+        ids = self.make_orders(db_session)
+        
+        assert OrderArchiver(db_session, batch_size=1).run(max_age_days=180) == 1
+        
+        assert [order.id for order in db_session.query(ArchivedOrder)] == [ids["old_delivered"]]
+        assert db_session.query(ArchivedOrderItem).count() == 1
+        assert db_session.get(Order, ids["old_delivered"]) is None
+        assert db_session.query(OrderItem).filter(OrderItem.order_id == ids["old_delivered"]).count() == 0
+        assert db_session.query(Order).count() == 3
+        # Сохраненный ответ ключа идемпотентности остается
+        db_session.expire_all()
+        assert db_session.query(IdempotencyKey).filter(IdempotencyKey.key == "key-1").one().order_id is None
+    
+    def test_archived_order_is_readable(self, db_session):
+        """Архивный заказ находится по ID, номеру, в потоке статусов и в списке"""
+        ids = self.make_orders(db_session)
+        OrderArchiver(db_session).run(max_age_days=180)
+        order_id = ids["old_delivered"]
+        service = OrderService(db_session)
+        
+        assert isinstance(service.get_order_by_id(order_id, include_archived=True), ArchivedOrder)
+        assert service.get_order_by_id(order_id) is None
+        assert service.get_order_by_number("ORD-1").id == order_id
+        assert service.get_order_status(order_id)["status"] == "delivered"
+        
+        listed = service.get_all_orders(include_archived=True)
+        assert [order.order_number for order in listed] == ["ORD-4", "ORD-3", "ORD-2", "ORD-1"]
+        assert [order.order_number for order in service.get_all_orders(include_archived=True, limit=2, offset=2)] == [
+            "ORD-2", "ORD-1"
+        ]
+        assert [order.order_number for order in service.get_all_orders(include_archived=True, since="ORD-2")] == [
+            "ORD-3", "ORD-4"
+        ]
+        assert [order.order_number for order in service.get_all_orders()] == ["ORD-4", "ORD-3", "ORD-2"]
+
+
+class TestSalesAnalytics:
+    """Тесты для инкрементальных сводок продаж"""
+    
+    def create_order(self, db_session, items):
+        cart = CartCalculationResponse(
+            items=[
+                {"audiobook_id": audiobook_id, "title": f"Книга {audiobook_id}", "price_per_unit": price, "quantity": quantity}
+                for audiobook_id, price, quantity in items
+            ],
+            total_price=sum(price * quantity for _, price, quantity in items),
+            calculated_at=datetime.now()
+        )
+        return OrderService(db_session).create_order_transaction(cart).id
+    
+    def apply_events(self, db_session):
+        """Передает необработанные события outbox в аналитику, как обработчики handlers.py"""
+        analytics = SalesAnalytics(db_session)
+        events = (
+            db_session.query(OrderOutboxEvent)
+            .filter(OrderOutboxEvent.status == "pending")
+            .order_by(OrderOutboxEvent.id)
+            .all()
+        )
+        for outbox_event in events:
+            payload = json.loads(outbox_event.payload)
+            if outbox_event.event_type == EVENT_ORDER_CREATED:
+                analytics.record_order_created(payload)
+            else:
+                analytics.record_status_change(payload)
+            outbox_event.status = "processed"
+        db_session.commit()
+    
+    def summary(self, stats):
+        day = stats["daily_revenue"][0] if stats["daily_revenue"] else {}
+        return (
+            stats["total_revenue"],
+            day.get("orders_count", 0),
+            day.get("units", 0),
+            [(row["audiobook_id"], row["units"], row["revenue"]) for row in stats["top_audiobooks"]],
+            {status: count for status, count in stats["status_counts"].items() if count}
+        )
+    
+    def test_created_cancelled_and_restored_orders(self, db_session):
+        """Создание учитывается, отмена вычитает продажи, выход из отмены возвращает их"""
+        db_session.add(Category(id=1, name="Фантастика"))
+        db_session.execute(audiobook_category.insert(), [
+            {"audiobook_id": 1, "category_id": 1}, {"audiobook_id": 2, "category_id": 1}
+        ])
+        first = self.create_order(db_session, [(1, 100.0, 2), (2, 50.5, 1)])
+        self.create_order(db_session, [(2, 50.5, 2)])
+        self.apply_events(db_session)
+        
+        analytics = SalesAnalytics(db_session)
+        stats = analytics.get_stats()
+        assert self.summary(stats) == (
+            351.5, 2, 5, [(2, 3, 151.5), (1, 2, 200.0)], {"pending": 2}
+        )
+        assert stats["categories"] == [{"category": "Фантастика", "units": 5, "revenue": 351.5}]
+        
+        service = OrderService(db_session)
+        service.update_order_status(first, "cancelled")
+        self.apply_events(db_session)
+        assert self.summary(analytics.get_stats()) == (
+            101.0, 1, 2, [(2, 2, 101.0), (1, 0, 0.0)], {"pending": 1, "cancelled": 1}
+        )
+        
+        service.update_order_status(first, "confirmed")
+        self.apply_events(db_session)
+        assert self.summary(analytics.get_stats()) == (
+            351.5, 2, 5, [(2, 3, 151.5), (1, 2, 200.0)], {"pending": 1, "confirmed": 1}
+        )
+    
+    def test_rebuild_counts_archived_orders(self, db_session):
+        """Пересчет по рабочим и архивным таблицам совпадает с инкрементальными сводками"""
+        delivered = self.create_order(db_session, [(1, 100.0, 1), (2, 50.5, 4)])
+        cancelled = self.create_order(db_session, [(1, 100.0, 3)])
+        self.create_order(db_session, [(2, 50.5, 1)])
+        service = OrderService(db_session)
+        service.update_order_status(delivered, "delivered")
+        service.update_order_status(cancelled, "cancelled")
+        self.apply_events(db_session)
+        analytics = SalesAnalytics(db_session)
+        expected = self.summary(analytics.get_stats())
+        assert expected == (352.5, 2, 6, [(2, 5, 252.5), (1, 1, 100.0)], {"pending": 1, "delivered": 1, "cancelled": 1})
+        
+        assert OrderArchiver(db_session).archive_batch(datetime.now() + timedelta(days=1)) == 2
+        assert db_session.query(ArchivedOrder).count() == 2
+        analytics.rebuild()
+        assert self.summary(analytics.get_stats()) == expected
+
+
+class TestOrderListing:
+    """Тесты для курсорной пагинации списка заказов"""
+    
+    def make_orders(self, db_session, statuses):
+        for index, status in enumerate(statuses, start=1):
+            db_session.add(Order(order_number=f"ORD-{index}", total_amount=100, status=status))
+        db_session.commit()
+    
+    def numbers(self, orders):
+        return [order.order_number for order in orders]
+    
+    def test_before_and_since_cursors(self, db_session):
+        """before листает к более старым заказам, since отдает более новые по возрастанию"""
+        self.make_orders(db_session, ["pending"] * 5)
+        service = OrderService(db_session)
+        
+        first_page = service.get_all_orders(limit=2)
+        assert self.numbers(first_page) == ["ORD-5", "ORD-4"]
+        second_page = service.get_all_orders(limit=2, before=first_page[-1].order_number)
+        assert self.numbers(second_page) == ["ORD-3", "ORD-2"]
+        assert self.numbers(service.get_all_orders(limit=2, before="ORD-2")) == ["ORD-1"]
+        
+        assert self.numbers(service.get_all_orders(limit=2, since="ORD-2")) == ["ORD-3", "ORD-4"]
+        assert self.numbers(service.get_all_orders(since="ORD-5")) == []
+        # С обоими курсорами - диапазон от новых к старым
+        assert self.numbers(service.get_all_orders(before="ORD-5", since="ORD-2")) == ["ORD-4", "ORD-3"]
+    
+    def test_status_filter_uses_status_index(self, db_session):
+        """Фильтр по статусу читает индекс (status, order_number) в порядке номеров"""
+        self.make_orders(db_session, ["pending", "shipped", "pending", "shipped", "pending"])
+        service = OrderService(db_session)
+        statements = []
+        
+        def record(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().upper().startswith("SELECT") and "FROM orders " in statement:
+                statements.append((statement, parameters))
+        
+        engine = db_session.get_bind()
+        event.listen(engine, "before_cursor_execute", record)
+        try:
+            orders = service.get_all_orders(status="pending", before="ORD-5")
+        finally:
+            event.remove(engine, "before_cursor_execute", record)
+        
+        assert self.numbers(orders) == ["ORD-3", "ORD-1"]
+        statement, parameters = statements[0]
+        with engine.connect() as connection:
+            plan = connection.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).fetchall()
+        details = " ".join(row[-1] for row in plan)
+        assert "ix_orders_status_order_number" in details
+        assert "TEMP B-TREE" not in details
+    
+    def test_include_archived_merges_by_number(self, db_session):
+        """С архивом заказы обеих таблиц сливаются по номеру, курсоры действуют на обе"""
+        self.make_orders(db_session, ["pending", "delivered", "pending"])
+        for order_id, number in ((10, "ORD-0"), (11, "ORD-2a"), (12, "ORD-4")):
+            db_session.add(ArchivedOrder(id=order_id, order_number=number, total_amount=100, status="delivered"))
+        db_session.commit()
+        service = OrderService(db_session)
+        
+        assert self.numbers(service.get_all_orders(include_archived=True)) == [
+            "ORD-4", "ORD-3", "ORD-2a", "ORD-2", "ORD-1", "ORD-0"
+        ]
+        assert self.numbers(service.get_all_orders(include_archived=True, limit=2, before="ORD-3")) == [
+            "ORD-2a", "ORD-2"
+        ]
+        assert self.numbers(service.get_all_orders(include_archived=True, limit=3, since="ORD-1")) == [
+            "ORD-2", "ORD-2a", "ORD-3"
+        ]
+        assert self.numbers(service.get_all_orders(include_archived=True, status="delivered")) == [
+            "ORD-4", "ORD-2a", "ORD-2", "ORD-0"
+        ]
+        # В архиве нет незавершенных заказов - он не читается
+        assert self.numbers(service.get_all_orders(include_archived=True, status="pending")) == ["ORD-3", "ORD-1"]
+        assert self.numbers(service.get_all_orders()) == ["ORD-3", "ORD-2", "ORD-1"]
+
+
+class TestUserOrders:
+    """Тесты для истории заказов пользователя"""
+    
+    def make_orders(self, db_session):
+        base = datetime(2024, 1, 1, 12, 0, 0, 123456)
+        # Два заказа с одинаковым временем создания различаются по ID
+        for index, minutes in enumerate((0, 10, 10, 20, 30), start=1):
+            db_session.add(Order(
+                order_number=f"ORD-{index}", total_amount=100, status="pending",
+                user_id=1, created_at=base + timedelta(minutes=minutes)
+            ))
+        db_session.add(Order(order_number="ORD-9", total_amount=100, status="pending", user_id=2, created_at=base))
+        db_session.add(ArchivedOrder(
+            id=100, order_number="ORD-0", total_amount=100, status="delivered",
+            user_id=1, created_at=base - timedelta(days=1)
+        ))
+        db_session.commit()
+    
+    def get(self, path, user_id=1, db_session=None, **params):
+        headers = {}
+        if user_id is not None:
+            headers["Authorization"] = f"Bearer {jwt.encode({'sub': 'user', 'user_id': user_id}, SECRET_KEY, algorithm=ALGORITHM)}"
+        app.dependency_overrides[get_db] = lambda: db_session
+        try:
+            return TestClient(app).get(path, params=params, headers=headers)
+        finally:
+            app.dependency_overrides.clear()
+    
+    def test_cursor_pages_through_history(self, db_session):
+        """next_cursor '<created_at>_<id>' листает историю от новых к старым вместе с архивом"""
+        self.make_orders(db_session)
+        numbers = []
+        cursors = []
+        params = {"limit": 2}
+        while True:
+            response = self.get("/api/v1/users/me/orders", db_session=db_session, **params)
+            assert response.status_code == 200
+            data = response.json()
+            numbers.extend(order["order_number"] for order in data["orders"])
+            if data["next_cursor"] is None:
+                break
+            cursors.append(data["next_cursor"])
+            params["cursor"] = data["next_cursor"]
+        
+        assert numbers == ["ORD-5", "ORD-4", "ORD-3", "ORD-2", "ORD-1", "ORD-0"]
+        assert cursors[0] == "2024-01-01T12:20:00.123456_4"
+        assert parse_orders_cursor(cursors[1]) == (datetime(2024, 1, 1, 12, 10, 0, 123456), 2)
+    
+    def test_invalid_cursor_rejected(self, db_session):
+        """Неверный курсор отклоняется с кодом 400"""
+        self.make_orders(db_session)
+        for cursor in ("garbage", "2024-13-01T00:00:00_5", "2024-01-01T00:00:00_x", "_5", "2024-01-01T00:00:00_"):
+            response = self.get("/api/v1/users/me/orders", db_session=db_session, cursor=cursor)
+            assert response.status_code == 400, cursor
+            assert response.json()["detail"] == "Неверный курсор"
+    
+    def test_token_required(self, db_session):
+        """Без токена или с недействительным токеном история недоступна"""
+        response = self.get("/api/v1/users/me/orders", user_id=None, db_session=db_session)
+        assert response.status_code == 401
+        
+        app.dependency_overrides[get_db] = lambda: db_session
+        try:
+            response = TestClient(app).get(
+                "/api/v1/users/me/orders", headers={"Authorization": "Bearer not-a-token"}
+            )
+        finally:
+            app.dependency_overrides.clear()
+        assert response.status_code == 401
+
+
+class TestOutbox:
+    """Тесты для обработки событий outbox"""
+    
+    def test_retry_runs_only_failed_handlers(self, db_session):
+        """При повторе события успешно выполненные обработчики не вызываются"""
+        order = Order(order_number="ORD-1", total_amount=100, status="pending")
+        db_session.add(order)
+        db_session.flush()
+        event_row = enqueue_event(db_session, order.id, "test_event", {"order_id": order.id})
+        db_session.commit()
+        
+        calls = []
+        failures = [1]
+        
+        def notify(session, event, payload):
+            calls.append("notify")
+        
+        def flaky(session, event, payload):
+            calls.append("flaky")
+            if failures[0]:
+                failures[0] -= 1
+                raise RuntimeError("временная ошибка")
+        
+        processor = OutboxProcessor()
+        processor.register("test_event", notify)
+        processor.register("test_event", flaky)
+        
+        assert processor.process_batch(db_session) == 1
+        db_session.refresh(event_row)
+        assert event_row.status == "pending"
+        assert "flaky" in event_row.last_error
+        
+        # Повтор - без ожидания экспоненциальной задержки
+        event_row.available_at = datetime.now()
+        db_session.commit()
+        assert processor.process_batch(db_session) == 1
+        db_session.refresh(event_row)
+        assert event_row.status == "processed"
+        assert calls == ["notify", "flaky", "flaky"]
+
+
 class TestOrderSchemas:
     """Тесты для схем данных"""
     
@@ -169,6 +708,408 @@ class TestOrderSchemas:
         # Пустой список товаров
         empty_request = OrderCreateRequest(items=[])
         assert len(empty_request.items) == 0
+    
+    def test_bulk_status_update_request_validation(self):
+        """Тест валидации BulkStatusUpdateRequest"""
+        request = BulkStatusUpdateRequest(status="shipped", from_status="processing")
+        assert request.order_ids is None
+        assert request.limit == 1000
+        
+        # Не больше 1000 заказов за запрос
+        with pytest.raises(ValueError):
+            BulkStatusUpdateRequest(status="shipped", order_ids=list(range(1001)))
+
+
+class TestIdempotency:
+    """Тесты для ключей идемпотентности"""
+    
+    def test_request_hash_ignores_key_order(self):
+        """Хеш не зависит от порядка ключей в теле запроса"""
+        first = {"items": [{"audiobook_id": 1, "quantity": 2}]}
+        second = {"items": [{"quantity": 2, "audiobook_id": 1}]}
+        assert compute_request_hash(first) == compute_request_hash(second)
+    
+    def test_request_hash_differs_for_different_items(self):
+        """Разные составы корзины дают разные хеши"""
+        first = {"items": [{"audiobook_id": 1, "quantity": 2}]}
+        second = {"items": [{"audiobook_id": 1, "quantity": 3}]}
+        assert compute_request_hash(first) != compute_request_hash(second)
+
+    def make_cart(self) -> CartCalculationResponse:
+        return CartCalculationResponse(
+            items=[{"audiobook_id": 1, "title": "Книга 1", "price_per_unit": 100.0, "quantity": 2}],
+            total_price=200.0,
+            calculated_at=datetime.now()
+        )
+    
+    def post_order(self, client, key: str, quantity: int = 2):
+        return client.post(
+            "/api/v1/orders",
+            json={"items": [{"audiobook_id": 1, "quantity": quantity}]},
+            headers={"Idempotency-Key": key}
+        )
+    
+    def test_replayed_key_returns_same_order(self, db_session):
+        """Повтор с тем же ключом и телом возвращает тот же заказ, корзина не пересчитывается"""
+        app.dependency_overrides[get_db] = lambda: db_session
+        try:
+            with patch.object(OrderService, "calculate_cart", AsyncMock(return_value=self.make_cart())) as calculate:
+                client = TestClient(app)
+                first = self.post_order(client, "key-1")
+                second = self.post_order(client, "key-1")
+        finally:
+            app.dependency_overrides.clear()
+        
+        assert first.status_code == 200
+        assert second.status_code == 200
+        assert second.json() == first.json()
+        assert first.json()["total_amount"] == 200.0
+        assert calculate.await_count == 1
+        assert db_session.query(Order).count() == 1
+    
+    def test_key_reused_with_other_body_rejected(self, db_session):
+        """Ключ, использованный с другим телом запроса, отклоняется с кодом 422"""
+        app.dependency_overrides[get_db] = lambda: db_session
+        try:
+            with patch.object(OrderService, "calculate_cart", AsyncMock(return_value=self.make_cart())):
+                client = TestClient(app)
+                assert self.post_order(client, "key-2").status_code == 200
+                response = self.post_order(client, "key-2", quantity=3)
+        finally:
+            app.dependency_overrides.clear()
+        
+        assert response.status_code == 422
+        assert "Idempotency-Key" in response.json()["detail"]
+        assert db_session.query(Order).count() == 1
+    
+    def test_concurrent_duplicates_wait_for_first_request(self, db_session):
+        """Параллельные дубликаты ждут первый запрос и получают его ответ"""
+        coordinator = IdempotencyCoordinator(OrderResponse)
+        calls = []
+        
+        async def scenario():
+            release = asyncio.Event()
+            
+            async def create():
+                calls.append(1)
+                await release.wait()
+                return OrderService(db_session).create_order_transaction(
+                    self.make_cart(), idempotency_key="key-3", request_hash="hash"
+                )
+            
+            tasks = [
+                asyncio.create_task(coordinator.run(db_session, "key-3", "hash", create))
+                for _ in range(3)
+            ]
+            await asyncio.sleep(0.01)
+            # Дубликат с другим телом не ждет, а сразу отклоняется
+            with pytest.raises(IdempotencyConflictError):
+                await coordinator.run(db_session, "key-3", "other-hash", create)
+            release.set()
+            return await asyncio.gather(*tasks)
+        
+        responses = asyncio.run(scenario())
+        assert len(calls) == 1
+        assert len({response.id for response in responses}) == 1
+        assert db_session.query(Order).count() == 1
+    
+    def test_integrity_error_falls_back_to_stored_response(self, db_session):
+        """Если другой процесс успел сохранить ключ, возвращается его ответ"""
+        coordinator = IdempotencyCoordinator(OrderResponse)
+        stored = OrderService(db_session).create_order_transaction(self.make_cart())
+        
+        async def create():
+            # Другой процесс зафиксировал ответ, наша вставка ключа нарушает уникальность
+            db_session.add(IdempotencyKey(
+                key="key-4", request_hash="hash", order_id=stored.id,
+                response_body=stored.model_dump_json()
+            ))
+            db_session.commit()
+            raise IntegrityError("INSERT INTO idempotency_keys", {}, Exception("duplicate"))
+        
+        response = asyncio.run(coordinator.run(db_session, "key-4", "hash", create))
+        assert response.id == stored.id
+        
+        async def create_without_stored():
+            raise IntegrityError("INSERT INTO orders", {}, Exception("duplicate"))
+        
+        with pytest.raises(IntegrityError):
+            asyncio.run(coordinator.run(db_session, "key-5", "hash", create_without_stored))
+    
+    def test_expired_keys_purged(self, db_session):
+        """Удаляются только ключи старше срока хранения"""
+        now = datetime.now()
+        for index, age in enumerate((timedelta(hours=72), timedelta(hours=50), timedelta(hours=1))):
+            db_session.add(IdempotencyKey(
+                key=f"key-{index}", request_hash="hash", response_body="{}", created_at=now - age
+            ))
+        db_session.commit()
+        
+        assert purge_expired_keys(db_session, ttl=timedelta(hours=48), batch_size=1) == 2
+        assert [record.key for record in db_session.query(IdempotencyKey)] == ["key-2"]
+        assert purge_expired_keys(db_session, ttl=timedelta(hours=48)) == 0
+
+
+class TestOrderNumbers:
+    """Тесты для генератора номеров заказов"""
+    
+    def test_numbers_are_unique_and_sorted(self):
+        """Номера уникальны и возрастают в порядке генерации"""
+        generator = OrderNumberGenerator(node_id=1)
+        numbers = [generator.generate() for _ in range(10000)]
+        assert len(set(numbers)) == len(numbers)
+        assert numbers == sorted(numbers)
+    
+    def test_legacy_numbers_compare_by_utc_time(self):
+        """Старые номера сравниваются с новыми как время UTC"""
+        moment = datetime(2024, 1, 1, 12, 0, 0, tzinfo=timezone.utc)
+        generator = OrderNumberGenerator(node_id=1)
+        with patch.object(time, "time_ns", return_value=int(moment.timestamp()) * 10 ** 9):
+            number = generator.generate()
+        assert number.startswith("ORD-20240101120000000-")
+        
+        # Старые номера той же и более ранней секунды сервера в UTC - раньше нового
+        assert "ORD-20240101120000-ffffffff" < number
+        assert "ORD-20240101115959-12345678" < number
+        # Номер, созданный часом раньше на сервере в UTC+3, оказывается позже нового
+        assert "ORD-20240101140000-12345678" > number
+    
+    def test_invalid_node_id(self):
+        """Идентификатор узла ограничен 16 битами"""
+        with pytest.raises(ValueError):
+            OrderNumberGenerator(node_id=1 << 16)
+
+
+class TestBestsellers:
+    """Тесты для трекера бестселлеров"""
+    
+    def test_top_k_order(self):
+        """Самые продаваемые книги идут первыми"""
+        window = SlidingWindowTopK(window_seconds=3600, bucket_seconds=300, k=3)
+        for audiobook_id, units in [(1, 5), (2, 50), (3, 20), (4, 1)]:
+            window.add(audiobook_id, units, timestamp=1000, now=1000)
+        assert [key for key, _ in window.top(now=1000)] == [2, 3, 1]
+    
+    def test_expired_sales_leave_window(self):
+        """Продажи за пределами окна не учитываются"""
+        window = SlidingWindowTopK(window_seconds=3600, bucket_seconds=300)
+        window.add(1, 10, timestamp=0, now=0)
+        window.add(2, 1, timestamp=3000, now=3000)
+        assert window.top(now=3000)[0] == (1, 10)
+        assert window.top(now=4000) == [(2, 1)]
+    
+    def test_checkpoints_of_processes_are_merged(self, db_session):
+        """Каждый процесс сохраняет свою контрольную точку, бестселлеры - по сумме"""
+        now = time.time()
+        first = BestsellerTracker(checkpoint_name="bestsellers:0001")
+        second = BestsellerTracker(checkpoint_name="bestsellers:0002")
+        first.record([{"audiobook_id": 1, "title": "Книга 1", "quantity": 3}], now)
+        second.record([{"audiobook_id": 1, "title": "Книга 1", "quantity": 4}], now)
+        second.record([{"audiobook_id": 2, "title": "Книга 2", "quantity": 5}], now)
+        
+        first.checkpoint(db_session)
+        second.checkpoint(db_session)
+        assert db_session.query(BestsellerCheckpoint).count() == 2
+        
+        # Второй процесс видит продажи первого, первый - после следующего сохранения
+        assert second.top("1h")[0] == {"audiobook_id": 1, "title": "Книга 1", "units": 7}
+        first.checkpoint(db_session)
+        assert [row["units"] for row in first.top("1h")] == [7, 5]
+        
+        # После рестарта процесс восстанавливает свои продажи и учитывает чужие
+        restarted = BestsellerTracker(checkpoint_name="bestsellers:0001")
+        assert restarted.restore(db_session)
+        assert [row["units"] for row in restarted.top("1h")] == [7, 5]
+    
+    def test_stale_checkpoints_are_removed(self, db_session):
+        """Контрольная точка, не обновлявшаяся дольше самого длинного окна, удаляется"""
+        db_session.add(BestsellerCheckpoint(
+            name="bestsellers:0009", data=b"", updated_at=datetime.now() - timedelta(days=8)
+        ))
+        db_session.commit()
+        tracker = BestsellerTracker(checkpoint_name="bestsellers:0001")
+        assert tracker.refresh_view(db_session) == 0
+        assert db_session.query(BestsellerCheckpoint).count() == 0
+
+
+    def test_sales_tracked_only_after_outbox_commit(self, db_session):
+        """Продажи попадают в трекер после фиксации события, неудачная фиксация их не учитывает"""
+        cart = CartCalculationResponse(
+            items=[{"audiobook_id": 1, "title": "Книга 1", "price_per_unit": 100.0, "quantity": 2}],
+            total_price=200.0,
+            calculated_at=datetime.now()
+        )
+        OrderService(db_session).create_order_transaction(cart)
+        tracker = BestsellerTracker(checkpoint_name="bestsellers:0001")
+        processor = OutboxProcessor()
+        processor.register(EVENT_ORDER_CREATED, track_bestsellers)
+        failures = [1]
+        
+        def fail_commit(session):
+            # Отказывает только фиксация транзакции, а не точки сохранения обработчика
+            if failures[0] and not session.in_nested_transaction():
+                failures[0] -= 1
+                raise SQLAlchemyError("сбой фиксации")
+        
+        event.listen(db_session, "before_commit", fail_commit)
+        try:
+            with patch.object(handlers, "bestseller_tracker", tracker):
+                with pytest.raises(SQLAlchemyError):
+                    processor.process_batch(db_session)
+                db_session.rollback()
+                assert tracker.top("1h") == []
+                
+                # Повторная доставка события учитывает продажи один раз
+                assert processor.process_batch(db_session) == 1
+                assert processor.process_batch(db_session) == 0
+        finally:
+            event.remove(db_session, "before_commit", fail_commit)
+        
+        assert [(row["audiobook_id"], row["units"]) for row in tracker.top("1h")] == [(1, 2)]
+
+
+class TestOrderStatusHub:
+    """Тесты для хаба статусов заказов"""
+    
+    def test_publish_reaches_only_order_subscribers(self):
+        """Изменение получают только подписчики этого заказа"""
+        async def scenario():
+            hub = OrderStatusHub()
+            first = hub.subscribe(1)
+            other = hub.subscribe(2)
+            hub.publish(1, {"status": "shipped"})
+            assert first.get_nowait() == {"status": "shipped"}
+            assert other.empty()
+            hub.unsubscribe(1, first)
+            hub.unsubscribe(2, other)
+            assert hub.subscriber_count == 0
+        
+        asyncio.run(scenario())
+    
+    def test_slow_subscriber_keeps_latest_updates(self):
+        """При переполнении очереди отбрасываются самые старые изменения"""
+        async def scenario():
+            hub = OrderStatusHub(queue_size=2)
+            queue = hub.subscribe(1)
+            for status in ("confirmed", "processing", "shipped"):
+                hub.publish(1, {"status": status})
+            assert [queue.get_nowait()["status"] for _ in range(2)] == ["processing", "shipped"]
+        
+        asyncio.run(scenario())
+
+
+class TestLibrary:
+    """Тесты для библиотеки пользователя"""
+    
+    def test_ids_roundtrip_sorted_and_unique(self):
+        """ID книг хранятся отсортированными и без повторов"""
+        data = encode_ids([5, 1, 3, 5])
+        assert len(data) == 3 * 4
+        assert list(decode_ids(data)) == [1, 3, 5]
+    
+    def test_cache_skips_load_started_before_invalidation(self):
+        """Загрузка, начатая до инвалидации, не кешируется"""
+        cache = LibraryCache(max_size=10)
+        
+        def stale_loader():
+            cache.invalidate(1)
+            return frozenset({1}), 1
+        
+        assert cache.get_or_load(1, stale_loader, lambda: 1) == frozenset({1})
+        assert cache.get_or_load(1, lambda: (frozenset({1, 2}), 2), lambda: 2) == frozenset({1, 2})
+        assert cache.get_or_load(1, lambda: (frozenset(), 3), lambda: 3) == frozenset({1, 2})
+    
+    def test_cache_checks_version_after_ttl(self):
+        """После ttl запись сверяется с версией и перечитывается только при ее изменении"""
+        now = [0.0]
+        cache = LibraryCache(max_size=10, ttl=5, clock=lambda: now[0])
+        loads = []
+        
+        def loader():
+            loads.append(version[0])
+            return frozenset(range(version[0])), version[0]
+        
+        version = [1]
+        assert cache.get_or_load(1, loader, lambda: version[0]) == frozenset({0})
+        # Библиотеку изменил другой процесс, но ttl еще не истек
+        version[0] = 2
+        now[0] = 4
+        assert cache.get_or_load(1, loader, lambda: version[0]) == frozenset({0})
+        
+        now[0] = 6
+        assert cache.get_or_load(1, loader, lambda: version[0]) == frozenset({0, 1})
+        now[0] = 12
+        assert cache.get_or_load(1, loader, lambda: version[0]) == frozenset({0, 1})
+        assert loads == [1, 2]
+    
+    def add_order(self, db_session, status, audiobook_id, user_id=1):
+        order = Order(order_number=f"ORD-{audiobook_id}", user_id=user_id, total_amount=100, status=status)
+        db_session.add(order)
+        db_session.flush()
+        db_session.add(OrderItem(
+            order_id=order.id, audiobook_id=audiobook_id, title="Книга", price_per_unit=100, quantity=1
+        ))
+        db_session.commit()
+        return order.id
+    
+    def change_status(self, db_session, order_id, old_status, new_status):
+        db_session.get(Order, order_id).status = new_status
+        update_on_status_changed(db_session, {"order_id": order_id, "old_status": old_status, "new_status": new_status})
+        db_session.commit()
+    
+    def test_only_paid_orders_grant_books(self, db_session):
+        """Книги дает только подтвержденный заказ, отмена их забирает"""
+        # Обработчик события пользуется кешем процесса
+        library_cache.invalidate(1)
+        service = LibraryService(db_session)
+        first = self.add_order(db_session, "pending", 7)
+        second = self.add_order(db_session, "pending", 8)
+        assert not service.owns(1, 7)
+        
+        self.change_status(db_session, first, "pending", "confirmed")
+        self.change_status(db_session, second, "pending", "confirmed")
+        assert service.get_owned(1) == frozenset({7, 8})
+        
+        # Переход между оплаченными статусами библиотеку не меняет
+        self.change_status(db_session, first, "confirmed", "shipped")
+        self.change_status(db_session, second, "confirmed", "cancelled")
+        assert service.get_owned(1) == frozenset({7})
+        
+        # Пересчет всех библиотек тоже учитывает только оплаченные заказы
+        self.add_order(db_session, "pending", 9)
+        service.rebuild_all()
+        db_session.commit()
+        assert service.get_owned(1) == frozenset({7})
+    
+    def test_cache_invalidated_only_after_commit(self, db_session):
+        """Кеш сбрасывается после фиксации; откат точки сохранения не отменяет сброс внешней транзакции"""
+        cache = LibraryCache(max_size=10, ttl=60)
+        service = LibraryService(db_session, cache=cache)
+        assert service.get_owned(1) == frozenset()
+        
+        service.grant(1, [7])
+        with pytest.raises(RuntimeError):
+            with db_session.begin_nested():
+                service.grant(1, [8])
+                raise RuntimeError("сбой")
+        assert len(cache) == 1
+        
+        db_session.commit()
+        assert len(cache) == 0
+        assert service.get_owned(1) == frozenset({7})
+        
+        service.grant(1, [9])
+        db_session.rollback()
+        assert len(cache) == 1
+        assert service.get_owned(1) == frozenset({7})
+        
+        # Освобождение точки сохранения - еще не фиксация
+        with db_session.begin_nested():
+            service.grant(1, [10])
+        assert len(cache) == 1
+        db_session.rollback()
+        assert len(cache) == 1
+        assert service.get_owned(1) == frozenset({7})
 
 
 if __name__ == "__main__":
@@ -0,0 +1,144 @@
+"""
+Снимок каталога аудиокниг в памяти рекомендательного сервиса.
+
+Для промпта рекомендаций нужны только названия и авторы книг, поэтому
+каталог не запрашивается на каждый запрос: фоновая задача периодически
+перечитывает его из catalog сервиса с If-None-Match и при изменении
+заменяет снимок целиком. Снимок хранит книги кортежами (id, название,
+автор) и заранее собранный текст списка книг для промпта.
+
+ETag catalog сервиса замечает не все изменения, поэтому снимок старше
+RECOMMENDER_CATALOG_FULL_REFRESH_INTERVAL перечитывается без If-None-Match.
+Пока первый снимок не загружен, рекомендации недоступны, и загрузка
+повторяется с короткой растущей задержкой.
+"""
+
+import asyncio
+import os
+import time
+from typing import NamedTuple, Optional, Tuple
+
+import requests
+
+# Интервал обновления снимка (секунды)
+CATALOG_REFRESH_INTERVAL = float(os.getenv("RECOMMENDER_CATALOG_REFRESH_INTERVAL", "60"))
+# Интервал полного перечитывания каталога без If-None-Match (секунды)
+CATALOG_FULL_REFRESH_INTERVAL = float(os.getenv("RECOMMENDER_CATALOG_FULL_REFRESH_INTERVAL", "3600"))
+# Таймаут запроса каталога (секунды)
+CATALOG_REQUEST_TIMEOUT = 10.0
+# Первая задержка повтора загрузки первого снимка (секунды), удваивается до интервала обновления
+FIRST_LOAD_RETRY_DELAY = 1.0
+
+
+class CatalogSnapshot(NamedTuple):
+    """Неизменяемый снимок каталога"""
+    version: int
+    etag: Optional[str]
+    loaded_at: float
+    books: Tuple[Tuple[int, str, str], ...]  # (id, название, автор)
+    books_text: str
+
+
+def build_snapshot(version: int, etag: Optional[str], audiobooks: list) -> CatalogSnapshot:
+    """Строит снимок из ответа catalog сервиса"""
+    books = tuple(
+        (
+            book["id"],
+            book["title"],
+            book["author"]["name"] if book.get("author") else "Неизвестен"
+        )
+        for book in audiobooks
+    )
+    books_text = "\n".join(f"- {title} (Автор: {author})" for _, title, author in books)
+    return CatalogSnapshot(version, etag, time.time(), books, books_text)
+
+
+class CatalogSnapshotCache:
+    """Текущий снимок каталога и его фоновое обновление"""
+
+    def __init__(
+        self,
+        catalog_url: str,
+        refresh_interval: float = CATALOG_REFRESH_INTERVAL,
+        full_refresh_interval: float = CATALOG_FULL_REFRESH_INTERVAL
+    ):
+        self.catalog_url = catalog_url
+        self.refresh_interval = refresh_interval
+        self.full_refresh_interval = full_refresh_interval
+        self.current: Optional[CatalogSnapshot] = None
+        self.checked_at: Optional[float] = None
+
+    def _fetch(self, etag: Optional[str]) -> requests.Response:
+        headers = {"If-None-Match": etag} if etag else {}
+        return requests.get(
+            f"{self.catalog_url}/api/v1/audiobooks",
+            headers=headers,
+            timeout=CATALOG_REQUEST_TIMEOUT
+        )
+
+    async def refresh(self) -> bool:
+        """
+        Перечитывает каталог, если он изменился.
+
+        Returns:
+            True, если снимок заменен
+
+        Raises:
+            requests.RequestException: Если catalog сервис недоступен
+            RuntimeError: Если catalog сервис вернул ошибку
+        """
+        current = self.current
+        etag = None
+        if current is not None and time.time() - current.loaded_at < self.full_refresh_interval:
+            etag = current.etag
+        response = await asyncio.to_thread(self._fetch, etag)
+        self.checked_at = time.time()
+
+        if response.status_code == 304 and etag is not None:
+            return False
+        if response.status_code != 200:
+            raise RuntimeError(f"Catalog сервис вернул ошибку {response.status_code}: {response.text[:100]}")
+
+        audiobooks = response.json()
+        snapshot = await asyncio.to_thread(
+            build_snapshot,
+            current.version + 1 if current else 1,
+            response.headers.get("ETag"),
+            audiobooks
+        )
+        self.current = snapshot
+        print(f"📚 Снимок каталога v{snapshot.version}: {len(snapshot.books)} книг")
+        return True
+
+    async def refresh_periodically(self) -> None:
+        """
+        Периодически обновляет снимок (задача в lifespan сервиса).
+
+        Пока первый снимок не загружен, загрузка повторяется с задержкой
+        от FIRST_LOAD_RETRY_DELAY, удваивающейся до интервала обновления.
+        """
+        retry_delay = FIRST_LOAD_RETRY_DELAY
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                print(f"❌ Не удалось обновить снимок каталога: {str(e)}")
+            if self.current is None:
+                await asyncio.sleep(retry_delay)
+                retry_delay = min(retry_delay * 2, self.refresh_interval)
+            else:
+                await asyncio.sleep(self.refresh_interval)
+
+    def info(self) -> dict:
+        """Сведения о снимке для отладки"""
+        current = self.current
+        return {
+            "loaded": current is not None,
+            "version": current.version if current else None,
+            "etag": current.etag if current else None,
+            "total_books": len(current.books) if current else 0,
+            "loaded_at": current.loaded_at if current else None,
+            "checked_at": self.checked_at,
+            "refresh_interval": self.refresh_interval,
+            "full_refresh_interval": self.full_refresh_interval
+        }
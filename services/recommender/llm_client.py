@@ -0,0 +1,110 @@
+"""
+Асинхронный клиент LLM с ограничением параллельных запросов.
+
+Запрос к LLM длится секунды, поэтому вызывается асинхронным клиентом
+OpenAI: пока один запрос ждет ответа, цикл событий обслуживает остальные.
+Число одновременных запросов к каждой модели ограничено семафором
+(RECOMMENDER_LLM_CONCURRENCY); запросы сверх лимита ждут в очереди.
+Для каждой модели считаются очередь, запросы в работе и время ожидания.
+"""
+
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List
+
+import openai
+
+# Одновременных запросов к одной модели
+LLM_CONCURRENCY = int(os.getenv("RECOMMENDER_LLM_CONCURRENCY", "4"))
+# Таймаут запроса к LLM (секунды)
+LLM_REQUEST_TIMEOUT = float(os.getenv("RECOMMENDER_LLM_TIMEOUT", "60"))
+
+
+class ModelLimiter:
+    """Семафор модели и метрики ее очереди"""
+
+    def __init__(self, concurrency: int):
+        self.concurrency = concurrency
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self.waiting = 0
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    @asynccontextmanager
+    async def slot(self):
+        """Занимает место для запроса, при необходимости ожидая в очереди"""
+        queued_at = time.perf_counter()
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+
+        wait = time.perf_counter() - queued_at
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        self.in_flight += 1
+        try:
+            yield
+        except BaseException:
+            self.failed += 1
+            raise
+        else:
+            self.completed += 1
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    def metrics(self) -> dict:
+        started = self.completed + self.failed + self.in_flight
+        return {
+            "concurrency": self.concurrency,
+            "waiting": self.waiting,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "failed": self.failed,
+            "avg_wait_ms": round(self.total_wait / started * 1000, 1) if started else 0.0,
+            "max_wait_ms": round(self.max_wait * 1000, 1)
+        }
+
+
+class LLMClient:
+    """Асинхронный клиент OpenRouter с лимитом параллельных запросов на модель"""
+
+    def __init__(self, client: openai.AsyncOpenAI, concurrency: int = LLM_CONCURRENCY):
+        self.client = client
+        self.concurrency = concurrency
+        self._limiters: Dict[str, ModelLimiter] = {}
+
+    def _limiter(self, model: str) -> ModelLimiter:
+        limiter = self._limiters.get(model)
+        if limiter is None:
+            limiter = self._limiters[model] = ModelLimiter(self.concurrency)
+        return limiter
+
+    async def complete(self, model: str, messages: List[dict], max_tokens: int, temperature: float):
+        """
+        Выполняет chat completion, дождавшись свободного места для модели.
+
+        Raises:
+            openai.APIError: Ошибки LLM сервиса пробрасываются как есть
+        """
+        async with self._limiter(model).slot():
+            return await self.client.chat.completions.create(
+                model=model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature
+            )
+
+    def metrics(self) -> Dict[str, dict]:
+        """Метрики очередей по моделям"""
+        return {model: limiter.metrics() for model, limiter in self._limiters.items()}
+
+    async def close(self) -> None:
+        await self.client.close()
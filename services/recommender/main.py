@@ -14,6 +14,7 @@ import requests
 import asyncio
 import openai
 from dotenv import load_dotenv
+from contextlib import asynccontextmanager
 import json
 
 # Загружаем переменные окружения из корня проекта
@@ -27,11 +28,45 @@ env_path = project_root / '.env'
 # Загружаем переменные окружения
 load_dotenv(env_path)
 
+from catalog_snapshot import CatalogSnapshotCache
+from llm_client import LLMClient, LLM_REQUEST_TIMEOUT
+
+# Конфигурация
+CATALOG_SERVICE_URL = "http://localhost:8002"  # URL микросервиса catalog
+PROMPTS_SERVICE_URL = "http://localhost:8006"  # URL микросервиса prompts-manager
+
+# Снимок каталога для промпта рекомендаций (обновляется в фоне)
+catalog_snapshot = CatalogSnapshotCache(CATALOG_SERVICE_URL)
+
+# Асинхронный API-клиент для OpenRouter: запросы к LLM не блокируют цикл событий
+llm_client = LLMClient(
+    openai.AsyncOpenAI(
+        base_url="https://openrouter.ai/api/v1",
+        api_key=os.getenv("OPENROUTER_API_KEY"),
+        timeout=LLM_REQUEST_TIMEOUT,
+        default_headers={
+            "HTTP-Referer": "http://localhost:8000/admin/admin.html",
+            "X-Title": "Audio Store",
+        },
+    )
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Управление жизненным циклом приложения"""
+    refresh_task = asyncio.create_task(catalog_snapshot.refresh_periodically())
+    yield
+    refresh_task.cancel()
+    await llm_client.close()
+
+
 # Инициализация FastAPI приложения
 app = FastAPI(
     title="AI Recommender Service",
     description="Core Domain сервис для AI-рекомендаций аудиокниг",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Настройка CORS
@@ -43,20 +78,6 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Настройка API-клиента для OpenRouter
-client = openai.OpenAI(
-    base_url="https://openrouter.ai/api/v1",
-    api_key=os.getenv("OPENROUTER_API_KEY"),
-    default_headers={
-        "HTTP-Referer": "http://localhost:8000/admin/admin.html",
-        "X-Title": "Audio Store",
-    },
-)
-
-# Конфигурация
-CATALOG_SERVICE_URL = "http://localhost:8002"  # URL микросервиса catalog
-PROMPTS_SERVICE_URL = "http://localhost:8006"  # URL микросервиса prompts-manager
-
 # Доступные модели LLM
 AVAILABLE_MODELS = {
     "gemini-pro": "google/gemini-2.0-flash-001",
@@ -138,60 +159,7 @@ async def fetch_prompt_from_service(prompt_name: str) -> str:
         )
 
 
-async def fetch_audiobooks_from_catalog() -> list:  
-    """
-    Получает список аудиокниг из микросервиса catalog.
-    Это взаимодействие между ограниченными контекстами (Anti-Corruption Layer).
-    """
-    try:
-        # Используем правильный эндпоинт catalog сервиса (как в cart сервисе)
-        url = f"{CATALOG_SERVICE_URL}/api/v1/audiobooks"
-        print(f"🔍 Запрос к Catalog Service: {url}")
-        
-        # Используем requests в отдельном потоке для асинхронности
-        def make_request():
-            return requests.get(url, timeout=10.0)
-        
-        response = await asyncio.to_thread(make_request)
-        print(f"📡 Ответ от Catalog Service: статус {response.status_code}")
-        
-        if response.status_code == 200:
-            data = response.json()
-            print(f"✅ Получены данные: {len(data) if isinstance(data, list) else 'не список'}")
-            if isinstance(data, list) and len(data) > 0:
-                return data
-            elif isinstance(data, dict):
-                print(f"📝 Ответ не список: {data}")
-        else:
-            print(f"❌ Ошибка {response.status_code}: {response.text[:100]}")
-            raise HTTPException(
-                status_code=503,
-                detail=f"Catalog сервис вернул ошибку {response.status_code}: {response.text}"
-            )
-        
-    except requests.exceptions.Timeout:
-        raise HTTPException(
-            status_code=503,
-            detail="Catalog сервис не отвечает в течение 10 секунд"
-        )
-    except requests.exceptions.HTTPError as e:
-        raise HTTPException(
-            status_code=503,
-            detail=f"Catalog сервис вернул ошибку {e.response.status_code}: {e.response.text}"
-        )
-    except requests.exceptions.RequestException as e:
-        raise HTTPException(
-            status_code=503,
-            detail=f"Ошибка подключения к catalog сервису: {str(e)}"
-        )
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Неожиданная ошибка: {str(e)}"
-        )
-
-
-async def create_system_prompt(audiobooks: list, user_prompt: str) -> str:
+async def create_system_prompt(books_list_text: str, user_prompt: str) -> str:
     """
     Создает системный промпт для LLM, используя промпт из prompts-manager.
     Это наша интеллектуальная собственность - Core Domain логика.
@@ -199,12 +167,7 @@ async def create_system_prompt(audiobooks: list, user_prompt: str) -> str:
     # Получаем базовый промпт из prompts-manager
     base_prompt = await fetch_prompt_from_service("recommendation_prompt")
     
-    # Упрощаем список книг до простого текста (название и автор)
-    books_list_text = "\n".join(
-        [f"- {book['title']} (Автор: {book['author']['name'] if book.get('author') else 'Неизвестен'})" for book in audiobooks]
-    )
-    
-    # Форматируем промпт с упрощенными данными
+    # Форматируем промпт со списком книг (название и автор) из снимка каталога
     system_prompt = base_prompt.format(
         user_preferences=user_prompt,
         available_books=books_list_text
@@ -372,29 +335,47 @@ def health_check():
         "api_key_prefix": api_key[:10] + "..." if api_key and len(api_key) > 10 else "None"
     }
 
+@app.get("/api/v1/llm/metrics")
+def get_llm_metrics():
+    """Очереди запросов к LLM по моделям"""
+    return {
+        "concurrency_per_model": llm_client.concurrency,
+        "models": llm_client.metrics()
+    }
+
+@app.get("/api/v1/recommendations/catalog-info")
+def get_catalog_info():
+    """Сведения о снимке каталога (для отладки)"""
+    return catalog_snapshot.info()
+
 @app.post("/api/v1/recommendations/generate")
 async def generate_recommendations(request: RecommendationRequest):
     """
     Генерирует персонализированные рекомендации аудиокниг.
     
     Это основной эндпоинт Core Domain, который:
-    1. Получает данные из catalog микросервиса (взаимодействие контекстов)
+    1. Берет каталог из снимка в памяти (обновляется в фоне из catalog микросервиса)
     2. Создает системный промпт (наша интеллектуальная собственность)
     3. Использует LLM для анализа и генерации рекомендаций
     4. Возвращает ответ от модели "как есть"
     """
     
-    # 1. Получаем каталог аудиокниг из catalog микросервиса (Anti-Corruption Layer)
-    audiobooks = await fetch_audiobooks_from_catalog()
+    # 1. Снимок каталога аудиокниг (запрос не ждет catalog микросервис)
+    snapshot = catalog_snapshot.current
+    if snapshot is None:
+        raise HTTPException(
+            status_code=503,
+            detail="Каталог еще не загружен, повторите попытку позже"
+        )
     
-    if not audiobooks:
+    if not snapshot.books:
         raise HTTPException(
             status_code=404,
             detail="Каталог аудиокниг пуст"
         )
     
     # 2. Создаем системный промпт (наша Core Domain логика)
-    system_prompt = await create_system_prompt(audiobooks, request.prompt)
+    system_prompt = await create_system_prompt(snapshot.books_text, request.prompt)
     
     # 3. Вызываем LLM через OpenRouter
     try:
@@ -402,7 +383,7 @@ async def generate_recommendations(request: RecommendationRequest):
         model_name = AVAILABLE_MODELS.get(request.model, AVAILABLE_MODELS["gemini-pro"])
         print(f"🤖 Используем модель: {request.model} -> {model_name}")
         
-        response = client.chat.completions.create(
+        response = await llm_client.complete(
             model=model_name,
             messages=[
                 {"role": "system", "content": system_prompt},
@@ -430,7 +411,8 @@ async def generate_recommendations(request: RecommendationRequest):
             "recommendations": response.choices[0].message.content,
             "model": model_name,
             "model_alias": request.model,
-            "total_books_analyzed": len(audiobooks)
+            "total_books_analyzed": len(snapshot.books),
+            "catalog_version": snapshot.version
         }
         
     except openai.AuthenticationError as e:
@@ -520,7 +502,7 @@ async def generate_description(product_id: int, request: DescriptionGenerationRe
         print(f"🤖 Используем модель: {request.model} -> {model_name}")
         
         try:
-            response = client.chat.completions.create(
+            response = await llm_client.complete(
                 model=model_name,
                 messages=[
                     {"role": "system", "content": system_prompt},
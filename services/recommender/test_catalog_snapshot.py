@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Тесты для снимка каталога рекомендательного сервиса (catalog_snapshot.py)
+"""
+
+import asyncio
+import os
+import sys
+from unittest.mock import MagicMock, patch
+
+import pytest
+import requests
+
+# Модули сервиса импортируются по плоским именам
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from catalog_snapshot import CatalogSnapshotCache
+
+BOOKS = [
+    {"id": 1, "title": "Мастер и Маргарита", "author": {"id": 1, "name": "Булгаков"}},
+    {"id": 2, "title": "Без автора", "author": None},
+]
+
+
+def make_response(status_code: int, body=None, etag: str = None) -> MagicMock:
+    response = MagicMock(status_code=status_code, text="" if body is None else str(body))
+    response.headers = {"ETag": etag} if etag else {}
+    response.json.return_value = body
+    return response
+
+
+class TestCatalogSnapshotRefresh:
+    """Тесты для обновления снимка"""
+
+    def test_first_load_builds_snapshot(self):
+        """Ответ 200 заменяет снимок и сохраняет ETag"""
+        cache = CatalogSnapshotCache("http://catalog")
+        with patch.object(cache, "_fetch", return_value=make_response(200, BOOKS, '"v1"')) as fetch:
+            assert asyncio.run(cache.refresh()) is True
+
+        fetch.assert_called_once_with(None)
+        snapshot = cache.current
+        assert snapshot.version == 1
+        assert snapshot.etag == '"v1"'
+        assert snapshot.books == ((1, "Мастер и Маргарита", "Булгаков"), (2, "Без автора", "Неизвестен"))
+        assert "- Мастер и Маргарита (Автор: Булгаков)" in snapshot.books_text
+
+    def test_not_modified_keeps_snapshot(self):
+        """Ответ 304 на запрос с ETag оставляет снимок"""
+        cache = CatalogSnapshotCache("http://catalog")
+        with patch.object(cache, "_fetch", return_value=make_response(200, BOOKS, '"v1"')):
+            asyncio.run(cache.refresh())
+        snapshot = cache.current
+
+        with patch.object(cache, "_fetch", return_value=make_response(304)) as fetch:
+            assert asyncio.run(cache.refresh()) is False
+        fetch.assert_called_once_with('"v1"')
+        assert cache.current is snapshot
+        assert cache.checked_at is not None
+
+    def test_changed_catalog_replaces_snapshot(self):
+        """Новый каталог заменяет снимок с увеличением версии"""
+        cache = CatalogSnapshotCache("http://catalog")
+        with patch.object(cache, "_fetch", return_value=make_response(200, BOOKS, '"v1"')):
+            asyncio.run(cache.refresh())
+        with patch.object(cache, "_fetch", return_value=make_response(200, BOOKS[:1], '"v2"')):
+            assert asyncio.run(cache.refresh()) is True
+        assert cache.current.version == 2
+        assert cache.current.etag == '"v2"'
+        assert len(cache.current.books) == 1
+
+    def test_errors_keep_snapshot(self):
+        """Ошибка catalog сервиса пробрасывается, снимок сохраняется"""
+        cache = CatalogSnapshotCache("http://catalog")
+        with patch.object(cache, "_fetch", return_value=make_response(200, BOOKS, '"v1"')):
+            asyncio.run(cache.refresh())
+        snapshot = cache.current
+
+        with patch.object(cache, "_fetch", return_value=make_response(500, "Internal error")):
+            with pytest.raises(RuntimeError):
+                asyncio.run(cache.refresh())
+        with patch.object(cache, "_fetch", side_effect=requests.ConnectionError("down")):
+            with pytest.raises(requests.RequestException):
+                asyncio.run(cache.refresh())
+        assert cache.current is snapshot
+
+    def test_old_snapshot_reloaded_without_etag(self):
+        """Снимок старше интервала полного обновления перечитывается без If-None-Match"""
+        cache = CatalogSnapshotCache("http://catalog", full_refresh_interval=0)
+        with patch.object(cache, "_fetch", return_value=make_response(200, BOOKS, '"v1"')):
+            asyncio.run(cache.refresh())
+        with patch.object(cache, "_fetch", return_value=make_response(200, BOOKS, '"v1"')) as fetch:
+            assert asyncio.run(cache.refresh()) is True
+        fetch.assert_called_once_with(None)
+        assert cache.current.version == 2
+
+
+class TestCatalogSnapshotFirstLoad:
+    """Тесты для повторов загрузки первого снимка"""
+
+    def test_first_load_retried_with_backoff(self):
+        """Пока снимка нет, загрузка повторяется с растущей задержкой, затем - по интервалу"""
+        cache = CatalogSnapshotCache("http://catalog", refresh_interval=5)
+        responses = [requests.ConnectionError("down")] * 4 + [make_response(200, BOOKS, '"v1"')]
+        delays = []
+
+        async def fake_sleep(delay):
+            delays.append(delay)
+            if len(delays) == 6:
+                raise asyncio.CancelledError
+
+        with patch.object(cache, "_fetch", side_effect=responses + [make_response(304)]), \
+                patch("catalog_snapshot.asyncio.sleep", fake_sleep):
+            with pytest.raises(asyncio.CancelledError):
+                asyncio.run(cache.refresh_periodically())
+
+        assert delays == [1.0, 2.0, 4.0, 5, 5, 5]
+        assert cache.current.version == 1
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
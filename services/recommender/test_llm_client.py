@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Тесты для ограничения параллельных запросов к LLM (llm_client.py)
+"""
+
+import asyncio
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+# Модули сервиса импортируются по плоским именам
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from llm_client import LLMClient, ModelLimiter
+
+
+class FakeCompletions:
+    """Имитация chat.completions: считает одновременные запросы"""
+
+    def __init__(self, delay: float = 0.05):
+        self.delay = delay
+        self.active = 0
+        self.max_active = 0
+
+    async def create(self, **kwargs):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+            return kwargs["model"]
+        finally:
+            self.active -= 1
+
+
+def make_client(concurrency: int) -> tuple:
+    completions = FakeCompletions()
+    client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    return LLMClient(client, concurrency=concurrency), completions
+
+
+class TestModelLimiter:
+    """Тесты для лимита запросов к модели"""
+
+    def test_requests_overlap_up_to_limit(self):
+        """Запросы выполняются параллельно, но не больше лимита; остальные ждут"""
+        concurrency, extra = 3, 4
+        llm, completions = make_client(concurrency)
+
+        async def scenario():
+            tasks = [
+                asyncio.create_task(llm.complete("model-a", [], max_tokens=10, temperature=0))
+                for _ in range(concurrency + extra)
+            ]
+            await asyncio.sleep(0.01)
+            metrics = llm.metrics()["model-a"]
+            assert metrics["in_flight"] == concurrency
+            assert metrics["waiting"] == extra
+            return await asyncio.gather(*tasks)
+
+        results = asyncio.run(scenario())
+
+        assert results == ["model-a"] * (concurrency + extra)
+        assert completions.max_active == concurrency
+        metrics = llm.metrics()["model-a"]
+        assert metrics["completed"] == concurrency + extra
+        assert metrics["failed"] == 0
+        assert metrics["in_flight"] == 0
+        assert metrics["waiting"] == 0
+        # Запросы сверх лимита ждали в очереди примерно длительность запроса
+        assert metrics["max_wait_ms"] >= completions.delay * 1000 * 0.5
+        assert metrics["avg_wait_ms"] > 0
+
+    def test_limits_are_per_model(self):
+        """Лимит действует отдельно для каждой модели"""
+        llm, completions = make_client(1)
+
+        async def scenario():
+            await asyncio.gather(
+                llm.complete("model-a", [], max_tokens=10, temperature=0),
+                llm.complete("model-b", [], max_tokens=10, temperature=0),
+            )
+
+        asyncio.run(scenario())
+        assert completions.max_active == 2
+        assert set(llm.metrics()) == {"model-a", "model-b"}
+
+    def test_cancelled_request_counted_as_failed(self):
+        """Отмененный запрос - в failed, отмена в очереди запросом не считается"""
+        limiter = ModelLimiter(concurrency=1)
+
+        async def hold(event: asyncio.Event):
+            async with limiter.slot():
+                await event.wait()
+
+        async def scenario():
+            never = asyncio.Event()
+            running = asyncio.create_task(hold(never))
+            queued = asyncio.create_task(hold(never))
+            await asyncio.sleep(0.01)
+            assert limiter.metrics()["in_flight"] == 1
+            assert limiter.metrics()["waiting"] == 1
+
+            queued.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await queued
+            assert limiter.metrics()["waiting"] == 0
+            assert limiter.metrics()["failed"] == 0
+
+            running.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await running
+
+            # Место освобождено
+            async with limiter.slot():
+                pass
+
+        asyncio.run(scenario())
+        metrics = limiter.metrics()
+        assert metrics["failed"] == 1
+        assert metrics["completed"] == 1
+        assert metrics["in_flight"] == 0
+        assert metrics["waiting"] == 0
+
+    def test_error_counted_as_failed(self):
+        """Ошибка запроса считается неудачей и освобождает место"""
+        limiter = ModelLimiter(concurrency=1)
+
+        async def scenario():
+            with pytest.raises(RuntimeError):
+                async with limiter.slot():
+                    raise RuntimeError("LLM недоступна")
+            async with limiter.slot():
+                pass
+
+        asyncio.run(scenario())
+        assert limiter.metrics()["failed"] == 1
+        assert limiter.metrics()["completed"] == 1
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
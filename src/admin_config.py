@@ -2,8 +2,13 @@
 Конфигурационный файл для администраторов
 """
 
+import os
+import heapq
 import secrets
 import hashlib
+import shelve
+import threading
+import time
 from datetime import datetime, timedelta
 
 # Фиксированные учетные данные администратора
@@ -12,8 +17,154 @@ ADMIN_CREDENTIALS = {
     "password": "admin123"
 }
 
-# Словарь для хранения активных токенов (в реальном приложении используйте базу данных)
-ACTIVE_TOKENS = {}
+# Время жизни токена администратора
+ADMIN_TOKEN_TTL = timedelta(hours=int(os.getenv("ADMIN_TOKEN_TTL_HOURS", "24")))
+# Максимум одновременно действующих токенов
+ADMIN_TOKEN_MAX_COUNT = int(os.getenv("ADMIN_TOKEN_MAX_COUNT", "1000"))
+# Файл для сохранения токенов между перезапусками (пусто - только в памяти)
+ADMIN_TOKEN_STORE_PATH = os.getenv("ADMIN_TOKEN_STORE_PATH", "")
+
+
+class ShelveTokenBackend:
+    """
+    Хранение токенов в файле (shelve) для переживания перезапусков.
+    
+    Ключи - SHA-256 токенов, поэтому файл не содержит самих токенов.
+    """
+    
+    def __init__(self, path):
+        self._db = shelve.open(path)
+    
+    def load(self):
+        return list(self._db.items())
+    
+    def save(self, key, record):
+        self._db[key] = record
+        self._db.sync()
+    
+    def delete(self, key):
+        if key in self._db:
+            del self._db[key]
+            self._db.sync()
+    
+    def close(self):
+        self._db.close()
+
+
+class AdminTokenStore:
+    """
+    Хранилище токенов администратора с вытеснением по сроку действия.
+    
+    Проверка токена - поиск в словаре (O(1)). Сроки действия лежат в куче:
+    истекшие токены удаляются с ее вершины при выдаче нового токена, а при
+    достижении max_count вытесняется токен с ближайшим сроком, поэтому
+    память ограничена.
+    """
+    
+    def __init__(self, ttl=ADMIN_TOKEN_TTL, max_count=ADMIN_TOKEN_MAX_COUNT, backend=None, clock=time.time):
+        self.ttl = ttl
+        self.max_count = max_count
+        self._backend = backend
+        self._clock = clock
+        self._records = {}       # SHA-256 токена -> данные токена
+        self._expiry_heap = []   # (срок действия, SHA-256 токена)
+        self._lock = threading.Lock()
+        
+        if backend is not None:
+            now = datetime.fromtimestamp(clock())
+            for key, record in backend.load():
+                if record["expires_at"] > now:
+                    self._add(key, record)
+                else:
+                    backend.delete(key)
+    
+    @staticmethod
+    def _key(token):
+        return hashlib.sha256(token.encode()).hexdigest()
+    
+    def __len__(self):
+        return len(self._records)
+    
+    def __contains__(self, token):
+        return self.get(token) is not None
+    
+    def _add(self, key, record):
+        self._records[key] = record
+        heapq.heappush(self._expiry_heap, (record["expires_at"].timestamp(), key))
+    
+    def _remove(self, key):
+        self._records.pop(key, None)
+        if self._backend is not None:
+            self._backend.delete(key)
+    
+    def _drop_expired(self, now):
+        # Истекшие токены и записи кучи уже отозванных токенов
+        while self._expiry_heap and (
+            self._expiry_heap[0][0] <= now or self._expiry_heap[0][1] not in self._records
+        ):
+            _, key = heapq.heappop(self._expiry_heap)
+            self._remove(key)
+    
+    def _evict(self, now):
+        self._drop_expired(now)
+        # Переполнение - вытесняем токены с ближайшим сроком
+        while len(self._records) >= self.max_count and self._expiry_heap:
+            _, key = heapq.heappop(self._expiry_heap)
+            self._remove(key)
+        # Отозванные токены оставляют записи в глубине кучи
+        if len(self._expiry_heap) > 2 * self.max_count:
+            self._expiry_heap = [
+                (record["expires_at"].timestamp(), key) for key, record in self._records.items()
+            ]
+            heapq.heapify(self._expiry_heap)
+    
+    def issue(self, token, username):
+        """Сохраняет новый токен"""
+        now = self._clock()
+        created_at = datetime.fromtimestamp(now)
+        record = {
+            "username": username,
+            "created_at": created_at,
+            "expires_at": created_at + self.ttl
+        }
+        key = self._key(token)
+        with self._lock:
+            self._evict(now)
+            self._add(key, record)
+            if self._backend is not None:
+                self._backend.save(key, record)
+    
+    def get(self, token):
+        """Данные действующего токена или None"""
+        if not token:
+            return None
+        key = self._key(token)
+        with self._lock:
+            record = self._records.get(key)
+            if record is None:
+                return None
+            if record["expires_at"].timestamp() <= self._clock():
+                self._remove(key)
+                return None
+            return record
+    
+    def revoke(self, token):
+        """Отзывает токен (запись кучи удаляется при следующем вытеснении)"""
+        with self._lock:
+            self._remove(self._key(token))
+    
+    def cleanup(self):
+        """Удаляет истекшие токены"""
+        with self._lock:
+            before = len(self._records)
+            self._drop_expired(self._clock())
+            return before - len(self._records)
+
+
+# Хранилище активных токенов
+ACTIVE_TOKENS = AdminTokenStore(
+    backend=ShelveTokenBackend(ADMIN_TOKEN_STORE_PATH) if ADMIN_TOKEN_STORE_PATH else None
+)
 
 def verify_admin_credentials(username, password):
     """
@@ -44,12 +195,8 @@ def generate_admin_token():
     token_data = f"{ADMIN_CREDENTIALS['username']}:{timestamp}:{random_data}"
     token = hashlib.sha256(token_data.encode()).hexdigest()
     
-    # Сохраняем токен с временной меткой
-    ACTIVE_TOKENS[token] = {
-        "username": ADMIN_CREDENTIALS["username"],
-        "created_at": datetime.now(),
-        "expires_at": datetime.now() + timedelta(hours=24)  # Токен действителен 24 часа
-    }
+    # Сохраняем токен
+    ACTIVE_TOKENS.issue(token, ADMIN_CREDENTIALS["username"])
     
     return token
 
@@ -63,18 +210,7 @@ def verify_admin_token(token):
     Returns:
         bool: True если токен валиден, False в противном случае
     """
-    if not token or token not in ACTIVE_TOKENS:
-        return False
-    
-    token_data = ACTIVE_TOKENS[token]
-    
-    # Проверяем, не истек ли токен
-    if datetime.now() > token_data["expires_at"]:
-        # Удаляем истекший токен
-        del ACTIVE_TOKENS[token]
-        return False
-    
-    return True
+    return ACTIVE_TOKENS.get(token) is not None
 
 def revoke_admin_token(token):
     """
@@ -83,8 +219,7 @@ def revoke_admin_token(token):
     Args:
         token (str): Токен для отзыва
     """
-    if token in ACTIVE_TOKENS:
-        del ACTIVE_TOKENS[token]
+    ACTIVE_TOKENS.revoke(token)
 
 def get_admin_username_from_token(token):
     """
@@ -96,19 +231,14 @@ def get_admin_username_from_token(token):
     Returns:
         str: Имя пользователя или None если токен невалиден
     """
-    if verify_admin_token(token):
-        return ACTIVE_TOKENS[token]["username"]
-    return None
+    record = ACTIVE_TOKENS.get(token)
+    return record["username"] if record else None
 
 def cleanup_expired_tokens():
     """
     Очищает истекшие токены
-    """
-    current_time = datetime.now()
-    expired_tokens = [
-        token for token, data in ACTIVE_TOKENS.items()
-        if current_time > data["expires_at"]
-    ]
     
-    for token in expired_tokens:
-        del ACTIVE_TOKENS[token]
+    Returns:
+        int: Количество удаленных токенов
+    """
+    return ACTIVE_TOKENS.cleanup()
@@ -0,0 +1,120 @@
+"""
+Тесты для хранилища токенов администратора (src/admin_config.py).
+"""
+
+import pytest
+import sys
+import os
+from datetime import timedelta
+
+# Добавляем путь к модулю admin_config
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import admin_config
+from admin_config import AdminTokenStore, ShelveTokenBackend
+
+
+def make_store(now, **kwargs):
+    kwargs.setdefault("ttl", timedelta(seconds=100))
+    return AdminTokenStore(clock=lambda: now[0], **kwargs)
+
+
+class TestAdminTokenStore:
+    """Тесты для хранилища токенов с вытеснением по сроку действия"""
+
+    def test_tokens_expire_in_issue_order(self):
+        """Токены истекают по сроку действия, проверка истекшего токена его удаляет"""
+        now = [1000.0]
+        store = make_store(now)
+        store.issue("first", "admin")
+        now[0] = 1050.0
+        store.issue("second", "admin")
+
+        now[0] = 1100.0
+        assert store.get("first") is None
+        assert store.get("second")["username"] == "admin"
+        assert len(store) == 1
+
+        now[0] = 1150.0
+        assert "second" not in store
+
+    def test_cleanup_drops_only_expired(self):
+        """Очистка удаляет истекшие токены и возвращает их количество"""
+        now = [1000.0]
+        store = make_store(now)
+        for index in range(3):
+            now[0] = 1000.0 + index * 10
+            store.issue(f"token-{index}", "admin")
+
+        now[0] = 1115.0
+        assert store.cleanup() == 2
+        assert "token-2" in store
+        assert store.cleanup() == 0
+
+    def test_max_count_evicts_soonest_expiring(self):
+        """При достижении max_count вытесняется токен с ближайшим сроком"""
+        now = [1000.0]
+        store = make_store(now, max_count=2)
+        for index, token in enumerate(("a", "b", "c")):
+            now[0] = 1000.0 + index
+            store.issue(token, "admin")
+
+        assert len(store) == 2
+        assert "a" not in store
+        assert "b" in store and "c" in store
+
+    def test_revoked_token_not_counted_for_eviction(self):
+        """Отозванный токен освобождает место, действующие не вытесняются"""
+        now = [1000.0]
+        store = make_store(now, max_count=2)
+        store.issue("a", "admin")
+        now[0] = 1001.0
+        store.issue("b", "admin")
+        store.revoke("a")
+
+        now[0] = 1002.0
+        store.issue("c", "admin")
+        assert "a" not in store
+        assert "b" in store and "c" in store
+
+    def test_tokens_survive_restart_with_backend(self, tmp_path):
+        """С файловым хранилищем токены переживают перезапуск, истекшие - нет"""
+        path = str(tmp_path / "tokens")
+        now = [1000.0]
+        backend = ShelveTokenBackend(path)
+        store = make_store(now, backend=backend)
+        store.issue("old", "admin")
+        now[0] = 1050.0
+        store.issue("new", "admin")
+        backend.close()
+
+        now[0] = 1120.0
+        backend = ShelveTokenBackend(path)
+        restarted = make_store(now, backend=backend)
+        assert "old" not in restarted
+        assert restarted.get("new")["username"] == "admin"
+        assert len(restarted) == 1
+        backend.close()
+
+
+class TestAdminTokenFunctions:
+    """Тесты для функций модуля, работающих с ACTIVE_TOKENS"""
+
+    def test_token_lifecycle(self, monkeypatch):
+        """Выданный токен проверяется, дает имя пользователя и отзывается"""
+        monkeypatch.setattr(admin_config, "ACTIVE_TOKENS", AdminTokenStore())
+        assert admin_config.verify_admin_credentials("admin", "admin123")
+        assert not admin_config.verify_admin_credentials("admin", "wrong")
+
+        token = admin_config.generate_admin_token()
+        assert admin_config.verify_admin_token(token)
+        assert admin_config.get_admin_username_from_token(token) == "admin"
+
+        admin_config.revoke_admin_token(token)
+        assert not admin_config.verify_admin_token(token)
+        assert admin_config.get_admin_username_from_token(token) is None
+        assert admin_config.cleanup_expired_tokens() == 0
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,198 @@
+"""
+Тесты для общей проверки JWT токенов (пакет auth_tokens).
+"""
+
+import pytest
+import sys
+import os
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+# Добавляем путь к пакету auth_tokens
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+from jose import jwt
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from database.models import RevokedToken
+from auth_tokens import (
+    TokenVerifier,
+    RevocationList,
+    revoke_token,
+    SECRET_KEY,
+    ALGORITHM,
+    decode_token,
+    get_current_user_id,
+    get_optional_user_id,
+)
+
+# Срок действия тестовых токенов (2100 год)
+FAR_FUTURE = 4102444800
+
+
+def make_token(claims: dict) -> str:
+    return jwt.encode(claims, SECRET_KEY, algorithm=ALGORITHM)
+
+
+@pytest.fixture
+def db_session():
+    """Сессия in-memory базы данных с таблицей отозванных токенов"""
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    RevokedToken.__table__.create(engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+class TestTokenVerifier:
+    """Тесты для проверки токенов с кешем"""
+
+    def test_claims_are_cached_until_expiry(self):
+        """Токен декодируется один раз и вытесняется после истечения срока"""
+        now = [1000.0]
+        verifier = TokenVerifier(max_size=10, clock=lambda: now[0])
+        token = make_token({"sub": "user@example.com", "user_id": 7, "exp": FAR_FUTURE})
+
+        with patch("auth_tokens.verification.decode_token", wraps=decode_token) as decode:
+            assert verifier.verify(token)["user_id"] == 7
+            assert verifier.verify(token)["user_id"] == 7
+            assert decode.call_count == 1
+
+            now[0] = FAR_FUTURE
+            verifier.verify(token)
+            assert decode.call_count == 2
+
+    def test_invalid_token_and_lru_limit(self):
+        """Недействительный токен отклоняется, размер кеша ограничен"""
+        verifier = TokenVerifier(max_size=2)
+        assert verifier.verify("not-a-token") is None
+        for offset in range(3):
+            assert verifier.verify(make_token({"user_id": 7, "exp": FAR_FUTURE + offset})) is not None
+        assert len(verifier) == 2
+
+
+class TestRevocationList:
+    """Тесты для списка отозванных токенов"""
+
+    def test_revoked_token_rejected_from_cache(self):
+        """Отозванный токен отклоняется, даже если он уже в кеше"""
+        revocations = RevocationList()
+        verifier = TokenVerifier(max_size=10, revocations=revocations)
+        token = make_token({"user_id": 7, "jti": "abc", "exp": FAR_FUTURE})
+        assert verifier.verify(token) is not None
+        revocations.add("abc", FAR_FUTURE)
+        assert verifier.verify(token) is None
+
+    def test_revocation_buckets_expire(self):
+        """Отзывы удаляются корзинами после истечения срока токенов"""
+        now = [0.0]
+        revocations = RevocationList(bucket_seconds=60, clock=lambda: now[0])
+        revocations.add("a", 30)
+        revocations.add("b", 100)
+        now[0] = 60
+        revocations.prune()
+        assert not revocations.is_revoked("a")
+        assert revocations.is_revoked("b")
+
+    def test_expired_buckets_purged_on_add(self):
+        """Добавление удаляет истекшие корзины, уже истекший токен не хранится"""
+        now = [0.0]
+        revocations = RevocationList(bucket_seconds=60, clock=lambda: now[0])
+        revocations.add("a", 30)
+        revocations.add("b", 90)
+        assert len(revocations) == 2
+
+        now[0] = 120
+        revocations.add("c", 100)
+        revocations.add("d", 200)
+        assert len(revocations) == 1
+        assert not revocations.is_revoked("a")
+        assert not revocations.is_revoked("b")
+        assert not revocations.is_revoked("c")
+        assert revocations.is_revoked("d")
+
+    def test_sync_loads_revocations_from_database(self, db_session):
+        """Отзыв в другом процессе попадает в список при загрузке из базы данных"""
+        now = datetime.utcnow()
+        db_session.add_all([
+            RevokedToken(jti="active", user_id=1, expires_at=now + timedelta(hours=1), revoked_at=now),
+            RevokedToken(jti="expired", user_id=1, expires_at=now - timedelta(hours=1), revoked_at=now),
+        ])
+        db_session.commit()
+
+        revocations = RevocationList()
+        assert revocations.sync(db_session) == 1
+        assert revocations.is_revoked("active")
+        assert not revocations.is_revoked("expired")
+
+        # Повторная загрузка подхватывает новые записи
+        db_session.add(RevokedToken(
+            jti="later", user_id=2, expires_at=now + timedelta(hours=1), revoked_at=datetime.utcnow()
+        ))
+        db_session.commit()
+        revocations.sync(db_session)
+        assert revocations.is_revoked("later")
+
+    def test_revoke_token_writes_database_and_list(self, db_session):
+        """Отзыв записывается в базу данных и сразу действует в процессе"""
+        revocations = RevocationList()
+        assert revoke_token(db_session, {"jti": "abc", "user_id": 7, "exp": FAR_FUTURE}, revocations)
+        db_session.commit()
+        assert revocations.is_revoked("abc")
+        assert db_session.get(RevokedToken, "abc").user_id == 7
+
+        # Токен без jti отозвать нельзя
+        assert not revoke_token(db_session, {"user_id": 7, "exp": FAR_FUTURE}, revocations)
+
+
+class TestUserDependencies:
+    """Тесты для FastAPI dependencies с ID пользователя"""
+
+    def setup_method(self):
+        app = FastAPI()
+
+        @app.get("/optional")
+        def optional(user_id=Depends(get_optional_user_id)):
+            return {"user_id": user_id}
+
+        @app.get("/required")
+        def required(user_id: int = Depends(get_current_user_id)):
+            return {"user_id": user_id}
+
+        self.client = TestClient(app)
+
+    def auth(self, claims: dict) -> dict:
+        return {"Authorization": f"Bearer {make_token(claims)}"}
+
+    def test_user_id_from_token(self):
+        """ID пользователя берется из токена"""
+        headers = self.auth({"user_id": 7, "exp": FAR_FUTURE})
+        assert self.client.get("/optional", headers=headers).json() == {"user_id": 7}
+        assert self.client.get("/required", headers=headers).json() == {"user_id": 7}
+
+    def test_missing_token(self):
+        """Без токена ID необязателен, но обязательный эндпоинт отвечает 401"""
+        assert self.client.get("/optional").json() == {"user_id": None}
+        response = self.client.get("/required")
+        assert response.status_code == 401
+        assert response.headers["WWW-Authenticate"] == "Bearer"
+
+    def test_token_without_user_id_rejected(self):
+        """Токен без ID пользователя (старый формат) отклоняется"""
+        headers = self.auth({"sub": "user@example.com", "exp": FAR_FUTURE})
+        assert self.client.get("/optional", headers=headers).status_code == 401
+        assert self.client.get("/required", headers=headers).status_code == 401
+
+    def test_invalid_token_rejected(self):
+        """Переданный недействительный токен отклоняется даже для необязательного ID"""
+        headers = {"Authorization": "Bearer not-a-token"}
+        assert self.client.get("/optional", headers=headers).status_code == 401
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])